@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Parity and throughput of the exported CLIP CPU backends against eager ViTB32Infer.
+
+Embeds the same images with eager PyTorch and with ViTB32CpuInfer (ONNX Runtime
+and/or TorchScript), checks that the embeddings agree, and reports images/sec.
+Exits non-zero if any backend drifts past --atol or below --min-cosine.
+
+Usage:
+    python benchmark_clip_backends.py [image_dir] [--backends onnx torchscript] [--threads 4]
+                                      [--batch-size 32] [--repeats 3]
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import torch
+from PIL import Image
+from models.ViTB32Infer import ViTB32Infer
+from models.ViTB32CpuInfer import ViTB32CpuInfer
+
+
+def load_images(image_dir, count):
+    if image_dir:
+        paths = sorted(
+            os.path.join(image_dir, f) for f in os.listdir(image_dir)
+            if f.lower().endswith((".png", ".jpg", ".jpeg", ".webp"))
+        )
+        return [Image.open(p).convert("RGB") for p in paths[:count]]
+    rng = np.random.default_rng(0)
+    return [Image.fromarray(rng.integers(0, 256, (160, 160, 3), dtype=np.uint8)) for _ in range(count)]
+
+
+def throughput(embedder, images, batch_size, repeats):
+    embedder.encode_images(images[:batch_size], batch_size=batch_size)  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        embs = embedder.encode_images(images, batch_size=batch_size)
+    return embs, repeats * len(images) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare exported CLIP CPU backends to eager PyTorch.")
+    parser.add_argument("image_dir", nargs="?", help="Directory of images (random images if omitted)")
+    parser.add_argument("--model", default="openai/clip-vit-base-patch32")
+    parser.add_argument("--backends", nargs="+", default=["onnx", "torchscript"])
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--count", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--atol", type=float, default=1e-3)
+    parser.add_argument("--min-cosine", type=float, default=0.9999)
+    args = parser.parse_args()
+
+    images = load_images(args.image_dir, args.count)
+    if not images:
+        print("Error: no images found", file=sys.stderr)
+        sys.exit(1)
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    reference, eager_ips = throughput(ViTB32Infer(args.model, device="cpu"), images, args.batch_size, args.repeats)
+    print(f"{'backend':>12} {'img/s':>8} {'speedup':>8} {'max|diff|':>10} {'min cos':>8}")
+    print(f"{'eager':>12} {eager_ips:>8.1f} {1.0:>8.2f} {0.0:>10.2e} {1.0:>8.5f}")
+
+    failed = False
+    for backend in args.backends:
+        embedder = ViTB32CpuInfer(args.model, device="cpu", backend=backend, intra_op_threads=args.threads)
+        embs, ips = throughput(embedder, images, args.batch_size, args.repeats)
+        max_diff = (embs - reference).abs().max().item()
+        min_cos = torch.nn.functional.cosine_similarity(embs, reference, dim=-1).min().item()
+        failed |= max_diff > args.atol or min_cos < args.min_cosine
+        print(f"{backend:>12} {ips:>8.1f} {ips / eager_ips:>8.2f} {max_diff:>10.2e} {min_cos:>8.5f}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
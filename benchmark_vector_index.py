@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Recall@k and latency of the approximate swatch vector indexes against exact search.
+
+References are the rows of a swatch index (embeddings.npy) augmented with noisy,
+re-normalised copies up to --size vectors (random unit vectors if no index is
+given); queries are noisy copies of random references.
+
+Usage:
+    python benchmark_vector_index.py [embeddings.npy] [--size 50000] [--queries 256] [--k 10]
+                                     [--nlist 256] [--nprobe 1 4 8 16 32] [--pq-m 0 32 64]
+"""
+import time
+import argparse
+import numpy as np
+from src.helpers.ExactVectorIndex import ExactVectorIndex
+from src.helpers.IVFVectorIndex import IVFVectorIndex
+
+
+def unit(x):
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype(np.float32)
+
+
+def make_references(path, size, dim, noise, rng):
+    if path:
+        seeds = np.load(path).astype(np.float32)
+        if len(seeds) > size:
+            seeds = seeds[np.sort(rng.choice(len(seeds), size, replace=False))]
+    else:
+        seeds = rng.standard_normal((max(size // 100, 1), dim)).astype(np.float32)
+    picks = seeds[rng.integers(0, len(seeds), max(size - len(seeds), 0))]
+    augmented = unit(picks) + noise * rng.standard_normal(picks.shape).astype(np.float32)
+    return unit(np.concatenate([seeds, augmented]))
+
+
+def timed_search(index, queries, k):
+    start = time.perf_counter()
+    scores, ids = index.search(queries, k)
+    return ids, (time.perf_counter() - start) * 1000.0 / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark exact vs IVF / IVF-PQ swatch search.")
+    parser.add_argument("embeddings", nargs="?", help="embeddings.npy of a swatch index (random if omitted)")
+    parser.add_argument("--size", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=512, help="Dimension of random references")
+    parser.add_argument("--queries", type=int, default=256)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--noise", type=float, default=0.05)
+    parser.add_argument("--nlist", type=int, default=256)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--pq-m", type=int, nargs="+", default=[0, 32, 64], help="0 = no PQ")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    refs = make_references(args.embeddings, args.size, args.dim, args.noise, rng)
+    queries = unit(refs[rng.integers(0, len(refs), args.queries)]
+                   + args.noise * rng.standard_normal((args.queries, refs.shape[1])).astype(np.float32))
+    print(f"{len(refs)} references x {refs.shape[1]} dims, {len(queries)} queries, k={args.k}")
+
+    exact = ExactVectorIndex().build(refs)
+    truth, exact_ms = timed_search(exact, queries, args.k)
+    print(f"{'index':>16} {'nprobe':>6} {'recall@k':>9} {'recall@1':>9} {'ms/query':>9} {'MB':>8} {'build s':>8}")
+    print(f"{'exact':>16} {'-':>6} {1.0:>9.3f} {1.0:>9.3f} {exact_ms:>9.3f} {exact.memory_bytes() / 2**20:>8.1f} {'-':>8}")
+
+    for pq_m in args.pq_m:
+        start = time.perf_counter()
+        index = IVFVectorIndex(nlist=args.nlist, pq_m=pq_m or None, seed=args.seed).build(refs)
+        build_s = time.perf_counter() - start
+        name = f"ivf{args.nlist}" + (f"-pq{pq_m}" if pq_m else "")
+        for nprobe in args.nprobe:
+            index.nprobe = nprobe
+            ids, ms = timed_search(index, queries, args.k)
+            recall = np.mean([len(set(a) & set(b)) / args.k for a, b in zip(ids, truth)])
+            recall_1 = np.mean(ids[:, 0] == truth[:, 0])
+            print(f"{name:>16} {nprobe:>6} {recall:>9.3f} {recall_1:>9.3f} {ms:>9.3f} "
+                  f"{index.memory_bytes() / 2**20:>8.1f} {build_s:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
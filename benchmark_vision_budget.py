@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Latency / accuracy trade-off of the Qwen vision-token budget in SwatchMatchGenerator.
+
+The labels file is a YAML mapping of portrait path -> expected swatch name:
+
+    /path/to/portrait_1.png: light golden brown
+    /path/to/portrait_2.png: jet black
+
+Usage:
+    python benchmark_vision_budget.py labels.yml [--sizes 112 224 336 512] [--resample lanczos bilinear]
+"""
+import sys
+import time
+import argparse
+import yaml
+from src.SwatchMatchGenerator import SwatchMatchGenerator
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Qwen vision resolution settings.")
+    parser.add_argument("labels", help="YAML mapping of portrait path -> expected swatch name")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[112, 224, 336, 512])
+    parser.add_argument("--resample", nargs="+", default=["lanczos", "bilinear"])
+    args = parser.parse_args()
+
+    with open(args.labels, "r") as f:
+        labels = yaml.safe_load(f) or {}
+    if not labels:
+        print("Error: labels file is empty", file=sys.stderr)
+        sys.exit(1)
+
+    generator = SwatchMatchGenerator()
+    tokens_for = getattr(generator.vlm_model, "visual_tokens_for", None)
+
+    print(f"{'size':>6} {'resample':>9} {'tokens':>7} {'s/image':>8} {'accuracy':>9}")
+    for size in args.sizes:
+        for resample in args.resample:
+            generator.vision_kwargs = {"image_size": size, "resample": resample}
+            correct, elapsed = 0, 0.0
+            for image_path, expected in labels.items():
+                start = time.perf_counter()
+                try:
+                    predicted = generator.match(image_path)
+                except ValueError:
+                    predicted = None
+                elapsed += time.perf_counter() - start
+                correct += int(predicted == expected)
+            tokens = tokens_for(size) if tokens_for else "-"
+            print(f"{size:>6} {resample:>9} {tokens:>7} {elapsed / len(labels):>8.3f} {correct / len(labels):>9.2%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Prebuild the persistent swatch embedding index used by SwatchMatcher, e.g. at
+image-build time, so that process startup only memory-maps it.
+
+With `embedding_mode: multi_vector` (or --multi-vector) the MaxSim index for
+multi-vector embedders such as ColPaliInfer is built instead.
+
+Usage:
+    python build_swatch_index.py [--swatch-path DIR] [--index-dir DIR] [--device cpu] [--multi-vector]
+"""
+import os
+import sys
+import argparse
+import torch
+from config.loader import settings
+from models import ModelManager
+from src.helpers.SwatchEmbeddingIndex import SwatchEmbeddingIndex
+from src.helpers.MultiVectorSwatchIndex import MultiVectorSwatchIndex
+
+
+def main():
+    cfg = settings.get("swatch_matcher", {}).get("args", {})
+
+    parser = argparse.ArgumentParser(description="Build or refresh the swatch embedding index.")
+    parser.add_argument("--swatch-path", default=cfg.get("swatch_path"), help="Directory of swatch images")
+    parser.add_argument("--index-dir", default=None, help="Output index directory")
+    parser.add_argument("--embedder", default=cfg.get("embedding_candidate"), help="Embedding model class name")
+    parser.add_argument("--device", default=cfg.get("device", "cpu"), help="Device to encode on")
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--multi-vector", action="store_true",
+                        default=cfg.get("embedding_mode", "pooled") == "multi_vector",
+                        help="Build the multi-vector (MaxSim) index")
+    args = parser.parse_args()
+    if args.multi_vector:
+        args.index_dir = args.index_dir or cfg.get("multi_vector_index_dir")
+        batch_size = args.batch_size or cfg.get("multi_vector_batch_size", 4)
+    else:
+        args.index_dir = args.index_dir or cfg.get("embedding_index_dir")
+        batch_size = args.batch_size or cfg.get("patch_batch_size", 32)
+
+    if not args.swatch_path or not args.index_dir or not args.embedder:
+        print("Error: swatch path, index dir and embedder must be set via settings.yml or flags", file=sys.stderr)
+        sys.exit(1)
+
+    ModelManager.initialize_models(device=torch.device(args.device), model_classes=[args.embedder])
+    embedder = getattr(ModelManager, args.embedder)
+
+    index_dir = os.path.join(os.environ.get("PROJECT_ROOT", "."), args.index_dir)
+    if args.multi_vector:
+        index = MultiVectorSwatchIndex(index_dir, embedder, batch_size=batch_size).load(args.swatch_path)
+        count = len(index.swatch_names)
+    else:
+        count = len(SwatchEmbeddingIndex(index_dir, embedder, batch_size=batch_size).load(args.swatch_path))
+
+    print(f"Swatch index with {count} entries written to {index_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Fits swatch_match_generator.args.scoring_temperature so that the probabilities
+of SwatchMatchGenerator.score() (likelihood_scoring) are calibrated.
+
+The labels file is a YAML mapping of portrait path -> expected swatch name:
+
+    /path/to/portrait_1.png: light golden brown
+    /path/to/portrait_2.png: jet black
+
+Prints the fitted temperature and the negative log-likelihood before / after;
+copy the temperature into settings.yml. Use portraits that were not used to
+tune anything else.
+
+Usage:
+    python calibrate_scoring_temperature.py labels.yml
+"""
+import sys
+import argparse
+import yaml
+from src.SwatchMatchGenerator import SwatchMatchGenerator
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit the likelihood-scoring temperature.")
+    parser.add_argument("labels", help="YAML mapping of portrait path -> expected swatch name")
+    args = parser.parse_args()
+
+    with open(args.labels, "r") as f:
+        labels = yaml.safe_load(f) or {}
+    if not labels:
+        print("Error: labels file is empty", file=sys.stderr)
+        sys.exit(1)
+
+    generator = SwatchMatchGenerator()
+    fit = generator.fit_scoring_temperature(labels)
+    print(f"scoring_temperature: {fit['temperature']:.4f}")
+    print(f"NLL at T=1: {fit['nll_before']:.4f}   NLL fitted: {fit['nll_after']:.4f}")
+
+
+if __name__ == "__main__":
+    main()
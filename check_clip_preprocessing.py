@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Numerical parity of ClipTensorPreprocessor / encode_array against CLIPProcessor.
+
+Cuts patches from an image (random pixels if none is given), preprocesses them
+both ways and compares pixel_values and the resulting CLIP embeddings, then
+times both paths. Exits non-zero when any pixel value differs by more than
+--max-grey-levels (after undoing the normalisation) or any patch embedding
+falls below --min-cosine against the CLIPProcessor one.
+
+This is a manual check, not an automated test: it downloads the CLIP weights
+on first run. Run it after touching ClipTensorPreprocessor or upgrading
+transformers / Pillow.
+
+Usage:
+    python check_clip_preprocessing.py [image] [--patch 64] [--stride 32] [--batch-size 32]
+"""
+import sys
+import time
+import argparse
+import numpy as np
+import torch
+from PIL import Image
+from models.ViTB32Infer import ViTB32Infer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare tensor preprocessing with CLIPProcessor.")
+    parser.add_argument("image", nargs="?", help="Image to cut patches from (random pixels if omitted)")
+    parser.add_argument("--model", default="openai/clip-vit-base-patch32")
+    parser.add_argument("--patch", type=int, default=64)
+    parser.add_argument("--stride", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--max-grey-levels", type=float, default=1.0,
+                        help="Largest allowed per-pixel difference, in uint8 grey levels")
+    parser.add_argument("--min-cosine", type=float, default=0.9999,
+                        help="Smallest allowed per-patch embedding cosine")
+    args = parser.parse_args()
+
+    if args.image:
+        rgb = np.asarray(Image.open(args.image).convert("RGB"))
+    else:
+        rgb = np.random.default_rng(0).integers(0, 256, (256, 256, 3), dtype=np.uint8)
+
+    windows = np.lib.stride_tricks.sliding_window_view(rgb, (args.patch, args.patch), axis=(0, 1))
+    patches = windows[::args.stride, ::args.stride].reshape(-1, 3, args.patch, args.patch)
+    pil_patches = [Image.fromarray(np.ascontiguousarray(p.transpose(1, 2, 0))) for p in patches]
+    print(f"{len(pil_patches)} patches of {args.patch}px")
+
+    embedder = ViTB32Infer(args.model, device="cpu")
+    reference_pixels = embedder.processor(images=pil_patches, return_tensors="pt").pixel_values
+    tensor_pixels = embedder.tensor_preprocessor(patches, channels_last=False)
+    pixel_diff = (tensor_pixels - reference_pixels).abs()
+    # One grey level is rescale_factor / std in normalised units; use the smallest std (largest step)
+    image_processor = embedder.processor.image_processor
+    pixel_atol = args.max_grey_levels * image_processor.rescale_factor / min(image_processor.image_std) + 1e-5
+    max_diff = pixel_diff.max().item()
+    print(f"pixel_values  max|diff| {max_diff:.4f} (tolerance {pixel_atol:.4f})  "
+          f"mean|diff| {pixel_diff.mean().item():.5f}")
+
+    start = time.perf_counter()
+    reference = embedder.encode_images(pil_patches, batch_size=args.batch_size)
+    processor_s = time.perf_counter() - start
+    start = time.perf_counter()
+    embs = embedder.encode_array(patches, batch_size=args.batch_size, channels_last=False)
+    tensor_s = time.perf_counter() - start
+
+    cosines = torch.nn.functional.cosine_similarity(embs, reference, dim=-1)
+    min_cos = cosines.min().item()
+    print(f"embeddings    min cosine {min_cos:.6f} (tolerance {args.min_cosine})  "
+          f"patches below {int((cosines < args.min_cosine).sum())}/{len(cosines)}")
+    print(f"CLIPProcessor {processor_s:.3f}s   tensor path {tensor_s:.3f}s   speedup {processor_s / tensor_s:.2f}x")
+
+    ok = max_diff <= pixel_atol and min_cos >= args.min_cosine
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
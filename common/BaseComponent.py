@@ -26,8 +26,15 @@ class BaseComponent(ABC):
         self.config = config or {}
         self.logger.debug(f"{self.__class__.__name__} init with {self.config!r}")
 
-        self.project_root = os.environ.get("PROJECT_ROOT")
-        if not self.project_root:
-            raise EnvironmentError("PROJECT_ROOT environment variable is not set.")
+        project_root = os.environ.get("PROJECT_ROOT")
+        if project_root:
+            self.logger.info(f"Project Root: {project_root}")
 
-        self.logger.info(f"Project Root: {self.project_root}")
\ No newline at end of file
+    @property
+    def project_root(self) -> str:
+        # Resolved on use, so components that never touch the filesystem
+        # (indexes, quantisers, ...) can be built without PROJECT_ROOT.
+        project_root = os.environ.get("PROJECT_ROOT")
+        if not project_root:
+            raise EnvironmentError("PROJECT_ROOT environment variable is not set.")
+        return project_root
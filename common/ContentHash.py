@@ -0,0 +1,17 @@
+import hashlib
+
+
+class ContentHash:
+    """
+    Content hashes used to detect added or changed files (swatch indexes,
+    swatch labels). Standard library only, so importing it stays cheap.
+    """
+
+    @staticmethod
+    def file_sha256(path) -> str:
+        """SHA-256 of the file's bytes."""
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
@@ -0,0 +1,41 @@
+import sys
+import importlib
+from types import ModuleType
+from typing import Dict
+
+
+class LazyModule(ModuleType):
+    """
+    Package module whose exported names are imported from their submodule on
+    first attribute access, instead of eagerly in the package's __init__.
+    """
+
+    def __getattr__(self, name):
+        target = self._lazy_exports.get(name)
+        if target is None:
+            raise AttributeError(f"module {self.__name__!r} has no attribute {name!r}")
+        value = getattr(importlib.import_module(target), name)
+        # Cache so later lookups are plain attribute hits
+        self.__dict__[name] = value
+        return value
+
+    def __setattr__(self, name, value):
+        # Loading `pkg.Foo` makes the import system bind the submodule as `pkg.Foo`,
+        # which would shadow the lazily exported class `Foo` of the same name.
+        if isinstance(value, ModuleType) and name in self.__dict__.get("_lazy_exports", {}):
+            return
+        super().__setattr__(name, value)
+
+    def __dir__(self):
+        return sorted(set(super().__dir__()) | set(self._lazy_exports))
+
+
+def lazy_exports(module_name: str, exports: Dict[str, str]):
+    """
+    Turn `module_name` into a LazyModule exporting `exports` ({name: submodule}).
+    Call it from the package's __init__ with `__name__`.
+    """
+    module = sys.modules[module_name]
+    module._lazy_exports = dict(exports)
+    module.__all__ = list(exports)
+    module.__class__ = LazyModule
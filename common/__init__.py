@@ -1,6 +1,8 @@
 from common.BaseComponent import BaseComponent
 from common.CallableComponent import CallableComponent
 from common.DirtyJsonParser import DirtyJsonParser
+from common.ContentHash import ContentHash
 from common.InferenceVLComponent import InferenceVLComponent
 from common.InferenceImageEmbeddingComponent import InferenceImageEmbeddingComponent
-from common.InferenceVisionComponent import InferenceVisionComponent
\ No newline at end of file
+from common.InferenceVisionComponent import InferenceVisionComponent
+from common.LazyModule import LazyModule, lazy_exports
\ No newline at end of file
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Report what each entry point loads at import time.
+
+Every entry point is imported in a fresh interpreter, recording wall time,
+peak RSS and which heavy third-party packages ended up in sys.modules.
+
+Usage:
+    python import_report.py [EntryPoint ...]
+"""
+import sys
+import json
+import argparse
+import subprocess
+
+ENTRY_POINTS = {
+    "HairMatchGeneratorCV": "src",
+    "SwatchMatcher": "src",
+    "SwatchMatchGenerator": "src",
+    "ModelManager": "models",
+}
+HEAVY_MODULES = ["torch", "transformers", "mediapipe", "cv2", "Levenshtein", "qwen_vl_utils", "colpali_engine"]
+
+PROBE = """
+import sys, json, time, resource, importlib
+start = time.perf_counter()
+getattr(importlib.import_module({package!r}), {name!r})
+elapsed = time.perf_counter() - start
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+rss_mb = rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+print(json.dumps({{
+    "seconds": elapsed,
+    "peak_rss_mb": rss_mb,
+    "modules": len(sys.modules),
+    "heavy": [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+
+def probe(name: str, package: str) -> dict:
+    code = PROBE.format(package=package, name=name, heavy=HEAVY_MODULES)
+    proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "failed"}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time report per entry point.")
+    parser.add_argument("entry_points", nargs="*", default=list(ENTRY_POINTS))
+    args = parser.parse_args()
+
+    print(f"{'entry point':<22} {'seconds':>8} {'rss MB':>8} {'modules':>8}  heavy packages")
+    for name in args.entry_points:
+        result = probe(name, ENTRY_POINTS.get(name, "src"))
+        if "error" in result:
+            print(f"{name:<22} error: {result['error']}")
+            continue
+        print(
+            f"{name:<22} {result['seconds']:>8.2f} {result['peak_rss_mb']:>8.0f} "
+            f"{result['modules']:>8}  {', '.join(result['heavy']) or '-'}"
+        )
+
+
+if __name__ == "__main__":
+    main()
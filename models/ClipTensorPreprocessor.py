@@ -0,0 +1,115 @@
+import torch
+import numpy as np
+from typing import Dict, Tuple, Union
+from common import BaseComponent
+
+
+class ClipTensorPreprocessor(BaseComponent):
+    """
+    Vectorised replacement for CLIPProcessor(images=...) on stacked uint8 batches.
+
+    Mirrors the processor's pipeline (shortest-edge bicubic resize, center crop,
+    rescale, normalise) as a handful of batched tensor ops, so patches cut from
+    a NumPy array never have to become PIL images.
+
+    The resize reproduces PIL's bicubic resampling rather than torch's: the
+    same kernel (a = -0.5), the same support widening when downscaling, a
+    horizontal then a vertical pass, and rounding to uint8 after each pass.
+    Each pass is one matmul with a precomputed (out, in) weight matrix. Pixel
+    values stay within about one grey level of CLIPProcessor's, the rounding
+    of PIL's fixed-point coefficients (see check_clip_preprocessing.py).
+    """
+    PIL_BICUBIC = 3
+    BICUBIC_A = -0.5
+    BICUBIC_SUPPORT = 2.0
+
+    def __init__(self, image_processor):
+        """
+        image_processor: the CLIPImageProcessor of the model (processor.image_processor)
+        """
+        resample = getattr(image_processor, "resample", self.PIL_BICUBIC)
+        if int(resample) != self.PIL_BICUBIC:
+            raise ValueError(f"Only bicubic resampling is supported, processor uses {resample!r}")
+        super().__init__()
+        size = image_processor.size
+        crop = image_processor.crop_size
+        self.shortest_edge = size["shortest_edge"] if "shortest_edge" in size else min(size["height"], size["width"])
+        self.crop_size = (crop["height"], crop["width"])
+        self.rescale_factor = image_processor.rescale_factor
+        self.mean = torch.tensor(image_processor.image_mean, dtype=torch.float32).view(1, 3, 1, 1)
+        self.std = torch.tensor(image_processor.image_std, dtype=torch.float32).view(1, 3, 1, 1)
+        self._weights: Dict[Tuple[int, int], torch.Tensor] = {}
+
+    def _resize_shape(self, h: int, w: int):
+        # Same rounding as transformers' get_resize_output_image_size(default_to_square=False)
+        short, long = (h, w) if h <= w else (w, h)
+        new_short, new_long = self.shortest_edge, int(self.shortest_edge * long / short)
+        return (new_short, new_long) if h <= w else (new_long, new_short)
+
+    @classmethod
+    def _bicubic(cls, x: np.ndarray) -> np.ndarray:
+        a = cls.BICUBIC_A
+        x = np.abs(x)
+        return np.where(
+            x < 1.0,
+            ((a + 2.0) * x - (a + 3.0)) * x * x + 1.0,
+            np.where(x < 2.0, (((x - 5.0) * x + 8.0) * x - 4.0) * a, 0.0),
+        )
+
+    def _resample_weights(self, in_size: int, out_size: int) -> torch.Tensor:
+        """(out_size, in_size) resampling matrix, built like PIL's precompute_coeffs()."""
+        key = (in_size, out_size)
+        if key not in self._weights:
+            scale = in_size / out_size
+            filterscale = max(scale, 1.0)
+            support = self.BICUBIC_SUPPORT * filterscale
+            weights = np.zeros((out_size, in_size), dtype=np.float64)
+            for i in range(out_size):
+                center = (i + 0.5) * scale
+                lo = max(int(center - support + 0.5), 0)
+                hi = min(int(center + support + 0.5), in_size)
+                k = self._bicubic((np.arange(lo, hi) - center + 0.5) / filterscale)
+                total = k.sum()
+                weights[i, lo:hi] = k / total if total != 0.0 else k
+            self._weights[key] = torch.from_numpy(weights).float()
+        return self._weights[key]
+
+    def _resize(self, batch: torch.Tensor, new_h: int, new_w: int) -> torch.Tensor:
+        """PIL-equivalent bicubic resize of a float (N, 3, H, W) batch holding uint8 values."""
+        h, w = batch.shape[-2:]
+        if new_w != w:
+            weights = self._resample_weights(w, new_w).to(batch.device)
+            batch = torch.floor(batch @ weights.T + 0.5).clamp_(0, 255)
+        if new_h != h:
+            weights = self._resample_weights(h, new_h).to(batch.device)
+            batch = torch.floor(weights @ batch + 0.5).clamp_(0, 255)
+        return batch
+
+    def __call__(
+        self,
+        images: Union[np.ndarray, torch.Tensor],
+        channels_last: bool = True,
+        device: Union[str, torch.device] = "cpu"
+    ) -> torch.Tensor:
+        """
+        images: uint8 batch shaped (N, H, W, 3), or (N, 3, H, W) with channels_last=False
+        Returns float32 pixel_values (N, 3, crop_h, crop_w) on `device`.
+        """
+        batch = torch.as_tensor(images).to(device)
+        if batch.ndim != 4:
+            raise ValueError(f"Expected a 4-D image batch, got shape {tuple(batch.shape)}")
+        if channels_last:
+            batch = batch.permute(0, 3, 1, 2)
+        batch = batch.float()
+
+        h, w = batch.shape[-2:]
+        new_h, new_w = self._resize_shape(h, w)
+        batch = self._resize(batch, new_h, new_w)
+
+        # Same offsets as transformers' center_crop()
+        crop_h, crop_w = self.crop_size
+        top, left = (new_h - crop_h) // 2, (new_w - crop_w) // 2
+        batch = batch[:, :, max(top, 0):max(top, 0) + crop_h, max(left, 0):max(left, 0) + crop_w]
+
+        mean, std = self.mean.to(batch.device), self.std.to(batch.device)
+        return (batch * self.rescale_factor - mean) / std
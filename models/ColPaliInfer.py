@@ -1,24 +1,41 @@
 import json
 import torch
+import numpy as np
 from transformers import PretrainedConfig
 from colpali_engine.models import ColQwen2, ColQwen2Processor
 from common import InferenceVLComponent, InferenceImageEmbeddingComponent
+from models.LoadingPolicy import LoadingPolicy
 from PIL import Image
 from io import BytesIO
+from typing import List, Union
 
 class ColPaliInfer(InferenceVLComponent, InferenceImageEmbeddingComponent):
     """
     Inference wrapper for ColQwen2 that ensures decoder_config is a proper config,
     and logs each step via the inherited logger.
+
+    A `loading_policy` (as built by ModelManager) takes precedence over
+    `torch_dtype` and decides memory-mapped loading and CPU int8 quantisation.
+
+    Embeddings are multi-vector: one 128-d vector per image / query token.
+    encode_image / encode_images / encode_texts return them as tensors (or
+    NumPy arrays) in `output_dtype`; infer() keeps the JSON serialisation for
+    API responses.
     """
+    OUTPUT_DTYPES = {"fp32": torch.float32, "fp16": torch.float16, "bf16": torch.bfloat16}
     def __init__(
         self,
         model_name="vidore/colqwen2-v0.1",
         device=None,
         torch_dtype=torch.bfloat16,
         device_map="auto",
+        loading_policy: LoadingPolicy = None,
+        output_dtype: str = "fp16",
     ):
         super().__init__()  # initializes self.logger, etc.
+        if output_dtype not in self.OUTPUT_DTYPES:
+            raise ValueError(f"Invalid output_dtype: {output_dtype}. Must be one of {list(self.OUTPUT_DTYPES)}.")
+        self.output_dtype = output_dtype
         device = "cpu" if not device else device
         self.logger.info(f"Initializing ColPaliInfer: model={model_name}, device={device}")
 
@@ -34,16 +51,20 @@ class ColPaliInfer(InferenceVLComponent, InferenceImageEmbeddingComponent):
 
         # 3) Load model with the corrected config
         self.logger.info("Loading ColQwen2 model from pretrained")
-        self.model = (
-            ColQwen2.from_pretrained(
-                model_name,
-                #config=config,
-                torch_dtype=torch_dtype,
-                device_map=device_map,
-            )
-            .eval()
-            .to(device)
-        )
+        if loading_policy is None:
+            pretrained_kwargs = {"torch_dtype": torch_dtype}
+        else:
+            pretrained_kwargs = loading_policy.pretrained_kwargs()
+            # Quantisation needs the whole model on the CPU first
+            if loading_policy.quantize_int8:
+                device_map = None
+        model = ColQwen2.from_pretrained(
+            model_name,
+            #config=config,
+            device_map=device_map,
+            **pretrained_kwargs,
+        ).eval()
+        self.model = loading_policy.finalize(model, device) if loading_policy else model.to(device)
         self.logger.info("Model loaded and moved to %s", device)
 
         # 4) Load processor
@@ -54,6 +75,20 @@ class ColPaliInfer(InferenceVLComponent, InferenceImageEmbeddingComponent):
         self.model_name = model_name
         self.logger.info("ColPaliInfer initialization complete")
 
+    def warmup(self):
+        """Embed a synthetic image once so the first request does not pay kernel setup."""
+        self.get_image_embedding(Image.new("RGB", (224, 224), (96, 64, 48)))
+
+    @staticmethod
+    def _load_image(image_data) -> Image.Image:
+        if isinstance(image_data, bytes):
+            return Image.open(BytesIO(image_data)).convert("RGB")
+        if isinstance(image_data, str):
+            return Image.open(image_data).convert("RGB")
+        if isinstance(image_data, Image.Image):
+            return image_data
+        raise TypeError(f"Unsupported image_data type: {type(image_data)}")
+
     def get_image_embedding(self, image: Image.Image) -> torch.Tensor:
         self.logger.debug("Generating image embedding")
         batch = self.processor.process_images([image])
@@ -72,35 +107,111 @@ class ColPaliInfer(InferenceVLComponent, InferenceImageEmbeddingComponent):
         self.logger.debug("Text embedding generated")
         return emb
 
-    def infer(self, image_data=None, prompt: str = None) -> str:
+    def _unpad(self, emb: torch.Tensor, attention_mask: torch.Tensor, as_numpy: bool) -> list:
+        """
+        Splits a padded (B, L, D) batch into per-item (n_i, D) embeddings in
+        `output_dtype`, dropping padding positions.
+        """
+        dtype = self.OUTPUT_DTYPES[self.output_dtype]
+        if as_numpy and dtype == torch.bfloat16:
+            raise ValueError("NumPy has no bfloat16; use output_dtype fp16/fp32 or as_numpy=False")
+        emb = emb.to(dtype)
+        if as_numpy:
+            emb = emb.cpu()
+        mask = attention_mask.to(emb.device).bool()
+        items = []
+        for row, row_mask in zip(emb, mask):
+            # Processors pad on one side, so the kept positions are a contiguous slice
+            # and the NumPy array is a view of the batch buffer.
+            idx = row_mask.nonzero().flatten()
+            vectors = row[int(idx[0]):int(idx[-1]) + 1] if idx.numel() else row[:0]
+            items.append(vectors.numpy() if as_numpy else vectors)
+        return items
+
+    def _encode_batches(self, batches, as_numpy: bool) -> list:
+        embs = []
+        for batch in batches:
+            batch = {k: v.to(self.device) for k, v in batch.items()}
+            with torch.no_grad():
+                emb = self.model(**batch)
+            embs.extend(self._unpad(emb, batch["attention_mask"], as_numpy))
+        return embs
+
+    def encode_image(self, image_data=None, as_numpy: bool = False) -> Union[torch.Tensor, np.ndarray]:
+        """
+        Multi-vector embedding of one image (bytes, file path or PIL image):
+        an (n_tokens, D) tensor in `output_dtype`, or a NumPy array with as_numpy=True.
+        """
+        return self.encode_images([self._load_image(image_data)], as_numpy=as_numpy)[0]
+
+    def encode_images(
+        self,
+        images: List[Image.Image],
+        batch_size: int = 4,
+        as_numpy: bool = False
+    ) -> List[Union[torch.Tensor, np.ndarray]]:
+        """
+        Embeds images `batch_size` at a time. Returns one (n_tokens_i, D)
+        embedding per image, in input order; token counts differ per image.
+        """
+        if not images:
+            raise ValueError("encode_images() needs at least one image")
+        self.logger.debug(f"Encoding {len(images)} images in batches of {batch_size}")
+        images = [self._load_image(image) for image in images]
+        batches = (
+            self.processor.process_images(images[start:start + batch_size])
+            for start in range(0, len(images), batch_size)
+        )
+        return self._encode_batches(batches, as_numpy)
+
+    def encode_texts(
+        self,
+        texts: List[str],
+        batch_size: int = 32,
+        as_numpy: bool = False
+    ) -> List[Union[torch.Tensor, np.ndarray]]:
+        """
+        Embeds queries `batch_size` at a time. Returns one (n_tokens_i, D)
+        embedding per text, in input order.
+        """
+        if not texts:
+            raise ValueError("encode_texts() needs at least one text")
+        self.logger.debug(f"Encoding {len(texts)} texts in batches of {batch_size}")
+        batches = (
+            self.processor.process_queries(texts[start:start + batch_size])
+            for start in range(0, len(texts), batch_size)
+        )
+        return self._encode_batches(batches, as_numpy)
+
+    @staticmethod
+    def to_json(emb: Union[torch.Tensor, np.ndarray]) -> str:
+        """Serialise an embedding as a JSON list of lists, for API responses."""
+        if isinstance(emb, torch.Tensor):
+            emb = emb.float().cpu().numpy()
+        return json.dumps(np.asarray(emb, dtype=np.float32).tolist())
+
+    def infer(self, image_data=None, prompt: str = None, as_json: bool = True) -> Union[str, torch.Tensor]:
         """
         Run inference on the provided inputs:
           - If image_data is given, returns its embedding.
           - If prompt is given, returns its embedding.
         Exactly one of image_data or prompt must be provided.
+        The (n_tokens, D) embedding is serialised to JSON for API responses;
+        pass as_json=False (or use encode_image / encode_texts) to get the tensor.
         """
         if image_data is not None and prompt is None:
             self.logger.info("Running inference on image_data")
-            # Normalize to PIL Image
-            if isinstance(image_data, bytes):
-                image = Image.open(BytesIO(image_data)).convert("RGB")
-            elif isinstance(image_data, str):
-                image = Image.open(image_data).convert("RGB")
-            elif isinstance(image_data, Image.Image):
-                image = image_data
-            else:
-                raise TypeError(f"Unsupported image_data type: {type(image_data)}")
-            emb = self.get_image_embedding(image)
+            emb = self.encode_image(image_data)
 
         elif prompt is not None and image_data is None:
             self.logger.info("Running inference on prompt")
-            emb = self.get_text_embedding(prompt)
+            emb = self.encode_texts([prompt])[0]
 
         else:
             raise ValueError("Provide exactly one of 'image_data' or 'prompt' to infer()")
 
-        # Convert tensor to list and serialize as JSON
-        emb_list = emb.squeeze().cpu().tolist()
-        result = json.dumps(emb_list)
+        if not as_json:
+            return emb
+        result = self.to_json(emb)
         self.logger.debug("Inference result serialized to JSON")
-        return result
\ No newline at end of file
+        return result
@@ -2,11 +2,16 @@ import cv2
 import numpy as np
 from common import InferenceVisionComponent
 from PIL import Image
+from typing import Tuple, Union
 
 
 class HairSegmenter(InferenceVisionComponent):
     """
-    Segments the hair region from a portrait image and returns a binary mask as PIL Image.
+    Segments the hair region from a portrait image.
+
+    segment() returns the hair ROI (a view into the input pixels) and its
+    binary mask, which is what the CV matcher consumes; infer() keeps
+    returning the full-frame binary mask as a PIL Image.
     """
 
     def __init__(self, haar_path=None):
@@ -14,10 +19,16 @@ class HairSegmenter(InferenceVisionComponent):
             haar_path = cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
         self.face_cascade = cv2.CascadeClassifier(haar_path)
 
-    def infer(self, image_data: Image.Image) -> Image.Image:
-        # Convert PIL to OpenCV BGR
-        image = cv2.cvtColor(np.array(image_data), cv2.COLOR_RGB2BGR)
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    def segment(self, image_data: Union[Image.Image, np.ndarray]) -> Tuple[np.ndarray, np.ndarray, Tuple[int, int, int, int]]:
+        """
+        Returns (roi, mask, box):
+          - roi: (h, w, 3) uint8 RGB view of the hair region, no pixels copied
+          - mask: (h, w) uint8, 255 on hair pixels of the ROI
+          - box: (x1, y1, x2, y2) of the ROI in the input image
+        Raises ValueError when no face is detected.
+        """
+        image = np.asarray(image_data.convert("RGB") if isinstance(image_data, Image.Image) else image_data)
+        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
 
         # Detect faces
         faces = self.face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5)
@@ -35,7 +46,7 @@ class HairSegmenter(InferenceVisionComponent):
         hair_roi = image[hair_y1:hair_y2, hair_x1:hair_x2]
 
         # HSV thresholding
-        hsv = cv2.cvtColor(hair_roi, cv2.COLOR_BGR2HSV)
+        hsv = cv2.cvtColor(hair_roi, cv2.COLOR_RGB2HSV)
         lower = np.array([0, 0, 0])
         upper = np.array([180, 255, 100])
         mask_roi = cv2.inRange(hsv, lower, upper)
@@ -45,9 +56,15 @@ class HairSegmenter(InferenceVisionComponent):
         mask_roi = cv2.morphologyEx(mask_roi, cv2.MORPH_CLOSE, kernel)
         mask_roi = cv2.morphologyEx(mask_roi, cv2.MORPH_OPEN, kernel)
 
+        return hair_roi, mask_roi, (hair_x1, hair_y1, hair_x2, hair_y2)
+
+    def infer(self, image_data: Image.Image) -> Image.Image:
+        image = np.asarray(image_data.convert("RGB"))
+        _, mask_roi, (x1, y1, x2, y2) = self.segment(image)
+
         # Embed into full-size mask
         full_mask = np.zeros(image.shape[:2], dtype=np.uint8)
-        full_mask[hair_y1:hair_y2, hair_x1:hair_x2] = mask_roi
+        full_mask[y1:y2, x1:x2] = mask_roi
 
         # Convert to PIL image
-        return Image.fromarray(full_mask)
\ No newline at end of file
+        return Image.fromarray(full_mask)
@@ -0,0 +1,69 @@
+import torch
+from typing import Any, Dict, Optional
+from common import BaseComponent
+
+
+class LoadingPolicy(BaseComponent):
+    """
+    How a model's weights are loaded, shared by every model ModelManager builds.
+
+    Resolved from `model_manager.general.loading`, overridden per model by
+    `model_manager.models.<ClassName>.loading`:
+      - dtype: "fp32" | "bf16" | "fp16"
+      - low_cpu_mem_usage: build the model on the meta device and memory-map
+        safetensors weights instead of materialising a second fp32 copy
+      - use_safetensors: force (true) / forbid (false) safetensors checkpoints
+      - quantize_int8: dynamic int8 quantisation of nn.Linear layers (CPU only,
+        implies fp32 weights)
+    """
+    DTYPES = {"fp32": torch.float32, "bf16": torch.bfloat16, "fp16": torch.float16}
+
+    def __init__(
+        self,
+        dtype: str = "fp32",
+        low_cpu_mem_usage: bool = True,
+        use_safetensors: Optional[bool] = None,
+        quantize_int8: bool = False,
+    ):
+        if dtype not in self.DTYPES:
+            raise ValueError(f"Invalid dtype: {dtype}. Must be one of {list(self.DTYPES)}.")
+        if quantize_int8 and dtype != "fp32":
+            self.logger.warning(f"quantize_int8 needs fp32 weights; ignoring dtype={dtype}")
+            dtype = "fp32"
+        super().__init__()
+        self.dtype = dtype
+        self.low_cpu_mem_usage = low_cpu_mem_usage
+        self.use_safetensors = use_safetensors
+        self.quantize_int8 = quantize_int8
+
+    @classmethod
+    def from_config(cls, general: Dict[str, Any], model_cfg: Dict[str, Any]) -> "LoadingPolicy":
+        options = dict(general.get("loading", {}) or {})
+        options.update(model_cfg.get("loading", {}) or {})
+        return cls(**options)
+
+    @property
+    def torch_dtype(self) -> torch.dtype:
+        return self.DTYPES[self.dtype]
+
+    def pretrained_kwargs(self) -> Dict[str, Any]:
+        """Keyword arguments for transformers' from_pretrained()."""
+        kwargs = {"torch_dtype": self.torch_dtype, "low_cpu_mem_usage": self.low_cpu_mem_usage}
+        if self.use_safetensors is not None:
+            kwargs["use_safetensors"] = self.use_safetensors
+        return kwargs
+
+    def finalize(self, module: torch.nn.Module, device) -> torch.nn.Module:
+        """Apply post-load steps (int8 quantisation) and move `module` to `device`."""
+        if self.quantize_int8:
+            if torch.device(device).type != "cpu":
+                self.logger.warning(f"Dynamic int8 quantisation is CPU-only; skipping on {device}")
+            else:
+                module = torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8)
+        return module.to(device)
+
+    def __repr__(self) -> str:
+        return (
+            f"LoadingPolicy(dtype={self.dtype}, low_cpu_mem_usage={self.low_cpu_mem_usage}, "
+            f"use_safetensors={self.use_safetensors}, quantize_int8={self.quantize_int8})"
+        )
@@ -9,6 +9,10 @@ class MediapipeHairSegmenter(InferenceVisionComponent):
         super().__init__()
         self.segmentor = mp_solutions.selfie_segmentation.SelfieSegmentation(model_selection=1)
 
+    def warmup(self):
+        """Run the segmentation graph once on a synthetic frame."""
+        self.segmentor.process(np.full((256, 256, 3), 96, dtype=np.uint8))
+
     def infer(self, image: Image.Image) -> Image.Image:
         img_bgr = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
         result = self.segmentor.process(img_bgr)
@@ -20,4 +24,8 @@ class MediapipeHairSegmenter(InferenceVisionComponent):
         coords = cv2.findNonZero(gray)
         x, y, w, h = cv2.boundingRect(coords)
         cropped = segmented[y:y+h, x:x+w]
-        return Image.fromarray(cv2.cvtColor(cropped, cv2.COLOR_BGR2RGB))
\ No newline at end of file
+        # Keep the hair mask as alpha so downstream matchers can tell hair
+        # from background without re-thresholding the colours.
+        rgba = cv2.cvtColor(cropped, cv2.COLOR_BGR2RGBA)
+        rgba[:, :, 3] = mask[y:y+h, x:x+w].astype(np.uint8) * 255
+        return Image.fromarray(rgba)
\ No newline at end of file
@@ -1,7 +1,92 @@
+import gc
+import os
+import sys
+import time
+import json
 import torch
+import resource
 import importlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from common import BaseComponent
 from config.loader import settings
+from models.LoadingPolicy import LoadingPolicy
+
+
+def _peak_rss_mb() -> float:
+    """Peak resident set size of this process so far, in MB."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, KB on Linux
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def _rss_mb() -> float:
+    """Current resident set size of this process in MB (peak RSS if unavailable)."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return _peak_rss_mb()
+
+
+def _model_bytes(instance) -> int:
+    """Approximate bytes held by the torch parameters / buffers / tensors of a model wrapper."""
+    seen, total = set(), 0
+    for value in vars(instance).values():
+        if isinstance(value, torch.nn.Module):
+            tensors = list(value.parameters()) + list(value.buffers())
+        elif isinstance(value, torch.Tensor):
+            tensors = [value]
+        else:
+            continue
+        for t in tensors:
+            if id(t) not in seen:
+                seen.add(id(t))
+                total += t.numel() * t.element_size()
+    return total
+
+
+class _LazyModel:
+    """
+    Handle registered in place of a model instance. The model is constructed on
+    first attribute access and may later be evicted by ModelManager, in which case
+    the next access rebuilds it. Reports the wrapped model's class so isinstance()
+    and class-name lookups work without triggering a load.
+    """
+
+    def __init__(self, name, model_class, factory):
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_model_class", model_class)
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_instance", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    @property
+    def __class__(self):
+        return self._model_class
+
+    def _resolve(self):
+        # Read once: an eviction may clear _instance concurrently
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                instance = self._instance
+                if instance is None:
+                    instance = ModelManager._load_handle(self)
+        else:
+            ModelManager._touch(self._name)
+        return instance
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._resolve(), name, value)
+
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
+
 
 class ModelManager(BaseComponent):
     """
@@ -14,8 +99,118 @@ class ModelManager(BaseComponent):
       - <ClassName>_model_name_or_url
       - <ClassName>_api_endpoint
       - <ClassName>_api_token
+
+    How models are constructed is set by `general.loading_strategy`:
+      - "eager": one after another inside initialize_models() (default)
+      - "parallel": on a thread pool of `general.loading_workers` threads
+      - "lazy": on first attribute access of the registered instance
+    With `general.warmup: true` every model that defines warmup() runs it right
+    after construction. Per-model timings and memory deltas are collected in
+    `startup_report` (with "parallel" the RSS deltas of concurrent loads overlap).
+
+    With `general.memory_budget_mb` set, models are registered as handles and the
+    approximate parameter/buffer memory of resident models is kept under the
+    budget by evicting the least recently used ones; an evicted model is rebuilt
+    transparently on its next use. See get_registry_stats().
+
+    Locally loaded models receive a LoadingPolicy built from `general.loading`
+    merged with `models.<ClassName>.loading` (dtype, low_cpu_mem_usage /
+    memory-mapped safetensors, CPU int8 quantisation) and any extra constructor
+    keyword arguments listed under `models.<ClassName>.args`. Each load logs its
+    time and the process peak RSS.
     """
     config = settings.get("model_manager", {})
+    startup_report: dict = {}
+    _report_lock = threading.Lock()
+
+    # LRU registry of resident handles (most recently used last) and usage counters
+    _resident: "OrderedDict[str, _LazyModel]" = OrderedDict()
+    _model_sizes: dict = {}
+    _usage: dict = {}
+    _registry_lock = threading.RLock()
+
+    @classmethod
+    def _record(cls, class_name: str, **values):
+        with cls._report_lock:
+            cls.startup_report.setdefault(class_name, {}).update(values)
+
+    @classmethod
+    def _import_model_class(cls, class_name: str):
+        # Dynamically import the module "models.<ClassName>"
+        module_name = f"models.{class_name}"
+        start = time.perf_counter()
+        rss_before = _rss_mb()
+        try:
+            module = importlib.import_module(module_name)
+        except ModuleNotFoundError as e:
+            cls.logger.exception(f"Could not import module '{module_name}' for class '{class_name}'")
+            raise ImportError(f"Could not import module '{module_name}' for class '{class_name}'") from e
+
+        # Retrieve the class object
+        try:
+            ModelClass = getattr(module, class_name)
+        except AttributeError as e:
+            raise ImportError(f"Module '{module_name}' does not define class '{class_name}'") from e
+
+        cls._record(
+            class_name,
+            import_s=time.perf_counter() - start,
+            import_rss_delta_mb=_rss_mb() - rss_before,
+        )
+        return ModelClass
+
+    @classmethod
+    def _construct(cls, class_name: str, ModelClass, device, model_loading: str, warmup: bool):
+        start = time.perf_counter()
+        rss_before = _rss_mb()
+        if model_loading == "local":
+            if class_name not in cls.config['models']:
+                raise KeyError(f"Expected config key '{class_name}' for local loading of '{class_name}'")
+            model_name = cls.config['models'][class_name]["model_name_or_url"]
+            policy = LoadingPolicy.from_config(cls.config.get("general", {}), cls.config['models'][class_name])
+            try:
+                instance = ModelClass(
+                    model_name=model_name,
+                    device=device if device else torch.device(cls.config['models'][class_name].get("device", "cpu")),
+                    loading_policy=policy,
+                    **cls.config['models'][class_name].get("args", {}),
+                )
+            except Exception as e:
+                cls.logger.exception(f"Error instantiating {class_name}(model_name={model_name}, device={device})")
+                raise RuntimeError(f"Error instantiating {class_name}(model_name={model_name}, device={device})") from e
+
+        else:  # model_loading == "api"
+            api_endpoint = cls.config['models'][class_name].get("api_endpoint")
+            api_token    = cls.config['models'][class_name].get("api_token")
+            if api_token  or api_endpoint:
+                raise KeyError(f"Expected 'api_endpoint and 'api_token' in config for API loading of '{class_name}'")
+            try:
+                instance = ModelClass(api_endpoint=api_endpoint, api_token=api_token)
+            except Exception as e:
+                raise RuntimeError(f"Error instantiating {class_name}(api_endpoint={api_endpoint}, api_token=***)") from e
+        load_s = time.perf_counter() - start
+        peak_rss = _peak_rss_mb()
+        cls._record(
+            class_name,
+            load_s=load_s,
+            load_rss_delta_mb=_rss_mb() - rss_before,
+            peak_rss_mb=peak_rss,
+        )
+        cls.logger.info(f"{class_name} loaded in {load_s:.2f}s (peak RSS {peak_rss:.0f} MB)")
+
+        if warmup and hasattr(instance, "warmup"):
+            start = time.perf_counter()
+            rss_before = _rss_mb()
+            try:
+                instance.warmup()
+            except Exception as e:
+                cls.logger.warning(f"Warmup of {class_name} failed: {e}")
+            cls._record(
+                class_name,
+                warmup_s=time.perf_counter() - start,
+                warmup_rss_delta_mb=_rss_mb() - rss_before,
+            )
+        return instance
 
     @classmethod
     def initialize_models(
@@ -37,6 +232,8 @@ class ModelManager(BaseComponent):
              Else:
                – Raise ValueError
           5) Assign the instance to cls.<class_name>
+        Step 4 runs sequentially, on a thread pool, or deferred to first use
+        depending on `general.loading_strategy`.
         """
         if cls.config is None:
             raise ValueError("Configuration not loaded. Call load_config first.")
@@ -46,46 +243,151 @@ class ModelManager(BaseComponent):
         if model_loading not in ("local", "api"):
             raise ValueError(f"Invalid model_loading: {model_loading}. Must be 'local' or 'api'.")
 
-        for class_name in model_classes:
-            # 1) If already instantiated, skip
-            existing = getattr(cls, class_name, None)
-            if existing is not None:
+        general = cls.config.get("general", {})
+        strategy = general.get("loading_strategy", "eager")
+        if strategy not in ("eager", "parallel", "lazy"):
+            raise ValueError(f"Invalid loading_strategy: {strategy}. Must be 'eager', 'parallel' or 'lazy'.")
+        warmup = general.get("warmup", False)
+
+        # 1) If already instantiated (or registered lazily), skip
+        pending = [name for name in dict.fromkeys(model_classes) if getattr(cls, name, None) is None]
+
+        # 2-3) Imports stay on the calling thread; they are cheap next to construction
+        #      and concurrent imports of the same heavy packages are not worth the risk.
+        model_types = {name: cls._import_model_class(name) for name in pending}
+
+        # 4-5) Instantiate and assign to class variable, e.g. ModelManager.QwenV25Infer
+        if strategy == "lazy" or cls._budget_bytes() is not None:
+            # Budgeted models are always handles so they can be evicted and rebuilt
+            handles = {
+                name: _LazyModel(
+                    name,
+                    ModelClass,
+                    (lambda n=name, m=ModelClass: cls._construct(n, m, device, model_loading, warmup)),
+                )
+                for name, ModelClass in model_types.items()
+            }
+            for name, handle in handles.items():
+                setattr(cls, name, handle)
+            if strategy == "parallel" and len(handles) > 1:
+                workers = general.get("loading_workers", len(handles))
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    list(pool.map(lambda h: h._resolve(), handles.values()))
+            elif strategy != "lazy":
+                for handle in handles.values():
+                    handle._resolve()
+        elif strategy == "parallel" and len(model_types) > 1:
+            workers = general.get("loading_workers", len(model_types))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = {
+                    name: pool.submit(cls._construct, name, ModelClass, device, model_loading, warmup)
+                    for name, ModelClass in model_types.items()
+                }
+                for name, future in futures.items():
+                    setattr(cls, name, future.result())
+        else:
+            for name, ModelClass in model_types.items():
+                setattr(cls, name, cls._construct(name, ModelClass, device, model_loading, warmup))
+
+        if model_types:
+            cls.logger.info(f"Model startup report ({strategy}): {json.dumps(cls.get_startup_report())}")
+
+    @classmethod
+    def _budget_bytes(cls):
+        budget_mb = cls.config.get("general", {}).get("memory_budget_mb")
+        return None if budget_mb is None else budget_mb * 1024 * 1024
+
+    @classmethod
+    def _counter(cls, name: str) -> dict:
+        return cls._usage.setdefault(name, {"hits": 0, "loads": 0, "reloads": 0, "evictions": 0})
+
+    @classmethod
+    def _touch(cls, name: str):
+        with cls._registry_lock:
+            if name in cls._resident:
+                cls._resident.move_to_end(name)
+            cls._counter(name)["hits"] += 1
+
+    @classmethod
+    def _evict(cls, name: str):
+        handle = cls._resident.pop(name)
+        object.__setattr__(handle, "_instance", None)
+        cls._counter(name)["evictions"] += 1
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        if hasattr(torch, "mps") and torch.backends.mps.is_available():
+            torch.mps.empty_cache()
+        cls.logger.info(f"Evicted {name} ({cls._model_sizes.get(name, 0) / 2**20:.0f} MB)")
+
+    @classmethod
+    def _make_room(cls, incoming: int, keep: str = None):
+        """Evict LRU models until resident + `incoming` bytes fit the budget."""
+        budget = cls._budget_bytes()
+        if budget is None:
+            return
+        resident = sum(cls._model_sizes.get(n, 0) for n in cls._resident)
+        for victim in list(cls._resident):
+            if resident + incoming <= budget:
+                break
+            if victim == keep:
                 continue
+            resident -= cls._model_sizes.get(victim, 0)
+            cls._evict(victim)
+        if resident + incoming > budget:
+            cls.logger.warning(
+                f"Memory budget {budget / 2**20:.0f} MB exceeded: {(resident + incoming) / 2**20:.0f} MB resident"
+            )
 
-            # 2) Dynamically import the module "models.<ClassName>"
-            module_name = f"models.{class_name}"
-            try:
-                module = importlib.import_module(module_name)
-            except ModuleNotFoundError as e:
-                cls.logger.exception(f"Could not import module '{module_name}' for class '{class_name}'")
-                raise ImportError(f"Could not import module '{module_name}' for class '{class_name}'") from e
+    @classmethod
+    def _load_handle(cls, handle: _LazyModel):
+        """Construct the model behind `handle`, evicting others to stay within budget."""
+        name = handle._name
+        with cls._registry_lock:
+            # Known size from an earlier load lets us free memory before loading
+            cls._make_room(cls._model_sizes.get(name, 0))
+        instance = handle._factory()
+        with cls._registry_lock:
+            counter = cls._counter(name)
+            if counter["loads"]:
+                counter["reloads"] += 1
+            counter["loads"] += 1
+            cls._model_sizes[name] = _model_bytes(instance)
+            object.__setattr__(handle, "_instance", instance)
+            cls._resident[name] = handle
+            cls._make_room(0, keep=name)
+        return instance
 
-            # 3) Retrieve the class object
-            try:
-                ModelClass = getattr(module, class_name)
-            except AttributeError as e:
-                raise ImportError(f"Module '{module_name}' does not define class '{class_name}'") from e
-
-            # 4) Instantiate based on loading mode
-            if model_loading == "local":
-                if class_name not in cls.config['models']:
-                    raise KeyError(f"Expected config key '{class_name}' for local loading of '{class_name}'")
-                model_name = cls.config['models'][class_name]["model_name_or_url"]
-                try:
-                    instance = ModelClass(model_name=model_name, device=device if device else torch.device(cls.config['models'][class_name].get("device", "cpu")))
-                except Exception as e:
-                    cls.logger.exception(f"Error instantiating {class_name}(model_name={model_name}, device={device})")
-                    raise RuntimeError(f"Error instantiating {class_name}(model_name={model_name}, device={device})") from e
-
-            else:  # model_loading == "api"
-                api_endpoint = cls.config['models'][class_name].get("api_endpoint")
-                api_token    = cls.config['models'][class_name].get("api_token")
-                if api_token  or api_endpoint:
-                    raise KeyError(f"Expected 'api_endpoint and 'api_token' in config for API loading of '{class_name}'")
-                try:
-                    instance = ModelClass(api_endpoint=api_endpoint, api_token=api_token)
-                except Exception as e:
-                    raise RuntimeError(f"Error instantiating {class_name}(api_endpoint={api_endpoint}, api_token=***)") from e
-
-            # 5) Assign to class variable, e.g. ModelManager.QwenV25Infer or ModelManager.ColPaliInfer
-            setattr(cls, class_name, instance)
\ No newline at end of file
+    @classmethod
+    def get_registry_stats(cls) -> dict:
+        """
+        Memory budget, resident size and per-model size / hit / load / reload /
+        eviction counters, for sizing worker boxes.
+        """
+        with cls._registry_lock:
+            budget = cls._budget_bytes()
+            return {
+                "budget_mb": None if budget is None else budget / 2**20,
+                "resident_mb": round(sum(cls._model_sizes.get(n, 0) for n in cls._resident) / 2**20, 1),
+                "models": {
+                    name: {
+                        "resident": name in cls._resident,
+                        "size_mb": round(cls._model_sizes.get(name, 0) / 2**20, 1),
+                        **counters,
+                    }
+                    for name, counters in cls._usage.items()
+                },
+            }
+
+    @classmethod
+    def get_startup_report(cls) -> dict:
+        """
+        Per-model startup timings (seconds) and RSS deltas (MB) for the import,
+        load and warmup phases, plus the process peak RSS right after each load.
+        Lazily registered models only get load/warmup entries once they are first used.
+        """
+        with cls._report_lock:
+            return {
+                name: {key: round(value, 3) for key, value in phases.items()}
+                for name, phases in cls.startup_report.items()
+            }
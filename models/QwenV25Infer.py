@@ -1,39 +1,97 @@
+import copy
+import threading
 import torch
-from transformers import Qwen2_5_VLForConditionalGeneration, AutoProcessor
+from transformers import (
+    Qwen2_5_VLForConditionalGeneration,
+    AutoProcessor,
+    DynamicCache,
+    LogitsProcessorList,
+    NoRepeatNGramLogitsProcessor,
+    RepetitionPenaltyLogitsProcessor,
+    TemperatureLogitsWarper,
+    TopKLogitsWarper,
+    TopPLogitsWarper,
+)
 from qwen_vl_utils import process_vision_info
 from PIL import Image, ImageOps
 from io import BytesIO
 from huggingface_hub import InferenceClient
 from common import InferenceVLComponent
-from typing import Union
+from models.TrieConstrainedLogitsProcessor import TrieConstrainedLogitsProcessor
+from models.LoadingPolicy import LoadingPolicy
+from typing import Dict, List, Tuple, Union
 
 
 class QwenV25Infer(InferenceVLComponent):
     """
     A class to perform inference using the Qwen2.5-VL model, either locally or via an API.
+
+    Every image is center-cropped to `image_size`×`image_size` before it reaches the
+    processor. Qwen2.5-VL emits one visual token per 28×28 pixel block, so this side
+    length sets the vision-token budget (512 → ~324 tokens, 224 → 64, 112 → 16).
+    It can be set per instance or overridden per call, along with the resampling filter.
+
+    Weights are loaded according to `loading_policy` (dtype, memory-mapped
+    safetensors, optional CPU int8 quantisation); see LoadingPolicy.
     """
 
-    def __init__(self, model_name=None, api_endpoint=None, api_token=None, device='cuda'):
+    PIXELS_PER_TOKEN_SIDE = 28
+    RESAMPLE_FILTERS = {
+        "nearest": Image.NEAREST,
+        "bilinear": Image.BILINEAR,
+        "bicubic": Image.BICUBIC,
+        "lanczos": Image.LANCZOS,
+    }
+
+    def __init__(self, model_name=None, api_endpoint=None, api_token=None, device='cuda',
+                 image_size: int = 512, resample: str = "lanczos", loading_policy: LoadingPolicy = None):
+        if resample not in self.RESAMPLE_FILTERS:
+            raise ValueError(f"Invalid resample: {resample}. Must be one of {list(self.RESAMPLE_FILTERS)}.")
+        self.model_name = model_name
+        self.image_size = image_size
+        self.resample = resample
         self.api_endpoint = api_endpoint
         self.api_token = api_token
         self.device = device
         self.client = None
         self.model = None
         self.processor = None
+        self._candidate_tries = {}
+        self._prefix_cache = None
+        # Requests extend the prefix cache in place and crop it back, one at a time
+        self._prefix_lock = threading.Lock()
 
         if self.api_endpoint and self.api_token:
             self.client = InferenceClient(model=api_endpoint, token=api_token)
         elif model_name:
-            print(f"Loading {model_name} model...")
-            self.model = Qwen2_5_VLForConditionalGeneration.from_pretrained(
-                model_name
-            ).to(self.device)
+            policy = loading_policy or LoadingPolicy()
+            print(f"Loading {model_name} model ({policy})...")
+            self.model = policy.finalize(
+                Qwen2_5_VLForConditionalGeneration.from_pretrained(model_name, **policy.pretrained_kwargs()),
+                self.device,
+            )
             print("Model loaded!")
             self.processor = AutoProcessor.from_pretrained(model_name)
+            # Decoder-only batched generation needs prompts aligned on the right
+            self.processor.tokenizer.padding_side = "left"
         else:
             raise ValueError("Either API details or a model name must be provided for inference.")
 
-    def infer(self, image_data, prompt):
+    def warmup(self):
+        """
+        Run a minimal local generation (tiny synthetic image, two-token constrained
+        answer) so the first request does not pay kernel / graph setup.
+        """
+        if self.model is None:
+            return
+        self.infer_constrained(
+            Image.new("RGB", (56, 56), (96, 64, 48)),
+            "Reply with ok.",
+            ["ok"],
+            image_size=56,
+        )
+
+    def infer(self, image_data, prompt, image_size: int = None, resample: str = None):
         if not image_data:
             raise ValueError("Image data cannot be None")
         if not prompt or not isinstance(prompt, str):
@@ -44,61 +102,487 @@ class QwenV25Infer(InferenceVLComponent):
                 response = self._infer_via_api(image_data, prompt)
                 return response if isinstance(response, str) else str(response)
             else:
-                return self._infer_locally(image_data, prompt)
+                return self._infer_locally(image_data, prompt, image_size, resample)
         except Exception as e:
             raise RuntimeError(f"Inference failed: {e}") from e
 
-    def _infer_locally(self, image_data, prompt):
-        # 1) Load/convert the image
+    def _load_image(self, image_data) -> Image.Image:
         if isinstance(image_data, bytes):
-            image = Image.open(BytesIO(image_data)).convert("RGB")
+            return Image.open(BytesIO(image_data)).convert("RGB")
         elif isinstance(image_data, Image.Image):
-            image = image_data
+            return image_data
         elif isinstance(image_data, str):
-            image = Image.open(image_data).convert("RGB")
+            return Image.open(image_data).convert("RGB")
         else:
             raise ValueError("Image must be bytes, a PIL Image, or a file path string.")
 
-        # 2) Center-crop to 512×512
-        image = ImageOps.fit(image, (512, 512), method=Image.LANCZOS)
+    @classmethod
+    def visual_tokens_for(cls, image_size: int) -> int:
+        """Approximate number of vision tokens for a square image of side `image_size`."""
+        return max(1, round(image_size / cls.PIXELS_PER_TOKEN_SIDE)) ** 2
 
-        # 3) Build a chat‐style message list
-        messages = [
-            {
-                "role": "user",
-                "content": [
-                    {"type": "image", "image": image},
-                    {"type": "text", "text": prompt},
-                ],
-            }
+    @classmethod
+    def image_size_for_tokens(cls, visual_tokens: int) -> int:
+        """Square side length whose vision-token count is closest to `visual_tokens`."""
+        return max(1, round(visual_tokens ** 0.5)) * cls.PIXELS_PER_TOKEN_SIDE
+
+    def _fit_image(self, image: Image.Image, image_size: int = None, resample: str = None) -> Image.Image:
+        """Center-crop `image` to the (per-call or instance) vision resolution."""
+        side = image_size or self.image_size
+        resample = resample or self.resample
+        if resample not in self.RESAMPLE_FILTERS:
+            raise ValueError(f"Invalid resample: {resample}. Must be one of {list(self.RESAMPLE_FILTERS)}.")
+        return ImageOps.fit(image, (side, side), method=self.RESAMPLE_FILTERS[resample])
+
+    def _build_messages(self, image: Image.Image, prompt: str, static_prompt: str = None,
+                        image_size: int = None, resample: str = None):
+        # 1) Center-crop to the configured vision resolution
+        image = self._fit_image(image, image_size, resample)
+
+        # 2) Build a chat‐style message list. Static text goes before the image
+        #    so that the tokens preceding it are identical across requests.
+        content = [
+            {"type": "image", "image": image},
+            {"type": "text", "text": prompt},
         ]
+        if static_prompt:
+            content.insert(0, {"type": "text", "text": static_prompt})
+        return [{"role": "user", "content": content}]
 
-        # 4) Apply the chat template (keeps tokenizer happy) and extract vision inputs
-        text = self.processor.apply_chat_template(
-            messages,
-            tokenize=False,
-            add_generation_prompt=True
-        )
-        image_inputs, video_inputs = process_vision_info(messages)
+    def _build_batch_inputs(self, images: List[Image.Image], prompts: List[str], static_prompt: str = None,
+                            image_size: int = None, resample: str = None):
+        conversations = [
+            self._build_messages(image, prompt, static_prompt, image_size, resample)
+            for image, prompt in zip(images, prompts)
+        ]
 
-        # 5) Run through the processor to get final model inputs
-        inputs = self.processor(
-            text=[text],
+        # 3) Apply the chat template (keeps tokenizer happy) and extract vision inputs
+        texts = [
+            self.processor.apply_chat_template(
+                messages,
+                tokenize=False,
+                add_generation_prompt=True
+            )
+            for messages in conversations
+        ]
+        image_inputs, video_inputs = process_vision_info(conversations)
+
+        # 4) Run through the processor to get final (left-padded) model inputs
+        return self.processor(
+            text=texts,
             images=image_inputs,
             videos=video_inputs,
             padding=True,
             return_tensors="pt",
         ).to(self.device)
 
+    def _build_inputs(self, image: Image.Image, prompt: str, static_prompt: str = None,
+                      image_size: int = None, resample: str = None):
+        return self._build_batch_inputs([image], [prompt], static_prompt, image_size, resample)
+
+    def _infer_locally(self, image_data, prompt, image_size: int = None, resample: str = None):
+        inputs = self._build_inputs(self._load_image(image_data), prompt,
+                                    image_size=image_size, resample=resample)
+
         # Record prompt length so we can slice off prompt tokens later
         prompt_len = inputs["input_ids"].shape[-1]
 
-        # 6) Generate and decode
+        # Generate and decode
         with torch.no_grad():
             generated_ids = self.model.generate(**inputs, max_new_tokens=512)
         generated_ids = generated_ids[:, prompt_len:]
         return self.processor.batch_decode(generated_ids, skip_special_tokens=True)[0]
 
+    def infer_batch(
+        self,
+        images: List[Union[bytes, str, Image.Image]],
+        prompts: List[str],
+        candidates: List[str] = None,
+        max_new_tokens: int = 512,
+        image_size: int = None,
+        resample: str = None
+    ) -> List[str]:
+        """
+        One left-padded generate() over several image/prompt pairs. Each sequence
+        stops at its own EOS; the call returns once all have finished. If
+        `candidates` is given, decoding is constrained to them as in infer_constrained().
+
+        Returns one response per input, in order.
+        """
+        if not images or len(images) != len(prompts):
+            raise ValueError("images and prompts must be non-empty lists of equal length")
+        if any(not p or not isinstance(p, str) for p in prompts):
+            raise ValueError("Prompt must be a non-empty string")
+        if self.client:
+            return [self.infer(image, prompt) for image, prompt in zip(images, prompts)]
+
+        try:
+            inputs = self._build_batch_inputs([self._load_image(i) for i in images], prompts,
+                                              image_size=image_size, resample=resample)
+            prompt_len = inputs["input_ids"].shape[-1]
+
+            generate_kwargs = {"max_new_tokens": max_new_tokens}
+            lookup = None
+            if candidates:
+                trie, lookup, generate_kwargs["max_new_tokens"] = self._candidate_trie(candidates)
+                generate_kwargs["do_sample"] = False
+                generate_kwargs["logits_processor"] = LogitsProcessorList([
+                    TrieConstrainedLogitsProcessor(trie, self._eos_token_id(), prompt_len)
+                ])
+
+            with torch.no_grad():
+                generated_ids = self.model.generate(**inputs, **generate_kwargs)
+        except Exception as e:
+            raise RuntimeError(f"Inference failed: {e}") from e
+
+        generated_ids = generated_ids[:, prompt_len:]
+        if lookup is None:
+            return self.processor.batch_decode(generated_ids, skip_special_tokens=True)
+
+        eos_token_id = self._eos_token_id()
+        responses = []
+        for row in generated_ids.tolist():
+            tokens = row[:row.index(eos_token_id)] if eos_token_id in row else row
+            responses.append(lookup[tuple(tokens)])
+        return responses
+
+    def _eos_token_ids(self) -> List[int]:
+        eos = self.model.generation_config.eos_token_id
+        if eos is None:
+            eos = self.processor.tokenizer.eos_token_id
+        return list(eos) if isinstance(eos, (list, tuple)) else [eos]
+
+    def _eos_token_id(self) -> int:
+        return self._eos_token_ids()[0]
+
+    def _candidate_trie(self, candidates: List[str]):
+        """Token-prefix trie over `candidates`, cached per candidate list."""
+        key = tuple(candidates)
+        if key not in self._candidate_tries:
+            self._candidate_tries[key] = TrieConstrainedLogitsProcessor.build_trie(
+                self.processor.tokenizer, candidates, self._eos_token_id()
+            )
+        return self._candidate_tries[key]
+
+    def infer_constrained(self, image_data, prompt: str, candidates: List[str],
+                          image_size: int = None, resample: str = None) -> str:
+        """
+        Like infer(), but decoding is restricted to the token sequences of
+        `candidates`, so the result is always exactly one of them. Generation
+        stops as soon as a candidate is complete.
+        """
+        if not image_data:
+            raise ValueError("Image data cannot be None")
+        if not prompt or not isinstance(prompt, str):
+            raise ValueError("Prompt must be a non-empty string")
+        if not candidates:
+            raise ValueError("Candidates must be a non-empty list")
+        if self.client:
+            raise NotImplementedError("Constrained decoding is only available for local inference")
+
+        try:
+            inputs = self._build_inputs(self._load_image(image_data), prompt,
+                                        image_size=image_size, resample=resample)
+            prompt_len = inputs["input_ids"].shape[-1]
+
+            trie, lookup, max_len = self._candidate_trie(candidates)
+            eos_token_id = self._eos_token_id()
+            constraint = TrieConstrainedLogitsProcessor(trie, eos_token_id, prompt_len)
+
+            with torch.no_grad():
+                generated_ids = self.model.generate(
+                    **inputs,
+                    max_new_tokens=max_len,
+                    do_sample=False,
+                    logits_processor=LogitsProcessorList([constraint]),
+                )
+        except Exception as e:
+            raise RuntimeError(f"Inference failed: {e}") from e
+
+        tokens = generated_ids[0, prompt_len:].tolist()
+        if eos_token_id in tokens:
+            tokens = tokens[:tokens.index(eos_token_id)]
+        return lookup[tuple(tokens)]
+
+    def invalidate_prefix_cache(self):
+        """Drop the cached static-prefix KV state (e.g. after the swatch catalog changed)."""
+        with self._prefix_lock:
+            self._prefix_cache = None
+
+    def _rope_index(self, inputs):
+        """Multimodal (3, B, L) RoPE position ids and per-row deltas, as generate() computes them."""
+        get_rope_index = getattr(self.model, "get_rope_index", None) or self.model.model.get_rope_index
+        return get_rope_index(inputs["input_ids"], inputs.get("image_grid_thw"), None, inputs["attention_mask"])
+
+    def _generation_processors(self, do_sample: bool) -> LogitsProcessorList:
+        """
+        The logits processors generate() derives from `model.generation_config`
+        (repetition penalty, n-gram blocking and, when sampling, the
+        temperature / top-k / top-p warpers), for the hand-written decode loop.
+        """
+        config = self.model.generation_config
+        processors = LogitsProcessorList()
+        if config.repetition_penalty is not None and config.repetition_penalty != 1.0:
+            processors.append(RepetitionPenaltyLogitsProcessor(penalty=config.repetition_penalty))
+        if config.no_repeat_ngram_size:
+            processors.append(NoRepeatNGramLogitsProcessor(config.no_repeat_ngram_size))
+        if do_sample:
+            if config.temperature is not None and config.temperature != 1.0:
+                processors.append(TemperatureLogitsWarper(config.temperature))
+            if config.top_k:
+                processors.append(TopKLogitsWarper(top_k=config.top_k))
+            if config.top_p is not None and config.top_p < 1.0:
+                processors.append(TopPLogitsWarper(top_p=config.top_p))
+        return processors
+
+    def _generate_with_prefix_cache(self, inputs, max_new_tokens: int, logits_processor=None):
+        """
+        Generation that reuses the KV cache of the text preceding the first image.
+        The prefix cache is keyed by its token ids, so a different static prompt
+        transparently replaces it.
+
+        Decoding follows `model.generation_config` like generate() does: its
+        repetition penalty / n-gram processors always apply, and tokens are
+        sampled when it sets do_sample. With a `logits_processor` (constrained
+        decoding) it is greedy, as in infer_constrained(). Each request extends
+        the shared prefix cache in place and crops it back to the prefix
+        afterwards, so calls are serialised instead of copying the cache.
+
+        Returns (generated token ids of shape (1, T), prefill stats).
+        """
+        input_ids = inputs["input_ids"]
+        attention_mask = inputs["attention_mask"]
+        seq_len = input_ids.shape[-1]
+        device = input_ids.device
+
+        # Text before the first <|vision_start|> has plain 1-D positions, so its
+        # KV state does not depend on the image that follows.
+        vision_starts = (input_ids[0] == self.model.config.vision_start_token_id).nonzero()
+        prefix_len = int(vision_starts[0]) if len(vision_starts) else 0
+        position_ids, rope_deltas = self._rope_index(inputs)
+
+        do_sample = bool(self.model.generation_config.do_sample) and logits_processor is None
+        processors = self._generation_processors(do_sample)
+        if logits_processor is not None:
+            processors.append(logits_processor)
+
+        cached_tokens = 0
+        past_key_values = None
+        with self._prefix_lock, torch.no_grad():
+            try:
+                if prefix_len:
+                    key = tuple(input_ids[0, :prefix_len].tolist())
+                    if self._prefix_cache is not None and self._prefix_cache[0] == key:
+                        cached_tokens = prefix_len
+                    else:
+                        out = self.model(
+                            input_ids=input_ids[:, :prefix_len],
+                            attention_mask=attention_mask[:, :prefix_len],
+                            position_ids=position_ids[:, :, :prefix_len],
+                            use_cache=True,
+                        )
+                        self._prefix_cache = (key, out.past_key_values)
+                    past_key_values = self._prefix_cache[1]
+                    if not hasattr(past_key_values, "crop"):
+                        # Legacy tuple caches cannot be cropped back; decode on a copy
+                        past_key_values = copy.deepcopy(past_key_values)
+
+                # Prefill the per-request suffix (image + question) on top of the prefix
+                out = self.model(
+                    input_ids=input_ids[:, prefix_len:],
+                    pixel_values=inputs.get("pixel_values"),
+                    image_grid_thw=inputs.get("image_grid_thw"),
+                    attention_mask=attention_mask,
+                    position_ids=position_ids[:, :, prefix_len:],
+                    past_key_values=past_key_values,
+                    cache_position=torch.arange(prefix_len, seq_len, device=device),
+                    use_cache=True,
+                )
+
+                # Decode
+                stop_ids = set(self._eos_token_ids())
+                sequence = input_ids
+                for step in range(max_new_tokens):
+                    logits = processors(sequence, out.logits[:, -1, :].float())
+                    if do_sample:
+                        next_token = torch.multinomial(torch.softmax(logits, dim=-1), num_samples=1)
+                    else:
+                        next_token = logits.argmax(dim=-1, keepdim=True)
+                    sequence = torch.cat([sequence, next_token], dim=1)
+                    if int(next_token) in stop_ids or step == max_new_tokens - 1:
+                        break
+
+                    pos = seq_len + step
+                    attention_mask = torch.cat([attention_mask, attention_mask.new_ones((1, 1))], dim=1)
+                    step_positions = (rope_deltas.to(device) + pos).unsqueeze(0).expand(3, -1, -1)
+                    out = self.model(
+                        input_ids=next_token,
+                        attention_mask=attention_mask,
+                        position_ids=step_positions,
+                        past_key_values=out.past_key_values,
+                        cache_position=torch.tensor([pos], device=device),
+                        use_cache=True,
+                    )
+            finally:
+                # Drop this request's image / question / answer from the shared prefix cache
+                if past_key_values is not None and hasattr(past_key_values, "crop"):
+                    past_key_values.crop(prefix_len)
+
+        stats = {
+            "prefill_tokens": seq_len,
+            "cached_prefix_tokens": cached_tokens,
+            "computed_prefill_tokens": seq_len - cached_tokens,
+        }
+        return sequence[:, seq_len:], stats
+
+    def infer_with_prefix_cache(
+        self,
+        image_data,
+        static_prompt: str,
+        prompt: str,
+        candidates: List[str] = None,
+        max_new_tokens: int = 512,
+        image_size: int = None,
+        resample: str = None
+    ) -> Tuple[str, Dict[str, int]]:
+        """
+        Like infer(), but `static_prompt` is placed before the image and its KV
+        cache is computed once and reused across calls. If `candidates` is given,
+        decoding is constrained to them as in infer_constrained().
+
+        Returns (response, {"prefill_tokens", "cached_prefix_tokens", "computed_prefill_tokens"}).
+        """
+        if not image_data:
+            raise ValueError("Image data cannot be None")
+        if not static_prompt or not prompt:
+            raise ValueError("Static prompt and prompt must be non-empty strings")
+        if self.client:
+            raise NotImplementedError("Prefix caching is only available for local inference")
+
+        try:
+            inputs = self._build_inputs(self._load_image(image_data), prompt, static_prompt=static_prompt,
+                                        image_size=image_size, resample=resample)
+            constraint, lookup = None, None
+            if candidates:
+                trie, lookup, max_new_tokens = self._candidate_trie(candidates)
+                constraint = TrieConstrainedLogitsProcessor(
+                    trie, self._eos_token_id(), inputs["input_ids"].shape[-1]
+                )
+            generated_ids, stats = self._generate_with_prefix_cache(inputs, max_new_tokens, constraint)
+        except Exception as e:
+            raise RuntimeError(f"Inference failed: {e}") from e
+
+        self.logger.info(
+            f"Prefill: {stats['computed_prefill_tokens']}/{stats['prefill_tokens']} tokens computed, "
+            f"{stats['cached_prefix_tokens']} reused from prefix cache"
+        )
+        if lookup is None:
+            return self.processor.batch_decode(generated_ids, skip_special_tokens=True)[0], stats
+
+        tokens = generated_ids[0].tolist()
+        eos_token_id = self._eos_token_id()
+        if eos_token_id in tokens:
+            tokens = tokens[:tokens.index(eos_token_id)]
+        return lookup[tuple(tokens)], stats
+
+    @staticmethod
+    def _expand_cache(prefix_kv, batch_size: int):
+        """
+        Batch-`batch_size` cache over a batch-1 legacy (per-layer key, value)
+        prefix cache. The prefix is broadcast, not copied; each layer is only
+        materialised when the continuation is appended to it.
+        """
+        expanded = tuple(
+            tuple(t.expand(batch_size, *t.shape[1:]) for t in layer)
+            for layer in prefix_kv
+        )
+        return DynamicCache.from_legacy_cache(expanded)
+
+    def rank_candidates(self, image_data, prompt: str, candidates: List[str],
+                        image_size: int = None, resample: str = None,
+                        chunk_size: int = 8) -> List[Tuple[str, float]]:
+        """
+        Scores the log-likelihood of every candidate as the full answer to `prompt`
+        about the image. The image+prompt prefix is prefilled once; candidates
+        (each terminated by EOS) are then teacher-forced on top of its KV cache,
+        `chunk_size` at a time, so peak memory grows with chunk_size x prefix
+        length rather than with the catalog size.
+
+        Returns [(candidate, log_prob), ...] in the order of `candidates`.
+        """
+        if not image_data:
+            raise ValueError("Image data cannot be None")
+        if not prompt or not isinstance(prompt, str):
+            raise ValueError("Prompt must be a non-empty string")
+        if not candidates:
+            raise ValueError("Candidates must be a non-empty list")
+        if chunk_size < 1:
+            raise ValueError(f"Invalid chunk_size: {chunk_size}. Must be at least 1.")
+        if self.client:
+            raise NotImplementedError("Candidate ranking is only available for local inference")
+
+        tokenizer = self.processor.tokenizer
+        eos_token_id = self._eos_token_id()
+        pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else eos_token_id
+
+        # Right-padded (C, L) continuation batch and its mask
+        cand_ids = [tokenizer(c, add_special_tokens=False)["input_ids"] + [eos_token_id] for c in candidates]
+        n_cands, max_len = len(cand_ids), max(len(ids) for ids in cand_ids)
+        cont_ids = torch.full((n_cands, max_len), pad_token_id, dtype=torch.long)
+        cont_mask = torch.zeros((n_cands, max_len), dtype=torch.long)
+        for i, ids in enumerate(cand_ids):
+            cont_ids[i, :len(ids)] = torch.tensor(ids)
+            cont_mask[i, :len(ids)] = 1
+        cont_ids, cont_mask = cont_ids.to(self.device), cont_mask.to(self.device)
+
+        seq_logp = []
+        try:
+            inputs = self._build_inputs(self._load_image(image_data), prompt,
+                                        image_size=image_size, resample=resample)
+            prompt_len = inputs["input_ids"].shape[-1]
+            position_ids, rope_deltas = self._rope_index(inputs)
+            # Text after the image continues from the prompt's last multimodal position
+            cont_positions = (
+                rope_deltas.to(cont_ids.device)
+                + torch.arange(prompt_len, prompt_len + max_len, device=cont_ids.device)
+            ).unsqueeze(0)
+            cache_position = torch.arange(prompt_len, prompt_len + max_len, device=cont_ids.device)
+
+            with torch.no_grad():
+                # 1) Shared prefill over image + prompt
+                prefix = self.model(**inputs, position_ids=position_ids, use_cache=True)
+                prefix_kv = prefix.past_key_values
+                if hasattr(prefix_kv, "to_legacy_cache"):
+                    prefix_kv = prefix_kv.to_legacy_cache()
+                first_logits = prefix.logits[:, -1:, :]
+
+                # 2) Teacher-forced passes over bounded chunks of candidates
+                for start in range(0, n_cands, chunk_size):
+                    ids = cont_ids[start:start + chunk_size]
+                    mask = cont_mask[start:start + chunk_size]
+                    n = len(ids)
+                    out = self.model(
+                        input_ids=ids,
+                        attention_mask=torch.cat([inputs["attention_mask"].expand(n, -1), mask], dim=1),
+                        position_ids=cont_positions.expand(3, n, -1),
+                        past_key_values=self._expand_cache(prefix_kv, n),
+                        cache_position=cache_position,
+                        use_cache=False,
+                    )
+
+                    # Token t of a candidate is predicted by the logits at step t-1
+                    # (the prefix's last position for t=0).
+                    step_logits = torch.cat([first_logits.expand(n, -1, -1), out.logits[:, :-1, :]], dim=1).float()
+                    token_logp = (
+                        step_logits.gather(-1, ids.unsqueeze(-1)).squeeze(-1)
+                        - step_logits.logsumexp(dim=-1)
+                    )
+                    seq_logp.extend((token_logp * mask).sum(dim=1).tolist())
+        except Exception as e:
+            raise RuntimeError(f"Inference failed: {e}") from e
+
+        return list(zip(candidates, seq_logp))
+
     def _infer_via_api(self, image_data, prompt):
         image = Image.open(BytesIO(image_data)).convert("RGB")
         response = self.client.text_to_image(prompt, image=image)
@@ -106,11 +590,15 @@ class QwenV25Infer(InferenceVLComponent):
 
     def infer_multi_image(self,
                                 image_datas: list[Union[bytes, str, Image.Image]],
-                                prompt: str
+                                prompt: str,
+                                image_size: int = None,
+                                resample: str = None
                                 ) -> str:
         """
         One forward‐pass over N images. Returns a single text string
         describing each swatch in order (e.g. "1. light blonde, 2. dark brown, ...").
+        The prefill grows with N × visual_tokens_for(image_size), so small
+        thumbnails keep large catalogs affordable.
         """
         # 1) load & normalize all images
         imgs = []
@@ -123,7 +611,7 @@ class QwenV25Infer(InferenceVLComponent):
                 img = Image.open(d).convert("RGB")
             else:
                 raise ValueError("Each item must be bytes, PIL Image, or file‐path string.")
-            img = ImageOps.fit(img, (512, 512), method=Image.LANCZOS)
+            img = self._fit_image(img, image_size, resample)
             imgs.append(img)
 
         # 2) build one chat message: a sequence of image blocks + your prompt
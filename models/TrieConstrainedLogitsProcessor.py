@@ -0,0 +1,59 @@
+import torch
+from typing import Any, Dict, List, Sequence, Tuple
+from transformers import LogitsProcessor
+
+
+class TrieConstrainedLogitsProcessor(LogitsProcessor):
+    """
+    Restricts generation to one of a fixed set of token sequences.
+
+    The allowed sequences are stored in a token-prefix trie; at each step only
+    the children of the node reached by the tokens generated so far keep their
+    logits, every other token is masked to -inf. Each sequence ends with the
+    EOS token, so generation stops as soon as a complete candidate is emitted.
+    """
+
+    def __init__(self, trie: Dict[int, Any], eos_token_id: int, prompt_len: int):
+        """
+        trie: nested {token_id: child} dict built by build_trie()
+        eos_token_id: token that terminates every candidate
+        prompt_len: number of (padded) prompt tokens preceding the generated ones
+        """
+        self.trie = trie
+        self.eos_token_id = eos_token_id
+        self.prompt_len = prompt_len
+
+    @staticmethod
+    def build_trie(
+        tokenizer: Any,
+        candidates: Sequence[str],
+        eos_token_id: int
+    ) -> Tuple[Dict[int, Any], Dict[Tuple[int, ...], str], int]:
+        """
+        Tokenizes `candidates` and builds the prefix trie.
+        Returns (trie, token-sequence -> candidate lookup, longest sequence length incl. EOS).
+        """
+        trie: Dict[int, Any] = {}
+        lookup: Dict[Tuple[int, ...], str] = {}
+        max_len = 0
+        for candidate in candidates:
+            ids: List[int] = tokenizer(candidate, add_special_tokens=False)["input_ids"]
+            lookup.setdefault(tuple(ids), candidate)
+            max_len = max(max_len, len(ids) + 1)
+            node = trie
+            for tok in ids + [eos_token_id]:
+                node = node.setdefault(tok, {})
+        return trie, lookup, max_len
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        mask = torch.full_like(scores, float("-inf"))
+        for row, generated in enumerate(input_ids[:, self.prompt_len:].tolist()):
+            node = self.trie
+            for tok in generated:
+                node = node.get(tok)
+                if node is None:
+                    break
+            # Finished (or off-trie) rows may only emit EOS
+            allowed = list(node.keys()) if node else [self.eos_token_id]
+            mask[row, allowed] = 0.0
+        return scores + mask
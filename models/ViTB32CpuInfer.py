@@ -0,0 +1,174 @@
+import os
+import torch
+import numpy as np
+from PIL import Image
+from typing import List, Union
+from transformers import CLIPModel, CLIPProcessor
+from common import InferenceImageEmbeddingComponent
+from models.LoadingPolicy import LoadingPolicy
+from models.ClipTensorPreprocessor import ClipTensorPreprocessor
+
+try:
+    import onnxruntime as ort
+except ImportError:  # optional: only needed for backend="onnx"
+    ort = None
+
+
+class _VisionTower(torch.nn.Module):
+    """CLIP vision model + projection, i.e. CLIPModel.get_image_features as a standalone module."""
+
+    def __init__(self, clip: CLIPModel):
+        super().__init__()
+        self.vision_model = clip.vision_model
+        self.visual_projection = clip.visual_projection
+
+    def forward(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        pooled = self.vision_model(pixel_values=pixel_values).pooler_output
+        return self.visual_projection(pooled)
+
+
+class ViTB32CpuInfer(InferenceImageEmbeddingComponent):
+    """
+    CPU embedder serving the CLIP vision tower through an exported graph instead
+    of eager PyTorch. Drop-in for ViTB32Infer's encode_image / encode_images.
+
+    The tower is exported once per model and backend and cached under `cache_dir`:
+      - backend="onnx": ONNX graph run by onnxruntime (needs `onnxruntime`)
+      - backend="torchscript": traced and frozen TorchScript module
+    `intra_op_threads` sets the runtime's intra-op thread pool; for TorchScript
+    this is torch.set_num_threads() and therefore process-wide.
+    """
+    EXPORT_VERSION = 1
+    BACKENDS = ("onnx", "torchscript")
+
+    def __init__(
+        self,
+        model_name: str = "openai/clip-vit-base-patch32",
+        device: str = "cpu",
+        loading_policy: LoadingPolicy = None,
+        backend: str = "onnx",
+        intra_op_threads: int = None,
+        cache_dir: str = "models/cache",
+    ):
+        super().__init__()
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Invalid backend: {backend}. Must be one of {list(self.BACKENDS)}.")
+        if backend == "onnx" and ort is None:
+            raise ImportError("backend='onnx' requires the 'onnxruntime' package")
+        if torch.device(device).type != "cpu":
+            self.logger.warning(f"{self.__class__.__name__} always runs on CPU; ignoring device={device}")
+        self.device = torch.device("cpu")
+        self.model_name = model_name
+        self.backend = backend
+        self.intra_op_threads = intra_op_threads
+
+        if not os.path.isabs(cache_dir):
+            cache_dir = os.path.join(self.project_root, cache_dir)
+        os.makedirs(cache_dir, exist_ok=True)
+        suffix = "onnx" if backend == "onnx" else "pt"
+        self.artifact_path = os.path.join(
+            cache_dir, f"{model_name.replace('/', '--')}.vision.v{self.EXPORT_VERSION}.{suffix}"
+        )
+
+        self.processor = CLIPProcessor.from_pretrained(model_name)
+        self.tensor_preprocessor = ClipTensorPreprocessor(self.processor.image_processor)
+        if not os.path.exists(self.artifact_path):
+            self._export(loading_policy or LoadingPolicy())
+        self._load_runtime()
+        self.logger.info(f"{model_name} served by {backend} from {self.artifact_path}")
+
+    def _export(self, policy: LoadingPolicy):
+        """Export the eager vision tower to `artifact_path` (written atomically)."""
+        self.logger.info(f"Exporting {self.model_name} vision tower to {self.backend}")
+        clip = CLIPModel.from_pretrained(
+            self.model_name,
+            # Exported graphs are fp32; int8 is left to the runtime
+            low_cpu_mem_usage=policy.low_cpu_mem_usage,
+            attn_implementation="eager",
+        )
+        tower = _VisionTower(clip).eval()
+        side = clip.config.vision_config.image_size
+        dummy = torch.zeros(1, 3, side, side)
+
+        tmp_path = self.artifact_path + ".tmp"
+        with torch.no_grad():
+            if self.backend == "onnx":
+                torch.onnx.export(
+                    tower,
+                    (dummy,),
+                    tmp_path,
+                    input_names=["pixel_values"],
+                    output_names=["image_embeds"],
+                    dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+                    opset_version=17,
+                )
+            else:
+                traced = torch.jit.freeze(torch.jit.trace(tower, dummy))
+                torch.jit.save(traced, tmp_path)
+        os.replace(tmp_path, self.artifact_path)
+        del clip, tower
+
+    def _load_runtime(self):
+        if self.backend == "onnx":
+            options = ort.SessionOptions()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            if self.intra_op_threads:
+                options.intra_op_num_threads = self.intra_op_threads
+            self.session = ort.InferenceSession(
+                self.artifact_path, sess_options=options, providers=["CPUExecutionProvider"]
+            )
+            self.model = None
+        else:
+            if self.intra_op_threads:
+                torch.set_num_threads(self.intra_op_threads)
+            self.session = None
+            self.model = torch.jit.load(self.artifact_path, map_location="cpu").eval()
+
+    def _run(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        if self.session is not None:
+            (emb,) = self.session.run(["image_embeds"], {"pixel_values": pixel_values.numpy().astype(np.float32)})
+            return torch.from_numpy(emb)
+        with torch.no_grad():
+            return self.model(pixel_values).float()
+
+    def encode_image(self, image: Image.Image) -> torch.Tensor:
+        self.logger.debug(f"Encoding image to CLIP embedding ({self.backend})")
+        inputs = self.processor(images=image, return_tensors="pt")
+        return self._run(inputs.pixel_values)
+
+    def warmup(self):
+        """Run the exported graph once so the first request does not pay session setup."""
+        self.encode_image(Image.new("RGB", (224, 224), (96, 64, 48)))
+
+    def encode_images(self, images: List[Image.Image], batch_size: int = 32) -> torch.Tensor:
+        """
+        Encode many images with one runtime call per `batch_size` chunk.
+        Returns a (len(images), D) tensor, row i being the embedding of images[i].
+        """
+        if not images:
+            raise ValueError("encode_images() needs at least one image")
+        self.logger.debug(f"Encoding {len(images)} images in batches of {batch_size} ({self.backend})")
+        embs = []
+        for start in range(0, len(images), batch_size):
+            inputs = self.processor(images=images[start:start + batch_size], return_tensors="pt")
+            embs.append(self._run(inputs.pixel_values))
+        return torch.cat(embs, dim=0)
+
+    def encode_array(
+        self,
+        images: Union[np.ndarray, torch.Tensor],
+        batch_size: int = 32,
+        channels_last: bool = True
+    ) -> torch.Tensor:
+        """
+        Encode a stacked uint8 batch (N, H, W, 3) — or (N, 3, H, W) with
+        channels_last=False — preprocessed on-tensor instead of through CLIPProcessor.
+        Returns a (N, D) tensor, row i being the embedding of images[i].
+        """
+        if len(images) == 0:
+            raise ValueError("encode_array() needs at least one image")
+        embs = []
+        for start in range(0, len(images), batch_size):
+            pixel_values = self.tensor_preprocessor(images[start:start + batch_size], channels_last=channels_last)
+            embs.append(self._run(pixel_values))
+        return torch.cat(embs, dim=0)
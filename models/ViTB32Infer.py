@@ -1,29 +1,103 @@
 import torch
 from PIL import Image
+import numpy as np
+from typing import List, Tuple, Union
 from transformers import CLIPModel, CLIPProcessor
 from common import InferenceImageEmbeddingComponent
+from models.LoadingPolicy import LoadingPolicy
+from models.ClipTensorPreprocessor import ClipTensorPreprocessor
 
 class ViTB32Infer(InferenceImageEmbeddingComponent):
     def __init__(
         self,
         model_name: str = "openai/clip-vit-base32",
-        device: str = "cuda"
+        device: str = "cuda",
+        loading_policy: LoadingPolicy = None,
     ):
         super().__init__()
         self.device = torch.device(device)
+        self.model_name = model_name
 
         # Load both model & processor from Hugging Face—caches locally by default
-        self.model = CLIPModel.from_pretrained(model_name).to(self.device)
+        policy = loading_policy or LoadingPolicy()
+        self.model = policy.finalize(CLIPModel.from_pretrained(model_name, **policy.pretrained_kwargs()), self.device)
+        # Pixels are fed in the weights' dtype; embeddings are always returned as fp32
+        self.dtype = policy.torch_dtype
         self.processor = CLIPProcessor.from_pretrained(model_name)
+        self.tensor_preprocessor = ClipTensorPreprocessor(self.processor.image_processor)
 
         self.model.eval()
-        self.logger.info(f"{model_name} loaded on {self.device}")
+        self.logger.info(f"{model_name} loaded on {self.device} ({policy})")
 
     def encode_image(self, image: Image.Image) -> torch.Tensor:
         self.logger.debug("Encoding image to CLIP embedding")
         # The processor returns a dict with pixel_values already batched
         inputs = self.processor(images=image, return_tensors="pt")
-        pixel_values = inputs.pixel_values.to(self.device)
+        pixel_values = inputs.pixel_values.to(self.device, dtype=self.dtype)
         with torch.no_grad():
             emb = self.model.get_image_features(pixel_values)
-        return emb
\ No newline at end of file
+        return emb.float()
+
+    def warmup(self):
+        """Encode a synthetic image once so the first request does not pay kernel setup."""
+        self.encode_image(Image.new("RGB", (224, 224), (96, 64, 48)))
+
+    def encode_images(self, images: List[Image.Image], batch_size: int = 32) -> torch.Tensor:
+        """
+        Encode many images with one forward pass per `batch_size` chunk.
+        Returns a (len(images), D) tensor, row i being the embedding of images[i].
+        """
+        if not images:
+            raise ValueError("encode_images() needs at least one image")
+        self.logger.debug(f"Encoding {len(images)} images in batches of {batch_size}")
+        embs = []
+        for start in range(0, len(images), batch_size):
+            inputs = self.processor(images=images[start:start + batch_size], return_tensors="pt")
+            pixel_values = inputs.pixel_values.to(self.device, dtype=self.dtype)
+            with torch.no_grad():
+                embs.append(self.model.get_image_features(pixel_values).float())
+        return torch.cat(embs, dim=0)
+
+    def encode_array(
+        self,
+        images: Union[np.ndarray, torch.Tensor],
+        batch_size: int = 32,
+        channels_last: bool = True
+    ) -> torch.Tensor:
+        """
+        Encode a stacked uint8 batch (N, H, W, 3) — or (N, 3, H, W) with
+        channels_last=False — preprocessed on-tensor instead of through CLIPProcessor.
+        Returns a (N, D) tensor, row i being the embedding of images[i].
+        """
+        if len(images) == 0:
+            raise ValueError("encode_array() needs at least one image")
+        self.logger.debug(f"Encoding {len(images)} array images in batches of {batch_size}")
+        embs = []
+        for start in range(0, len(images), batch_size):
+            pixel_values = self.tensor_preprocessor(
+                images[start:start + batch_size], channels_last=channels_last, device=self.device
+            )
+            with torch.no_grad():
+                embs.append(self.model.get_image_features(pixel_values.to(self.dtype)).float())
+        return torch.cat(embs, dim=0)
+
+    def encode_dense(self, image: Image.Image) -> Tuple[torch.Tensor, Tuple[int, int]]:
+        """
+        Single vision-tower pass over the whole image, projecting every ViT patch
+        token into the joint CLIP space (7x7 cells for ViT-B/32 at 224px).
+        Returns a (rows * cols, D) tensor in row-major cell order and (rows, cols).
+        """
+        vision_cfg = self.model.config.vision_config
+        side = vision_cfg.image_size
+        grid = side // vision_cfg.patch_size
+
+        # Resize instead of the processor's center-crop so the grid spans the whole image
+        resized = image.convert("RGB").resize((side, side), Image.BICUBIC)
+        inputs = self.processor(images=resized, return_tensors="pt")
+        pixel_values = inputs.pixel_values.to(self.device, dtype=self.dtype)
+        with torch.no_grad():
+            hidden = self.model.vision_model(pixel_values=pixel_values).last_hidden_state
+            # Drop the CLS token; apply the same head as the pooled output
+            tokens = self.model.vision_model.post_layernorm(hidden[:, 1:, :])
+            emb = self.model.visual_projection(tokens)[0].float()
+        return emb, (grid, grid)
@@ -1,3 +1,9 @@
-from models.ModelManager import ModelManager
-from models.MediapipeHairSegmenter import MediapipeHairSegmenter
-from models.ViTB32Infer import ViTB32Infer
\ No newline at end of file
+from common.LazyModule import lazy_exports
+
+# Model modules import torch / transformers / mediapipe; load them on first use.
+lazy_exports(__name__, {
+    "ModelManager": "models.ModelManager",
+    "MediapipeHairSegmenter": "models.MediapipeHairSegmenter",
+    "ViTB32Infer": "models.ViTB32Infer",
+    "ViTB32CpuInfer": "models.ViTB32CpuInfer",
+})
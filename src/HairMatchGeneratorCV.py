@@ -4,7 +4,7 @@ from PIL import Image
 from datetime import datetime
 from common import BaseComponent
 from models.HairSegmenter import HairSegmenter
-from src.helpers import HairSwatchMatcherCV
+from src.helpers import HairSwatchMatcherCV, PaletteExtractor
 from config.loader import settings
 
 
@@ -21,22 +21,43 @@ class HairMatchGeneratorCV(BaseComponent):
         self.artefacts_dir = general_config.get("artefacts_dir", "./artefacts")
 
         self.logger = logging.getLogger(__name__)
-        self.matcher = HairSwatchMatcherCV()
+        features = config.get("features", "stats")
+        if features not in ("stats", "palette"):
+            raise ValueError(f"Invalid features: {features}. Must be 'stats' or 'palette'.")
+        palette = None
+        if features == "palette":
+            palette = PaletteExtractor(
+                n_colors=config.get("palette_colors", 4),
+                pixel_budget=config.get("palette_pixel_budget", 2048),
+                iters=config.get("palette_iters", 20)
+            )
+        self.matcher = HairSwatchMatcherCV(
+            metric=config.get("metric", "ciede2000"),
+            candidates=config.get("candidates", 32),
+            max_side=config.get("max_side", 128),
+            palette=palette
+        )
         self.segmenter = HairSegmenter()
 
+        self.top_k = config.get("top_k", 5)
         self.class_name = self.__class__.__name__
         self.artefacts_subdir = os.path.join(self.artefacts_dir, self.class_name)
         os.makedirs(self.artefacts_subdir, exist_ok=True)
 
-        self.swatch_images = []
-        for fname in os.listdir(self.swatch_path):
+        # Swatch features are computed once; decoded images are dropped as we go
+        self.matcher.fit(self._iter_swatches())
+        self.logger.info(f"Indexed {len(self.matcher.swatch_names)} swatches")
+
+    def _iter_swatches(self):
+        """Yields (swatch_name, image) one at a time so only one swatch is decoded at once."""
+        for fname in sorted(os.listdir(self.swatch_path)):
             if fname.lower().endswith((".png", ".jpg", ".jpeg")):
                 try:
                     img = Image.open(os.path.join(self.swatch_path, fname)).convert("RGB")
-                    swatch_name = os.path.splitext(fname)[0]
-                    self.swatch_images.append((swatch_name, img))
                 except Exception as e:
                     self.logger.warning(f"Could not load swatch {fname}: {e}")
+                    continue
+                yield os.path.splitext(fname)[0], img
 
     def match(self, image_data: str) -> str:
         """
@@ -59,13 +80,15 @@ class HairMatchGeneratorCV(BaseComponent):
             input_path = os.path.join(self.artefacts_subdir, f"{img_id}_input.png")
             img.save(input_path)
 
-            cropped_hair = self.segmenter.infer(img)
+            # Colour statistics come from the hair pixels of the ROI only
+            hair_roi, hair_mask, _ = self.segmenter.segment(img)
 
             mask_path = os.path.join(self.artefacts_subdir, f"{img_id}_hair_mask.png")
-            cropped_hair.save(mask_path)
+            Image.fromarray(hair_mask).save(mask_path)
 
-            match = self.matcher.match(cropped_hair, self.swatch_images)
-            return match
+            ranking = self.matcher.match_topk(hair_roi, k=self.top_k, mask=hair_mask)
+            self.logger.info(f"Closest swatches: {ranking}")
+            return ranking[0]["name"]
 
         except Exception as e:
             self.logger.error(f"Hair matching failed: {e}")
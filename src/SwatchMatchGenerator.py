@@ -1,4 +1,4 @@
-from typing import List, Union, Tuple
+from typing import Any, Dict, List, Optional, Union, Tuple
 from PIL import Image
 import Levenshtein
 import logging
@@ -14,6 +14,9 @@ class SwatchMatchGenerator(BaseComponent):
     A class that uses QwenV25Infer to analyze portrait images and generate matching swatch names.
     """
 
+    # Per-request question asked after the image when the catalog prompt is prefix-cached
+    PORTRAIT_QUESTION = "Which of the available swatches best matches the hair color in this portrait?"
+
     def __init__(self ,**kwargs):
         """
         Initialize the SwatchMatchGenerator.
@@ -23,6 +26,19 @@ class SwatchMatchGenerator(BaseComponent):
         self.device = torch.device(swatch_gen_settings.get("device", "cpu"))
         self.vlm_candidate = swatch_gen_settings["vlm_candidate"]
         model_classes = swatch_gen_settings.get("models", [self.vlm_candidate])
+        self.constrained_decoding = swatch_gen_settings.get("constrained_decoding", False)
+        self.likelihood_scoring = swatch_gen_settings.get("likelihood_scoring", False)
+        self.prefix_cache = swatch_gen_settings.get("prefix_cache", False)
+        self.batch_size = swatch_gen_settings.get("batch_size", 4)
+        # 1.0 leaves raw sequence likelihoods; fit with fit_scoring_temperature()
+        self.scoring_temperature = swatch_gen_settings.get("scoring_temperature", 1.0)
+        self.scoring_chunk_size = swatch_gen_settings.get("scoring_chunk_size", 8)
+        # Optional vision resolution / resampling overrides forwarded to the VLM
+        self.vision_kwargs = {
+            key: swatch_gen_settings[key]
+            for key in ("image_size", "resample")
+            if swatch_gen_settings.get(key) is not None
+        }
 
         ModelManager.initialize_models(self.device, model_classes)
         self.vlm_model = getattr(ModelManager, self.vlm_candidate)
@@ -47,6 +63,115 @@ class SwatchMatchGenerator(BaseComponent):
         swatch_list = ", ".join(swatch_names)
         return f"Looking at this portrait image, which of the following hair color swatches would be the best match? Available swatches: {swatch_list}. Please respond with exactly one swatch name from the list."
 
+    def _format_catalog_prompt(self, swatch_names: List[str]) -> str:
+        """
+        Static part of the prompt (instruction + catalog), placed before the image
+        so its KV cache can be reused across requests.
+
+        Args:
+            swatch_names (List[str]): List of available swatch names.
+
+        Returns:
+            str: Static prompt prefix.
+        """
+        swatch_list = ", ".join(swatch_names)
+        return f"You match portraits to hair color swatches. Available swatches: {swatch_list}. Always respond with exactly one swatch name from the list."
+
+    def _rank_catalog(self, image: Union[str, Image.Image, bytes]) -> List[Tuple[str, float]]:
+        """[(swatch name, sequence log-likelihood), ...] for every distinct catalog name."""
+        candidates = list(dict.fromkeys(self.color_names))
+        prompt = self._format_prompt(self.color_names)
+        return self.vlm_model.rank_candidates(
+            image_data=image, prompt=prompt, candidates=candidates,
+            chunk_size=self.scoring_chunk_size, **self.vision_kwargs
+        )
+
+    def score(self, image: Union[str, Image.Image, bytes]) -> List[Dict[str, Any]]:
+        """
+        Likelihood-rank every swatch name for the given portrait in one prefill.
+
+        Args:
+            image: Portrait image as file path, PIL Image, or bytes.
+
+        Returns:
+            List[Dict[str, Any]]: [{"name", "image", "log_prob", "probability"}, ...]
+            sorted by probability, where probabilities are a softmax over the
+            catalog's sequence log-likelihoods divided by `scoring_temperature`.
+            They are only calibrated once the temperature has been fitted with
+            fit_scoring_temperature(); the default 1.0 keeps the raw likelihoods.
+
+        Raises:
+            ValueError: If inputs are invalid or empty.
+        """
+        if not image:
+            raise ValueError("Image data cannot be empty")
+
+        ranked = self._rank_catalog(image)
+        log_probs = torch.tensor([lp for _, lp in ranked], dtype=torch.float64)
+        probs = torch.softmax(log_probs / self.scoring_temperature, dim=0).tolist()
+        results = [
+            {
+                "name": name,
+                "image": self.swatch_details.get_image_name(name),
+                "log_prob": lp,
+                "probability": p,
+            }
+            for (name, lp), p in zip(ranked, probs)
+        ]
+        return sorted(results, key=lambda r: r["probability"], reverse=True)
+
+    def fit_scoring_temperature(self, labels: Dict[Union[str, bytes], str]) -> Dict[str, float]:
+        """
+        Temperature scaling (Guo et al., 2017): fits the single `scoring_temperature`
+        that minimises the negative log-likelihood of the expected swatches under
+        score()'s softmax, and sets it on this instance.
+
+        Args:
+            labels: Mapping of portrait (file path or bytes) -> expected swatch name.
+
+        Returns:
+            Dict[str, float]: {"temperature", "nll_before" (at T = 1), "nll_after"}.
+
+        Raises:
+            ValueError: If no label names a swatch of the catalog.
+        """
+        rows, targets = [], []
+        for image, expected in labels.items():
+            ranked = self._rank_catalog(image)
+            names = [name for name, _ in ranked]
+            if expected not in names:
+                self.logger.warning(f"Skipping label {expected!r}: not a swatch of the catalog")
+                continue
+            rows.append([lp for _, lp in ranked])
+            targets.append(names.index(expected))
+        if not rows:
+            raise ValueError("No labelled portrait names a swatch of the catalog")
+
+        log_probs = torch.tensor(rows, dtype=torch.float64)
+        target = torch.tensor(targets)
+        # Optimise log T so the temperature stays positive
+        log_t = torch.zeros(1, dtype=torch.float64, requires_grad=True)
+        optimizer = torch.optim.LBFGS([log_t], lr=0.1, max_iter=200, line_search_fn="strong_wolfe")
+
+        def closure():
+            optimizer.zero_grad()
+            loss = torch.nn.functional.cross_entropy(log_probs / log_t.exp(), target)
+            loss.backward()
+            return loss
+
+        optimizer.step(closure)
+        with torch.no_grad():
+            temperature = float(log_t.exp())
+            nll_before = float(torch.nn.functional.cross_entropy(log_probs, target))
+            nll_after = float(torch.nn.functional.cross_entropy(log_probs / temperature, target))
+
+        self.scoring_temperature = temperature
+        self.logger.info(
+            f"Scoring temperature fitted on {len(rows)} portraits: T={temperature:.3f} "
+            f"(NLL {nll_before:.3f} -> {nll_after:.3f})"
+        )
+        return {"temperature": temperature, "nll_before": nll_before, "nll_after": nll_after}
+
     def match(self, image: Union[str, Image.Image, bytes]) -> str:
         """
         Generate a matching swatch name for the given portrait image.
@@ -64,9 +189,54 @@ class SwatchMatchGenerator(BaseComponent):
         if not image:
             raise ValueError("Image data cannot be empty")
 
+        if self.likelihood_scoring and hasattr(self.vlm_model, "rank_candidates"):
+            best = self.score(image)[0]
+            self.logger.info(
+                f"Likelihood match for swatch: {best['name']} (image: {best['image']}, "
+                f"p={best['probability']:.3f})"
+            )
+            return best["name"]
+
+        constrained = self.constrained_decoding and hasattr(self.vlm_model, "infer_constrained")
         prompt = self._format_prompt(self.color_names)
-        response = self.vlm_model.infer(image_data=image, prompt=prompt)
 
+        if self.prefix_cache and hasattr(self.vlm_model, "infer_with_prefix_cache"):
+            response, stats = self.vlm_model.infer_with_prefix_cache(
+                image_data=image,
+                static_prompt=self._format_catalog_prompt(self.color_names),
+                prompt=self.PORTRAIT_QUESTION,
+                candidates=self.color_names if constrained else None,
+                **self.vision_kwargs,
+            )
+            self.logger.info(f"Prefill tokens saved by prefix cache: {stats['cached_prefix_tokens']}")
+        elif constrained:
+            response = self.vlm_model.infer_constrained(
+                image_data=image, prompt=prompt, candidates=self.color_names, **self.vision_kwargs
+            )
+        else:
+            response = self.vlm_model.infer(image_data=image, prompt=prompt, **self.vision_kwargs)
+
+        # Constrained decoding can only emit a catalog name, so no repair is needed
+        if constrained:
+            image_name = self.swatch_details.get_image_name(response)
+            self.logger.info(f"Constrained match for swatch: {response} (image: {image_name})")
+            return response
+
+        return self._resolve_response(response)
+
+    def _resolve_response(self, response: str) -> str:
+        """
+        Map a free-form model response onto a swatch name.
+
+        Args:
+            response (str): Raw model output.
+
+        Returns:
+            str: Name of the matching swatch.
+
+        Raises:
+            ValueError: If no swatch name is close enough to the response.
+        """
         # Ensure the response is one of the provided swatch names
         response = response.strip()
         response_lower = response.lower()
@@ -86,8 +256,48 @@ class SwatchMatchGenerator(BaseComponent):
             image_name = next((k for k, v in self.swatch_details.items() if v == closest_match[0]), None)
             self.logger.info(
                 f"Found close match: '{closest_match[0]}' (image: {image_name}) for response: '{response}'")
-            return image_name
+            return closest_match[0]
         else:
             self.logger.error(f"No matching swatch found for response: '{response}'")
             raise ValueError(f"Model response '{response}' is not in the provided swatch names list")
-        
+
+    def match_batch(self, images: List[Union[str, Image.Image, bytes]]) -> List[Optional[str]]:
+        """
+        Generate matching swatch names for many portraits, running the VLM on
+        micro-batches of `batch_size` images per generate() call.
+
+        Args:
+            images: Portrait images as file paths, PIL Images, or bytes.
+
+        Returns:
+            List[Optional[str]]: One swatch name per image, in order; None where the
+            response could not be mapped to a swatch.
+
+        Raises:
+            ValueError: If inputs are invalid or empty.
+        """
+        if not images or any(not image for image in images):
+            raise ValueError("Image data cannot be empty")
+
+        constrained = self.constrained_decoding and hasattr(self.vlm_model, "infer_constrained")
+        prompt = self._format_prompt(self.color_names)
+
+        results: List[Optional[str]] = []
+        for start in range(0, len(images), self.batch_size):
+            chunk = images[start:start + self.batch_size]
+            responses = self.vlm_model.infer_batch(
+                chunk,
+                [prompt] * len(chunk),
+                candidates=self.color_names if constrained else None,
+                **self.vision_kwargs,
+            )
+            for response in responses:
+                if constrained:
+                    results.append(response)
+                    continue
+                try:
+                    results.append(self._resolve_response(response))
+                except ValueError:
+                    results.append(None)
+            self.logger.info(f"Matched {len(results)}/{len(images)} portraits")
+        return results
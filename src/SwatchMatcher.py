@@ -7,11 +7,40 @@ from common import BaseComponent
 from config.loader import settings, artifacts_dir
 from models import ModelManager
 from src.helpers.PatchMatcher import PatchMatcher
-from typing import Union
+from src.helpers.SwatchEmbeddingIndex import SwatchEmbeddingIndex
+from src.helpers.MicroBatchEmbedder import MicroBatchEmbedder
+from src.helpers.MultiVectorSwatchIndex import MultiVectorSwatchIndex
+from src.helpers.ExactVectorIndex import ExactVectorIndex
+from src.helpers.IVFVectorIndex import IVFVectorIndex
+from typing import Any, Dict, List, Optional, Tuple, Union
 from uuid import uuid4
 
 
 class SwatchMatcher(BaseComponent):
+    """
+    Matches the segmented hair of a portrait against the swatch catalog.
+
+    `embedding_mode` selects how embeddings are compared:
+      - "pooled" (default): one vector per swatch and per hair patch, scored by
+        PatchMatcher (e.g. ViTB32Infer)
+      - "multi_vector": late interaction between the multi-vector embedding of
+        the hair region and every swatch's, via MultiVectorSwatchIndex
+        (embedding_candidate must be a multi-vector embedder such as ColPaliInfer)
+
+    MaxSim scores are not on the pooled CLIP cosine scale, so multi_vector mode
+    uses its own `multi_vector_threshold` (None: always return the best swatch)
+    instead of `threshold`.
+    """
+    EMBEDDING_MODES = ("pooled", "multi_vector")
+    # Pooled-mode settings and the values at which they have no effect
+    POOLED_ONLY_DEFAULTS = {
+        "embedding_index_dir": None,
+        "patch_min_coverage": 0.0,
+        "max_patches": None,
+        "patch_source": "crops",
+        "patch_preprocessing": "processor",
+    }
+
     def __init__(self, threshold: float = None):
         super().__init__()
 
@@ -30,32 +59,116 @@ class SwatchMatcher(BaseComponent):
 
         # Determine threshold
         self.threshold = threshold if threshold is not None else cfg.get("threshold", 0.93)
+        # MaxSim scale, only used in multi_vector mode
+        self.multi_vector_threshold = cfg.get("multi_vector_threshold")
+
+        self.embedding_mode = cfg.get("embedding_mode", "pooled")
+        if self.embedding_mode not in self.EMBEDDING_MODES:
+            raise ValueError(f"Invalid embedding_mode: {self.embedding_mode}. Must be one of {list(self.EMBEDDING_MODES)}.")
+        if self.embedding_mode == "multi_vector":
+            ignored = self._ignored_pooled_settings(cfg)
+            if ignored:
+                self.logger.warning(f"embedding_mode 'multi_vector' ignores pooled-mode settings: {', '.join(ignored)}")
+            self.patch_matcher = None
+            self.swatch_index = MultiVectorSwatchIndex(
+                index_dir=os.path.join(self.project_root, cfg.get("multi_vector_index_dir", "dataset/swatch_index_mv")),
+                embedder=self.embedder,
+                batch_size=cfg.get("multi_vector_batch_size", 4)
+            ).load(swatch_path)
+            self.swatches = [{"name": name} for name in self.swatch_index.swatch_names]
+            return
+        self.swatch_index = None
+
+        # Load swatch embeddings, from the persistent index when one is configured.
+        # Its matrix stays memory-mapped so an approximate vector index only
+        # reads the shortlisted rows back from disk.
+        index_dir = cfg.get("embedding_index_dir")
+        swatch_store = None
+        if index_dir:
+            names, swatch_store = SwatchEmbeddingIndex(
+                index_dir=os.path.join(self.project_root, index_dir),
+                embedder=self.embedder,
+                batch_size=cfg.get("patch_batch_size", 32)
+            ).load_matrix(swatch_path)
+            self.swatches = [{"name": name} for name in names]
+        else:
+            swatch_dir = Path(swatch_path)
+            if not swatch_dir.is_dir():
+                raise ValueError(f"swatch_path must be a directory, got: {swatch_path}")
 
-        # Load swatches directory
-        swatch_dir = Path(swatch_path)
-        if not swatch_dir.is_dir():
-            raise ValueError(f"swatch_path must be a directory, got: {swatch_path}")
+            self.swatches = []
 
-        self.swatches = []
-        
-        for img_file in sorted(swatch_dir.iterdir()):
-            if img_file.suffix.lower() not in {".jpg", ".jpeg", ".png"}:
-                continue
-            img = Image.open(img_file).convert("RGB")
-            emb = self.embedder.encode_image(img)
-            self.swatches.append({"name": img_file.name, "embedding": emb})
+            for img_file in sorted(swatch_dir.iterdir()):
+                if img_file.suffix.lower() not in {".jpg", ".jpeg", ".png"}:
+                    continue
+                img = Image.open(img_file).convert("RGB")
+                emb = self.embedder.encode_image(img)
+                self.swatches.append({"name": img_file.name, "embedding": emb})
 
-        if not self.swatches:
-            raise ValueError(f"No valid swatch images found in {swatch_path}")
+            if not self.swatches:
+                raise ValueError(f"No valid swatch images found in {swatch_path}")
+
+        # Concurrent match() calls share the embedder through one micro-batching worker
+        batching = cfg.get("micro_batching", {}) or {}
+        if batching.get("enabled", False):
+            self.embedder = MicroBatchEmbedder.for_embedder(
+                self.embedder,
+                max_batch_size=batching.get("max_batch_size", 32),
+                max_wait_ms=batching.get("max_wait_ms", 5.0)
+            )
 
         # Instantiate the patch matcher
         self.patch_matcher = PatchMatcher(
             embedder=self.embedder,
             swatches=self.swatches,
-            threshold=self.threshold
+            threshold=self.threshold,
+            batch_size=cfg.get("patch_batch_size", 32),
+            min_coverage=cfg.get("patch_min_coverage", 0.0),
+            max_patches=cfg.get("max_patches"),
+            patch_source=cfg.get("patch_source", "crops"),
+            patch_preprocessing=cfg.get("patch_preprocessing", "processor"),
+            vector_index=self._build_vector_index(cfg.get("vector_index", {}) or {}),
+            search_k=(cfg.get("vector_index", {}) or {}).get("search_k", 10),
+            swatch_store=swatch_store
         )
 
-    def match(self, image_data: Union[bytes, str, Image.Image]) -> str:
+    @classmethod
+    def _ignored_pooled_settings(cls, cfg: Dict[str, Any]) -> List[str]:
+        """Names of the configured pooled-mode settings that multi_vector mode does not apply."""
+        ignored = [
+            key for key, default in cls.POOLED_ONLY_DEFAULTS.items()
+            if cfg.get(key, default) not in (default, None)
+        ]
+        if (cfg.get("micro_batching", {}) or {}).get("enabled", False):
+            ignored.append("micro_batching")
+        if (cfg.get("vector_index", {}) or {}).get("type", "exact") != "exact":
+            ignored.append("vector_index")
+        return ignored
+
+    @staticmethod
+    def _build_vector_index(index_cfg: Dict[str, Any]):
+        """
+        Vector index over the swatch embeddings from `swatch_matcher.args.vector_index`:
+          - type "exact" (default): brute-force matmul
+          - type "ivf": IVFVectorIndex(nlist, nprobe, pq_m, pq_bits)
+        """
+        index_type = index_cfg.get("type", "exact")
+        if index_type == "exact":
+            return ExactVectorIndex()
+        if index_type == "ivf":
+            return IVFVectorIndex(
+                nlist=index_cfg.get("nlist", 256),
+                nprobe=index_cfg.get("nprobe", 8),
+                pq_m=index_cfg.get("pq_m"),
+                pq_bits=index_cfg.get("pq_bits", 8)
+            )
+        raise ValueError(f"Invalid vector_index type: {index_type}. Must be 'exact' or 'ivf'.")
+
+    def _segment_hair(self, image_data: Union[bytes, str, Image.Image]) -> Optional[Image.Image]:
+        """
+        Loads the input image, segments the hair region and saves it as an artefact.
+        Returns None if segmentation fails.
+        """
         # Load input image
         if isinstance(image_data, bytes):
             img = Image.open(BytesIO(image_data)).convert("RGB")
@@ -72,15 +185,86 @@ class SwatchMatcher(BaseComponent):
             output_dir = str(uuid4())
         os.makedirs(output_dir, exist_ok=True)
 
-        # Segment hair and match patches
         try:
             hair_region = self.segmenter.infer(img)
         except Exception as e:
             self.logger.exception(f"Error segmenting hair: {e}")
-            return "Error segmenting hair"
+            return None
         hair_region.save(os.path.join(output_dir, "hair_region.png"))
-        best_name, best_score = self.patch_matcher.match(hair_region)
+        return hair_region
+
+    def match_with_stats(self, image_data: Union[bytes, str, Image.Image]) -> Tuple[str, float, Dict[str, int]]:
+        """
+        Best-matching swatch name (or "NO_MATCH" below the threshold), its score
+        and {"patches_total", "patches_scored", "patches_skipped"}. Returns
+        ("Error segmenting hair", -1.0, zero counts) if hair segmentation fails.
+        In "multi_vector" mode the hair region is embedded whole, so the patch
+        counts are zero.
+        """
+        no_patches = {"patches_total": 0, "patches_scored": 0, "patches_skipped": 0}
+        # Segment hair and match patches
+        hair_region = self._segment_hair(image_data)
+        if hair_region is None:
+            return "Error segmenting hair", -1.0, no_patches
+        if self.swatch_index is not None:
+            ranking = self._rank_multi_vector(hair_region, k=1)
+            best_name, best_score = ranking[0]["name"], ranking[0]["score"]
+            self.logger.info(f"Best match: {best_name} (MaxSim score: {best_score:.2f})")
+            if self.multi_vector_threshold is not None and best_score < self.multi_vector_threshold:
+                return "NO_MATCH", best_score, no_patches
+            return best_name, best_score, no_patches
+        best_name, best_score, stats = self.patch_matcher.match_with_stats(hair_region)
+
+        self.logger.info(
+            f"Best match: {best_name} (score: {best_score:.2f}, "
+            f"patches scored: {stats['patches_scored']}, skipped: {stats['patches_skipped']})"
+        )
+
+        return best_name, best_score, stats
+
+    def match(self, image_data: Union[bytes, str, Image.Image]) -> str:
+        best_name, _, _ = self.match_with_stats(image_data)
+        return best_name
+
+    def match_topk(
+        self,
+        image_data: Union[bytes, str, Image.Image],
+        k: int = 5,
+        aggregate: str = "max"
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+        """
+        Returns the k best swatches as [{"name", "score", "support"}, ...], best first,
+        from one embedding pass over the hair patches, together with
+        {"patches_total", "patches_scored", "patches_skipped"}. See
+        PatchMatcher.aggregate_topk() for the aggregation modes. Returns an empty
+        ranking if hair segmentation fails.
+        In "multi_vector" mode entries are {"name", "score"} ranked by MaxSim,
+        `aggregate` is ignored and the patch counts are zero.
+        """
+        no_patches = {"patches_total": 0, "patches_scored": 0, "patches_skipped": 0}
+        hair_region = self._segment_hair(image_data)
+        if hair_region is None:
+            return [], no_patches
+        if self.swatch_index is not None:
+            ranking = self._rank_multi_vector(hair_region, k=k)
+            self.logger.info(f"Top-{k} (MaxSim): {[r['name'] for r in ranking]}")
+            return ranking, no_patches
+        ranking, stats = self.patch_matcher.match_topk(hair_region, k=k, aggregate=aggregate)
+
+        self.logger.info(
+            f"Top-{k} ({aggregate}): {[r['name'] for r in ranking]} "
+            f"(patches scored: {stats['patches_scored']}, skipped: {stats['patches_skipped']})"
+        )
+
+        return ranking, stats
 
-        self.logger.info(f"Best match: {best_name} (score: {best_score:.2f})")
+    def _rank_multi_vector(self, hair_region: Image.Image, k: int) -> List[Dict[str, Any]]:
+        """Embeds the whole hair region once and ranks swatches by MaxSim."""
+        query = self.embedder.encode_image(hair_region.convert("RGB"))
+        return self.swatch_index.topk(query, k=k)
 
-        return best_name
\ No newline at end of file
+    def get_batching_stats(self) -> Optional[Dict[str, Any]]:
+        """Micro-batching queue / batch / wait statistics, or None when batching is disabled."""
+        if isinstance(self.embedder, MicroBatchEmbedder):
+            return self.embedder.get_stats()
+        return None
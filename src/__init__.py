@@ -1,3 +1,9 @@
-from src.SwatchMatcher import SwatchMatcher
-from src.SwatchMatchGenerator import SwatchMatchGenerator
-from src.HairMatchGeneratorCV import HairMatchGeneratorCV
\ No newline at end of file
+from common.LazyModule import lazy_exports
+
+# Matchers are imported on first access so that e.g. the OpenCV-only
+# HairMatchGeneratorCV does not pull in torch / transformers.
+lazy_exports(__name__, {
+    "SwatchMatcher": "src.SwatchMatcher",
+    "SwatchMatchGenerator": "src.SwatchMatchGenerator",
+    "HairMatchGeneratorCV": "src.HairMatchGeneratorCV",
+})
@@ -0,0 +1,84 @@
+import numpy as np
+
+
+class ColorDifference:
+    """
+    Vectorised perceptual colour differences in CIELAB.
+
+    Colours are (..., 3) arrays of (L*, a*, b*) with L* in [0, 100]; inputs
+    broadcast against each other like any NumPy binary operation.
+    """
+
+    @staticmethod
+    def opencv_lab_to_cielab(lab: np.ndarray) -> np.ndarray:
+        """OpenCV 8-bit Lab (L*255/100, a+128, b+128) -> CIELAB floats."""
+        lab = np.asarray(lab, dtype=np.float64)
+        return np.stack([lab[..., 0] * (100.0 / 255.0), lab[..., 1] - 128.0, lab[..., 2] - 128.0], axis=-1)
+
+    @staticmethod
+    def cie76(lab1: np.ndarray, lab2: np.ndarray) -> np.ndarray:
+        """Euclidean distance in CIELAB (Delta E*ab 1976)."""
+        return np.linalg.norm(np.asarray(lab1, dtype=np.float64) - np.asarray(lab2, dtype=np.float64), axis=-1)
+
+    @staticmethod
+    def ciede2000(lab1: np.ndarray, lab2: np.ndarray, kL: float = 1.0, kC: float = 1.0, kH: float = 1.0) -> np.ndarray:
+        """
+        Delta E 2000 (Sharma, Wu & Dalal, 2005). About 1.0 is a just-noticeable
+        difference; unlike Delta E 76 it corrects for the eye's lower
+        sensitivity to chroma differences in saturated colours and for hue
+        rotation in blues.
+        """
+        lab1 = np.asarray(lab1, dtype=np.float64)
+        lab2 = np.asarray(lab2, dtype=np.float64)
+        L1, a1, b1 = lab1[..., 0], lab1[..., 1], lab1[..., 2]
+        L2, a2, b2 = lab2[..., 0], lab2[..., 1], lab2[..., 2]
+
+        # a* rescaling towards neutral greys
+        c_bar = (np.hypot(a1, b1) + np.hypot(a2, b2)) / 2.0
+        c_bar7 = c_bar ** 7
+        g = 0.5 * (1.0 - np.sqrt(c_bar7 / (c_bar7 + 25.0 ** 7)))
+        a1p, a2p = (1.0 + g) * a1, (1.0 + g) * a2
+        c1p, c2p = np.hypot(a1p, b1), np.hypot(a2p, b2)
+        h1p = np.degrees(np.arctan2(b1, a1p)) % 360.0
+        h2p = np.degrees(np.arctan2(b2, a2p)) % 360.0
+
+        # Differences in lightness, chroma and hue
+        achromatic = (c1p * c2p) == 0
+        dlp = L2 - L1
+        dcp = c2p - c1p
+        dhp = h2p - h1p
+        dhp = np.where(dhp > 180.0, dhp - 360.0, np.where(dhp < -180.0, dhp + 360.0, dhp))
+        dhp = np.where(achromatic, 0.0, dhp)
+        dHp = 2.0 * np.sqrt(c1p * c2p) * np.sin(np.radians(dhp / 2.0))
+
+        # Means; the hue mean takes the short way round the circle
+        lp_bar = (L1 + L2) / 2.0
+        cp_bar = (c1p + c2p) / 2.0
+        h_sum = h1p + h2p
+        hp_bar = np.where(
+            np.abs(h1p - h2p) <= 180.0,
+            h_sum / 2.0,
+            np.where(h_sum < 360.0, (h_sum + 360.0) / 2.0, (h_sum - 360.0) / 2.0),
+        )
+        hp_bar = np.where(achromatic, h_sum, hp_bar)
+
+        t = (
+            1.0
+            - 0.17 * np.cos(np.radians(hp_bar - 30.0))
+            + 0.24 * np.cos(np.radians(2.0 * hp_bar))
+            + 0.32 * np.cos(np.radians(3.0 * hp_bar + 6.0))
+            - 0.20 * np.cos(np.radians(4.0 * hp_bar - 63.0))
+        )
+        d_theta = 30.0 * np.exp(-(((hp_bar - 275.0) / 25.0) ** 2))
+        cp_bar7 = cp_bar ** 7
+        r_c = 2.0 * np.sqrt(cp_bar7 / (cp_bar7 + 25.0 ** 7))
+        l50 = (lp_bar - 50.0) ** 2
+        s_l = 1.0 + 0.015 * l50 / np.sqrt(20.0 + l50)
+        s_c = 1.0 + 0.045 * cp_bar
+        s_h = 1.0 + 0.015 * cp_bar * t
+        r_t = -np.sin(np.radians(2.0 * d_theta)) * r_c
+
+        dl = dlp / (kL * s_l)
+        dc = dcp / (kC * s_c)
+        dh = dHp / (kH * s_h)
+        return np.sqrt(np.maximum(dl ** 2 + dc ** 2 + dh ** 2 + r_t * dc * dh, 0.0))
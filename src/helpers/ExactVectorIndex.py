@@ -0,0 +1,47 @@
+from typing import Tuple
+import numpy as np
+from src.helpers.VectorIndex import VectorIndex
+
+
+class ExactVectorIndex(VectorIndex):
+    """
+    Brute-force inner-product search: one (Q, D) x (D, N) matmul per query
+    block. The reference for recall measurements of the approximate indexes.
+    """
+    exact = True
+
+    def __init__(self, chunk: int = 65536):
+        """
+        chunk: number of reference vectors scored per matmul, bounding the
+               (Q, chunk) score buffer for very large catalogs
+        """
+        super().__init__()
+        self.chunk = chunk
+        self.vectors = None
+
+    def build(self, vectors: np.ndarray) -> "ExactVectorIndex":
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.ntotal, self.dim = self.vectors.shape
+        return self
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        queries = np.asarray(queries, dtype=np.float32)
+        if self.ntotal <= self.chunk:
+            return self._topk(queries @ self.vectors.T, k)
+
+        # Running top-k over reference chunks
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_ids = np.zeros((len(queries), 0), dtype=np.int64)
+        for start in range(0, self.ntotal, self.chunk):
+            scores, ids = self._topk(queries @ self.vectors[start:start + self.chunk].T, k)
+            merged_scores = np.concatenate([best_scores, scores], axis=1)
+            merged_ids = np.concatenate([best_ids, ids + start], axis=1)
+            best_scores, cols = self._topk(merged_scores, k)
+            best_ids = np.take_along_axis(merged_ids, cols, axis=1)
+        return best_scores, best_ids
+
+    def reconstruct(self, ids: np.ndarray) -> np.ndarray:
+        return self.vectors[np.asarray(ids, dtype=np.int64)]
+
+    def memory_bytes(self) -> int:
+        return 0 if self.vectors is None else self.vectors.nbytes
@@ -1,12 +1,57 @@
 import cv2
 import numpy as np
 from PIL import Image
-from typing import List, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
 from common import CallableComponent
+from src.helpers.ColorDifference import ColorDifference
+from src.helpers.LabSwatchIndex import LabSwatchIndex
+from src.helpers.PaletteExtractor import PaletteExtractor
 
 class HairSwatchMatcherCV(CallableComponent):
-    def __init__(self, resize_dim=(224, 224)):
+    """
+    Matches hair colour to swatches from Lab mean / std features.
+
+    metric:
+      - "cosine" / "euclidean": linear scan over the six mean / std features
+      - "ciede2000": KD-tree over the swatches' mean CIELAB colours, with the
+        `candidates` nearest re-ranked by CIEDE2000 (see LabSwatchIndex);
+        match_topk() distances are then perceptual Delta E 2000 values
+
+    With a `palette` extractor the mean / std features are replaced by
+    dominant-colour palettes: swatch palettes are computed once in fit() and
+    queries are ranked by PaletteExtractor.distance() (CIEDE2000 units),
+    whatever the metric.
+    """
+    METRICS = ("cosine", "euclidean", "ciede2000")
+
+    def __init__(
+        self,
+        resize_dim=(224, 224),
+        metric: str = "cosine",
+        candidates: int = 32,
+        max_side: int = 128,
+        palette: Optional[PaletteExtractor] = None
+    ):
+        """
+        resize_dim: size swatches and unmasked queries are resized to
+        max_side: longest side masked query ROIs are downscaled to (never upscaled)
+        palette: optional PaletteExtractor switching matching to palette features
+        """
+        if metric not in self.METRICS:
+            raise ValueError(f"Invalid metric: {metric}. Must be one of {list(self.METRICS)}.")
         self.resize_dim = resize_dim
+        self.max_side = max_side
+        self.metric = metric
+        self.candidates = candidates
+        self.lab_index: Optional[LabSwatchIndex] = None
+        self.palette = palette
+
+        # Compact swatch store filled by fit(): names plus an (N, 6) feature matrix
+        self.swatch_names: List[str] = []
+        self.swatch_features: Optional[np.ndarray] = None
+        # Palette mode: (N, K, 3) CIELAB colours and (N, K) weights
+        self.swatch_palettes: Optional[np.ndarray] = None
+        self.swatch_palette_weights: Optional[np.ndarray] = None
 
     def preprocess(self, image: Image.Image) -> np.ndarray:
         img = np.array(image.convert("RGB"))
@@ -15,31 +60,154 @@ class HairSwatchMatcherCV(CallableComponent):
         return img_lab
 
     def extract_features(self, img_lab: np.ndarray) -> np.ndarray:
-        # Mean and std of L, A, B channels
-        features = []
-        for i in range(3):
-            channel = img_lab[:, :, i]
-            features.append(np.mean(channel))
-            features.append(np.std(channel))
-        return np.array(features)
-
-    def match(self, query_img: Image.Image, swatch_imgs: List[Tuple[str, Image.Image]]) -> str:
-        query_lab = self.preprocess(query_img)
-        query_feat = self.extract_features(query_lab)
-
-        similarities = []
+        # Mean and std of L, A, B channels, interleaved as [L_mean, L_std, A_mean, ...]
+        pixels = img_lab.reshape(-1, 3)
+        return np.stack([pixels.mean(axis=0), pixels.std(axis=0)], axis=1).reshape(-1)
+
+    def extract_masked_features(self, roi: Union[Image.Image, np.ndarray], mask: np.ndarray) -> np.ndarray:
+        """
+        Lab mean / std (same layout as extract_features()) over the hair pixels
+        only. `roi` is an RGB hair region and `mask` its (h, w) mask, non-zero
+        on hair. Both are downscaled so the longest side is at most `max_side`,
+        so the cost follows the hair region, not the input resolution.
+        """
+        roi = np.asarray(roi.convert("RGB") if isinstance(roi, Image.Image) else roi)
+        mask = np.asarray(mask, dtype=np.uint8)
+        if roi.shape[:2] != mask.shape[:2]:
+            raise ValueError(f"ROI {roi.shape[:2]} and mask {mask.shape[:2]} sizes differ")
+
+        scale = self.max_side / max(roi.shape[:2])
+        if scale < 1.0:
+            size = (max(1, round(roi.shape[1] * scale)), max(1, round(roi.shape[0] * scale)))
+            roi = cv2.resize(roi, size, interpolation=cv2.INTER_AREA)
+            mask = cv2.resize(mask, size, interpolation=cv2.INTER_NEAREST)
+        if not mask.any():
+            raise ValueError("Hair mask is empty")
+
+        img_lab = cv2.cvtColor(np.ascontiguousarray(roi), cv2.COLOR_RGB2LAB)
+        mean, std = cv2.meanStdDev(img_lab, mask=mask)
+        return np.concatenate([mean, std], axis=1).reshape(-1)
+
+    def fit(self, swatch_imgs: Iterable[Tuple[str, Image.Image]]) -> "HairSwatchMatcherCV":
+        """
+        Computes swatch features once. `swatch_imgs` may be a generator so that
+        decoded images are released as soon as their features are extracted.
+        """
+        names, feats, palettes = [], [], []
         for name, swatch in swatch_imgs:
-            swatch_lab = self.preprocess(swatch)
-            swatch_feat = self.extract_features(swatch_lab)
-            sim = self.cosine_similarity(query_feat, swatch_feat)
-            similarities.append((name, sim))
+            names.append(name)
+            if self.palette is not None:
+                palettes.append(self.palette.extract(swatch))
+            else:
+                feats.append(self.extract_features(self.preprocess(swatch)))
+        if not names:
+            raise ValueError("fit() needs at least one swatch image")
+        self.swatch_names = names
+        if self.palette is not None:
+            self.swatch_palettes = np.stack([colors for colors, _ in palettes])
+            self.swatch_palette_weights = np.stack([weights for _, weights in palettes])
+            return self
+        self.swatch_features = np.stack(feats)
+        if self.metric == "ciede2000":
+            self.lab_index = self._build_lab_index(names, self.swatch_features)
+        return self
+
+    def _build_lab_index(self, names: List[str], features: np.ndarray) -> LabSwatchIndex:
+        return LabSwatchIndex(candidates=self.candidates).build(names, self.mean_lab(features))
+
+    @staticmethod
+    def mean_lab(features: np.ndarray) -> np.ndarray:
+        """CIELAB mean colour(s) from feature vector(s) laid out as extract_features() returns them."""
+        return ColorDifference.opencv_lab_to_cielab(np.asarray(features)[..., 0::2])
+
+    def _scores(self, query_feat: np.ndarray, swatch_features: np.ndarray) -> np.ndarray:
+        """Vectorised similarity of one query against every swatch row; higher is better."""
+        if self.metric == "cosine":
+            norms = np.linalg.norm(swatch_features, axis=1) * np.linalg.norm(query_feat)
+            return swatch_features @ query_feat / norms
+        return -np.linalg.norm(swatch_features - query_feat, axis=1)
+
+    def match_topk(
+        self,
+        query_img: Image.Image,
+        k: int = 5,
+        swatch_imgs: Optional[List[Tuple[str, Image.Image]]] = None,
+        mask: Optional[np.ndarray] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Returns the k closest swatches as [{"name", "distance"}, ...], closest first.
+        Distances are Delta E 2000 for metric "ciede2000", 1 - cosine similarity
+        for "cosine" and the feature-space distance for "euclidean". Uses the
+        swatches from fit() unless `swatch_imgs` is passed explicitly.
+        With `mask`, `query_img` is a hair ROI (as returned by HairSegmenter.segment())
+        and only its masked pixels are used; see extract_masked_features().
+        """
+        if self.palette is not None:
+            return self._match_palette(query_img, k, swatch_imgs, mask)
+
+        if swatch_imgs is not None:
+            names = [name for name, _ in swatch_imgs]
+            swatch_features = np.stack([self.extract_features(self.preprocess(s)) for _, s in swatch_imgs])
+            lab_index = self._build_lab_index(names, swatch_features) if self.metric == "ciede2000" else None
+        elif self.swatch_features is not None:
+            names, swatch_features, lab_index = self.swatch_names, self.swatch_features, self.lab_index
+        else:
+            raise ValueError("No swatches available: call fit() or pass swatch_imgs")
+
+        if mask is not None:
+            query_feat = self.extract_masked_features(query_img, mask)
+        else:
+            query_feat = self.extract_features(self.preprocess(query_img))
+
+        if lab_index is not None:
+            return lab_index.query(self.mean_lab(query_feat), k=k)
+
+        # Higher score = more similar
+        scores = self._scores(query_feat, swatch_features)
+        distances = 1.0 - scores if self.metric == "cosine" else -scores
+        order = np.argsort(distances, kind="stable")[:k]
+        return [{"name": names[i], "distance": float(distances[i])} for i in order]
+
+    def _match_palette(
+        self,
+        query_img: Union[Image.Image, np.ndarray],
+        k: int,
+        swatch_imgs: Optional[List[Tuple[str, Image.Image]]],
+        mask: Optional[np.ndarray]
+    ) -> List[Dict[str, Any]]:
+        """match_topk() on palette features."""
+        if swatch_imgs is not None:
+            names = [name for name, _ in swatch_imgs]
+            palettes = [self.palette.extract(s) for _, s in swatch_imgs]
+            swatch_colors = np.stack([colors for colors, _ in palettes])
+            swatch_weights = np.stack([weights for _, weights in palettes])
+        elif self.swatch_palettes is not None:
+            names, swatch_colors, swatch_weights = self.swatch_names, self.swatch_palettes, self.swatch_palette_weights
+        else:
+            raise ValueError("No swatches available: call fit() or pass swatch_imgs")
+
+        colors, weights = self.palette.extract(query_img, mask)
+        distances = self.palette.distance(colors, weights, swatch_colors, swatch_weights)
+        order = np.argsort(distances, kind="stable")[:k]
+        return [{"name": names[i], "distance": float(distances[i])} for i in order]
 
-        # Higher cosine similarity = more similar
-        best_match = max(similarities, key=lambda x: x[1])
-        return best_match[0]
+    def match(
+        self,
+        query_img: Image.Image,
+        swatch_imgs: Optional[List[Tuple[str, Image.Image]]] = None
+    ) -> str:
+        """
+        Returns the name of the best-matching swatch. Uses the features computed
+        by fit() unless `swatch_imgs` is passed explicitly.
+        """
+        return self.match_topk(query_img, k=1, swatch_imgs=swatch_imgs)[0]["name"]
 
     def cosine_similarity(self, a: np.ndarray, b: np.ndarray) -> float:
         return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
 
-    def __call__(self, query_img: Image.Image, swatch_imgs: List[Tuple[str, Image.Image]]) -> str:
-        return self.match(query_img, swatch_imgs)
\ No newline at end of file
+    def __call__(
+        self,
+        query_img: Image.Image,
+        swatch_imgs: Optional[List[Tuple[str, Image.Image]]] = None
+    ) -> str:
+        return self.match(query_img, swatch_imgs)
@@ -0,0 +1,110 @@
+from typing import Optional, Tuple
+import numpy as np
+from src.helpers.VectorIndex import VectorIndex
+from src.helpers.ProductQuantizer import ProductQuantizer
+
+
+class IVFVectorIndex(VectorIndex):
+    """
+    Inverted-file index: a k-means coarse quantiser splits the references into
+    `nlist` cells and a query only scores the references of its `nprobe`
+    closest cells. Cells are stored packed (sorted by cell, with offsets).
+
+    With `pq_m` set, references are stored as product-quantised codes
+    (pq_m bytes per vector instead of 4 * D) and scored from lookup tables.
+    Those scores (and reconstruct()) are approximate: use the index as a
+    shortlist and re-score its candidates from the exact vectors, e.g. a
+    memory-mapped embedding matrix (as PatchMatcher does).
+
+    Recall knobs: raise `nprobe` (more cells scanned), `nlist` (finer cells,
+    pair with nprobe) or `pq_m` (finer codes); see benchmark_vector_index.py.
+    """
+
+    def __init__(
+        self,
+        nlist: int = 256,
+        nprobe: int = 8,
+        pq_m: Optional[int] = None,
+        pq_bits: int = 8,
+        kmeans_iters: int = 10,
+        seed: int = 0
+    ):
+        super().__init__()
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.kmeans_iters = kmeans_iters
+        self.seed = seed
+        self.pq = ProductQuantizer(pq_m, pq_bits, kmeans_iters, seed) if pq_m else None
+        self.compressed = self.pq is not None
+
+        self.centroids = None     # (nlist, D), unit norm
+        self.list_offsets = None  # (nlist + 1,) cell c holds rows list_offsets[c]:list_offsets[c + 1]
+        self.ids = None           # (N,) original id of each packed row
+        self.rows = None          # (N,) packed row of each original id
+        self.vectors = None       # (N, D) float32 packed rows, without PQ
+        self.codes = None         # (N, pq_m) uint8 packed rows, with PQ
+
+    def build(self, vectors: np.ndarray) -> "IVFVectorIndex":
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.ntotal, self.dim = vectors.shape
+
+        # Spherical k-means: unit-norm centroids, cells assigned by inner product
+        centroids, _ = self.kmeans(vectors, self.nlist, iters=self.kmeans_iters, seed=self.seed)
+        self.centroids = centroids / np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+        assign = np.argmax(vectors @ self.centroids.T, axis=1)
+
+        self.ids = np.argsort(assign, kind="stable")
+        self.rows = np.empty_like(self.ids)
+        self.rows[self.ids] = np.arange(len(self.ids))
+        counts = np.bincount(assign, minlength=len(self.centroids))
+        self.list_offsets = np.concatenate([[0], np.cumsum(counts)])
+
+        packed = vectors[self.ids]
+        if self.pq is not None:
+            self.codes = self.pq.train(vectors).encode(packed)
+            self.vectors = None
+        else:
+            self.vectors = packed
+        self.logger.info(
+            f"IVF index: {self.ntotal} vectors in {len(self.centroids)} cells"
+            f"{f', PQ {self.pq.m}x{self.pq.ksub}' if self.pq else ''} ({self.memory_bytes() / 2**20:.1f} MB)"
+        )
+        return self
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        queries = np.asarray(queries, dtype=np.float32)
+        nprobe = min(self.nprobe, len(self.centroids))
+        _, probes = self._topk(queries @ self.centroids.T, nprobe)
+        tables = self.pq.lookup_tables(queries) if self.pq is not None else None
+
+        out_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        out_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        for qi, cells in enumerate(probes):
+            rows = np.concatenate([
+                np.arange(self.list_offsets[c], self.list_offsets[c + 1]) for c in cells
+            ])
+            if rows.size == 0:
+                continue
+            if tables is not None:
+                scores = self.pq.inner_products(tables[qi], self.codes[rows])
+            else:
+                scores = self.vectors[rows] @ queries[qi]
+            top_scores, cols = self._topk(scores[None, :], k)
+            n = top_scores.shape[1]
+            out_scores[qi, :n] = top_scores[0]
+            out_ids[qi, :n] = self.ids[rows[cols[0]]]
+        return out_scores, out_ids
+
+    def reconstruct(self, ids: np.ndarray) -> np.ndarray:
+        rows = self.rows[np.asarray(ids, dtype=np.int64)]
+        if self.pq is not None:
+            return self.pq.decode(self.codes[rows])
+        return self.vectors[rows]
+
+    def memory_bytes(self) -> int:
+        stored = self.codes if self.pq is not None else self.vectors
+        arrays = (stored, self.centroids, self.ids, self.rows, self.list_offsets)
+        total = sum(a.nbytes for a in arrays if a is not None)
+        if self.pq is not None and self.pq.codebooks is not None:
+            total += self.pq.codebooks.nbytes
+        return total
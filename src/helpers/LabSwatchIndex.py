@@ -0,0 +1,64 @@
+from typing import Any, Dict, List
+import numpy as np
+from common import BaseComponent
+from src.helpers.ColorDifference import ColorDifference
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # optional: brute-force candidate retrieval without scipy
+    cKDTree = None
+
+
+class LabSwatchIndex(BaseComponent):
+    """
+    Nearest-swatch search over mean CIELAB colours.
+
+    Candidates are retrieved by Euclidean distance in Lab (Delta E 76) from a
+    KD-tree (scipy's cKDTree; a vectorised linear scan when scipy is missing),
+    then re-ranked with CIEDE2000, so results carry perceptual distances where
+    ~1 is a just-noticeable difference. Because the two metrics can order
+    near neighbours differently, `candidates` >= k nearest points are re-ranked.
+    """
+
+    def __init__(self, candidates: int = 32, leafsize: int = 16):
+        """
+        candidates: Delta E 76 neighbours re-ranked with CIEDE2000 (at least k)
+        leafsize: KD-tree leaf size
+        """
+        super().__init__()
+        self.candidates = candidates
+        self.leafsize = leafsize
+        self.names: List[str] = []
+        self.colors = None
+        self.tree = None
+
+    def build(self, names: List[str], colors: np.ndarray) -> "LabSwatchIndex":
+        """names: N swatch names; colors: (N, 3) CIELAB mean colours."""
+        if len(names) != len(colors):
+            raise ValueError(f"Got {len(names)} names for {len(colors)} colours")
+        self.names = list(names)
+        self.colors = np.asarray(colors, dtype=np.float64)
+        self.tree = cKDTree(self.colors, leafsize=self.leafsize) if cKDTree is not None else None
+        return self
+
+    def query(self, color: np.ndarray, k: int = 5) -> List[Dict[str, Any]]:
+        """
+        The k swatches closest to the CIELAB `color`, as
+        [{"name", "distance"}, ...] sorted by CIEDE2000 distance (ascending).
+        """
+        if self.colors is None:
+            raise ValueError("build() must be called before query()")
+        k = min(k, len(self.names))
+        n_candidates = min(max(self.candidates, k), len(self.names))
+        color = np.asarray(color, dtype=np.float64)
+
+        if self.tree is not None:
+            _, idx = self.tree.query(color, k=n_candidates)
+            idx = np.atleast_1d(idx)
+        else:
+            d76 = ColorDifference.cie76(self.colors, color)
+            idx = np.argpartition(d76, n_candidates - 1)[:n_candidates]
+
+        d00 = ColorDifference.ciede2000(self.colors[idx], color)
+        order = np.argsort(d00, kind="stable")[:k]
+        return [{"name": self.names[idx[i]], "distance": float(d00[i])} for i in order]
@@ -0,0 +1,209 @@
+import time
+import queue
+import threading
+import numpy as np
+import torch
+from collections import Counter, deque
+from concurrent.futures import Future
+from common import BaseComponent
+from PIL import Image
+from typing import Any, Dict, List, Union
+
+
+class MicroBatchEmbedder(BaseComponent):
+    """
+    Micro-batching front for an image embedder shared between threads.
+
+    Callers enqueue images and get futures back; one worker thread drains the
+    queue into batches of at most `max_batch_size` items, waiting at most
+    `max_wait_ms` after the first item for more to arrive, and runs them through
+    the embedder's encode_images / encode_array. Only the worker (or a caller
+    holding the model lock) ever touches the wrapped model, which makes the
+    shared instance safe to use from concurrent requests.
+
+    Exposes encode_image / encode_images / encode_array with the embedder's
+    signatures, so PatchMatcher can use it in place of the embedder. Other
+    attributes are forwarded; forwarded methods run under the model lock.
+    Use for_embedder() to get the single batcher of a shared embedder.
+    """
+    _instances: Dict[int, "MicroBatchEmbedder"] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, embedder: Any, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        super().__init__()
+        self.embedder = embedder
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+
+        self._queue = queue.Queue()
+        self._model_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._waits_ms = deque(maxlen=10000)
+        self._items = 0
+        self._max_queue_depth = 0
+        self._closed = False
+
+        self._worker = threading.Thread(target=self._run, name=f"{self.__class__.__name__}-worker", daemon=True)
+        self._worker.start()
+
+    @classmethod
+    def for_embedder(cls, embedder: Any, **kwargs) -> "MicroBatchEmbedder":
+        """The batcher shared by every caller of `embedder` (created on first request)."""
+        with cls._instances_lock:
+            batcher = cls._instances.get(id(embedder))
+            if batcher is None or batcher._closed:
+                batcher = cls(embedder, **kwargs)
+                cls._instances[id(embedder)] = batcher
+            return batcher
+
+    def __getattr__(self, name):
+        if name == "embedder":
+            raise AttributeError(name)
+        attr = getattr(self.embedder, name)
+        if not callable(attr):
+            return attr
+
+        def locked(*args, **kwargs):
+            with self._model_lock:
+                return attr(*args, **kwargs)
+        return locked
+
+    # ------------------------------------------------------------------ clients
+
+    def submit(self, image: Union[Image.Image, np.ndarray, torch.Tensor], channels_last: bool = True) -> Future:
+        """
+        Enqueue one PIL image or one uint8 array (H, W, 3) — (3, H, W) with
+        channels_last=False — and return a Future resolving to its (D,) embedding.
+        """
+        if self._closed:
+            raise RuntimeError(f"{self.__class__.__name__} is closed")
+        if isinstance(image, Image.Image):
+            key = ("image",)
+        else:
+            key = ("array", tuple(image.shape), channels_last)
+        future = Future()
+        self._queue.put((key, image, future, time.perf_counter()))
+        depth = self._queue.qsize()
+        with self._stats_lock:
+            self._max_queue_depth = max(self._max_queue_depth, depth)
+        return future
+
+    def encode_image(self, image: Image.Image) -> torch.Tensor:
+        return self.submit(image).result().unsqueeze(0)
+
+    def encode_images(self, images: List[Image.Image], batch_size: int = None) -> torch.Tensor:
+        """
+        Embeds `images` as part of whatever batches the worker forms; `batch_size`
+        is accepted for compatibility and superseded by `max_batch_size`.
+        """
+        if not images:
+            raise ValueError("encode_images() needs at least one image")
+        futures = [self.submit(image) for image in images]
+        return torch.stack([f.result() for f in futures], dim=0)
+
+    def encode_array(
+        self,
+        images: Union[np.ndarray, torch.Tensor],
+        batch_size: int = None,
+        channels_last: bool = True
+    ) -> torch.Tensor:
+        """Same as encode_images() for a stacked uint8 batch (see the embedder's encode_array)."""
+        if len(images) == 0:
+            raise ValueError("encode_array() needs at least one image")
+        futures = [self.submit(image, channels_last=channels_last) for image in images]
+        return torch.stack([f.result() for f in futures], dim=0)
+
+    def close(self, timeout: float = None):
+        """Stop accepting work, finish queued requests and join the worker."""
+        self._closed = True
+        self._queue.put(None)
+        self._worker.join(timeout)
+
+    # ------------------------------------------------------------------ worker
+
+    def _collect(self, first) -> list:
+        """`first` plus whatever arrives within max_wait_ms, up to max_batch_size items."""
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Re-post the shutdown marker for the main loop
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _encode(self, key: tuple, payloads: list) -> torch.Tensor:
+        with self._model_lock:
+            if key[0] == "image":
+                if hasattr(self.embedder, "encode_images"):
+                    return self.embedder.encode_images(payloads, batch_size=len(payloads))
+                return torch.cat([self.embedder.encode_image(p).reshape(1, -1) for p in payloads], dim=0)
+            stacked = np.stack([np.asarray(p) for p in payloads])
+            if hasattr(self.embedder, "encode_array"):
+                return self.embedder.encode_array(stacked, batch_size=len(payloads), channels_last=key[2])
+            if not key[2]:
+                stacked = stacked.transpose(0, 2, 3, 1)
+            images = [Image.fromarray(np.ascontiguousarray(a)) for a in stacked]
+            return self.embedder.encode_images(images, batch_size=len(images))
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = self._collect(first)
+            started = time.perf_counter()
+
+            with self._stats_lock:
+                self._batch_sizes[len(batch)] += 1
+                self._items += len(batch)
+                self._waits_ms.extend((started - enqueued) * 1000.0 for *_, enqueued in batch)
+
+            # Items of different kinds / shapes in one drain are encoded as separate groups
+            groups: Dict[tuple, list] = {}
+            for key, payload, future, _ in batch:
+                groups.setdefault(key, []).append((payload, future))
+            for key, items in groups.items():
+                futures = [f for _, f in items]
+                try:
+                    embs = self._encode(key, [p for p, _ in items])
+                except Exception as e:
+                    self.logger.exception(f"Batch of {len(items)} failed: {e}")
+                    for future in futures:
+                        future.set_exception(e)
+                    continue
+                for future, emb in zip(futures, embs):
+                    future.set_result(emb)
+
+    # ------------------------------------------------------------------ stats
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Queue depth (current / max seen), batch-size histogram, batch and item
+        counts, and queue wait time in ms (mean / p50 / p95 / max over the most
+        recent 10k items).
+        """
+        with self._stats_lock:
+            waits = np.fromiter(self._waits_ms, dtype=np.float64)
+            batches = sum(self._batch_sizes.values())
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._max_queue_depth,
+                "batches": batches,
+                "items": self._items,
+                "mean_batch_size": round(self._items / batches, 2) if batches else 0.0,
+                "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+                "wait_ms": {
+                    "mean": round(float(waits.mean()), 3) if waits.size else 0.0,
+                    "p50": round(float(np.percentile(waits, 50)), 3) if waits.size else 0.0,
+                    "p95": round(float(np.percentile(waits, 95)), 3) if waits.size else 0.0,
+                    "max": round(float(waits.max()), 3) if waits.size else 0.0,
+                },
+            }
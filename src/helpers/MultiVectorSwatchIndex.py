@@ -0,0 +1,114 @@
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+import numpy as np
+import torch
+from PIL import Image
+from src.helpers.PersistentSwatchIndex import PersistentSwatchIndex
+
+
+class MultiVectorSwatchIndex(PersistentSwatchIndex):
+    """
+    Persistent late-interaction (MaxSim) index over multi-vector swatch
+    embeddings such as ColPaliInfer's, stored in `index_dir` as:
+      - vectors.npy: (T, D) float16, the token vectors of all swatches packed
+                     back to back
+      - offsets.npy: (N + 1,) int64, swatch i owns rows offsets[i]:offsets[i + 1]
+      - manifest.json: embedder key, preprocessing version and, per swatch,
+                       its file name, content hash and row in offsets
+
+    Like SwatchEmbeddingIndex, load() only re-encodes swatches that were added
+    or changed. Scoring a query against every swatch is one (Q, D) x (D, T)
+    matmul followed by a per-swatch max over each segment.
+    """
+    VECTORS_FILE = "vectors.npy"
+    OFFSETS_FILE = "offsets.npy"
+    DATA_FILES = (VECTORS_FILE, OFFSETS_FILE)
+
+    def __init__(self, index_dir: str, embedder: Any, batch_size: int = 4):
+        """
+        index_dir: directory holding the manifest, packed vectors and offsets
+        embedder: instance providing encode_images(List[Image], batch_size, as_numpy)
+                  -> List[(n_i, D)] (e.g. ColPaliInfer)
+        batch_size: number of swatches embedded per forward pass on (re)build
+        """
+        super().__init__(index_dir, embedder, batch_size)
+        self.swatch_names: List[str] = []
+        self.vectors: Optional[torch.Tensor] = None
+        self.offsets: Optional[np.ndarray] = None
+        self._segment_ids: Optional[torch.Tensor] = None
+
+    def _encode_files(self, files: List[Path]) -> List[np.ndarray]:
+        images = [Image.open(f).convert("RGB") for f in files]
+        embs = self.embedder.encode_images(images, batch_size=self.batch_size)
+        return [torch.as_tensor(e).float().cpu().numpy().astype(np.float16) for e in embs]
+
+    def _read_rows(self, rows: List[int]) -> List[np.ndarray]:
+        stored = np.load(self.index_dir / self.VECTORS_FILE, mmap_mode="r")
+        offsets = np.load(self.index_dir / self.OFFSETS_FILE)
+        return [stored[offsets[row]:offsets[row + 1]] for row in rows]
+
+    def _pack(self, embeddings: List[np.ndarray]) -> Dict[str, np.ndarray]:
+        lengths = np.array([len(e) for e in embeddings], dtype=np.int64)
+        return {
+            self.VECTORS_FILE: np.concatenate(embeddings, axis=0).astype(np.float16),
+            self.OFFSETS_FILE: np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64),
+        }
+
+    def load(self, swatch_path: str) -> "MultiVectorSwatchIndex":
+        """
+        Syncs the index with the swatch files in `swatch_path` (sorted file
+        order) and moves the packed vectors to the embedder's device. Returns self.
+        """
+        names, embeddings = self.sync(swatch_path)
+        lengths = np.array([len(e) for e in embeddings], dtype=np.int64)
+        vectors = np.concatenate(embeddings, axis=0)
+        self.logger.info(f"Multi-vector swatch index: {len(names)} swatches, {len(vectors)} vectors")
+
+        device = torch.device(getattr(self.embedder, "device", "cpu"))
+        # fp16 matmuls are slow (or missing) on CPU; accelerators keep the packed fp16
+        dtype = torch.float32 if device.type == "cpu" else torch.float16
+        self.swatch_names = names
+        self.offsets = np.concatenate([[0], np.cumsum(lengths)])
+        self.vectors = torch.from_numpy(vectors).to(device=device, dtype=dtype)
+        self._segment_ids = torch.repeat_interleave(
+            torch.arange(len(names)), torch.from_numpy(lengths)
+        ).to(device)
+        return self
+
+    def maxsim(self, queries: Union[torch.Tensor, np.ndarray, List]) -> torch.Tensor:
+        """
+        Late-interaction scores of one or more queries against every swatch.
+
+        queries: one (Q, D) query embedding, or a list of them
+        Returns a (num_queries, N) tensor: for each query token the best
+        matching token of the swatch, averaged over query tokens (so scores
+        stay on the cosine scale regardless of query length).
+        """
+        if self.vectors is None:
+            raise RuntimeError("load() must be called before scoring")
+        if not isinstance(queries, (list, tuple)):
+            queries = [queries]
+        q = [torch.as_tensor(x).to(device=self.vectors.device, dtype=self.vectors.dtype) for x in queries]
+        lengths = torch.tensor([len(x) for x in q], device=self.vectors.device)
+        packed = torch.cat(q, dim=0)
+
+        # (sum Q, T) similarities of every query token with every swatch token
+        sim = packed @ self.vectors.T
+        # Max over each swatch's token segment -> (sum Q, N)
+        n = len(self.swatch_names)
+        per_swatch = torch.full((sim.shape[0], n), float("-inf"), device=sim.device, dtype=sim.dtype)
+        per_swatch.scatter_reduce_(1, self._segment_ids.expand(sim.shape[0], -1), sim, reduce="amax")
+        # Mean over each query's tokens -> (num_queries, N)
+        query_ids = torch.repeat_interleave(torch.arange(len(q), device=sim.device), lengths)
+        scores = torch.zeros((len(q), n), device=sim.device, dtype=torch.float32)
+        scores.index_add_(0, query_ids, per_swatch.float())
+        return scores / lengths.unsqueeze(1).float()
+
+    def topk(self, query: Union[torch.Tensor, np.ndarray], k: int = 5) -> List[Dict[str, Any]]:
+        """The k best swatches for one (Q, D) query as [{"name", "score"}, ...], best first."""
+        scores = self.maxsim(query)[0]
+        top_scores, top_idx = scores.topk(min(k, len(self.swatch_names)))
+        return [
+            {"name": self.swatch_names[i], "score": score}
+            for score, i in zip(top_scores.tolist(), top_idx.tolist())
+        ]
@@ -0,0 +1,112 @@
+import cv2
+import numpy as np
+from PIL import Image
+from typing import Optional, Tuple, Union
+from common import BaseComponent
+from src.helpers.ColorDifference import ColorDifference
+
+
+class PaletteExtractor(BaseComponent):
+    """
+    Dominant-colour palette of an image region in CIELAB.
+
+    At most `pixel_budget` (masked) pixels are sampled at random, so the cost
+    does not depend on the input resolution; only the sampled pixels are
+    converted to Lab. `n_colors` centres are fitted with mini-batch k-means
+    (Sculley, 2010) and weighted by the share of sampled pixels they own.
+    """
+
+    def __init__(
+        self,
+        n_colors: int = 4,
+        pixel_budget: int = 2048,
+        iters: int = 20,
+        batch_size: int = 256,
+        seed: int = 0
+    ):
+        """
+        n_colors: palette size
+        pixel_budget: maximum number of pixels sampled per image
+        iters: mini-batch k-means iterations
+        batch_size: pixels per mini-batch
+        seed: sampling seed; fixed so the same image always gives the same palette
+        """
+        super().__init__()
+        self.n_colors = n_colors
+        self.pixel_budget = pixel_budget
+        self.iters = iters
+        self.batch_size = batch_size
+        self.seed = seed
+
+    def _sample_lab(self, image: np.ndarray, mask: Optional[np.ndarray], rng: np.random.Generator) -> np.ndarray:
+        """(n, 3) CIELAB values of up to `pixel_budget` randomly chosen (masked) pixels."""
+        pixels = image.reshape(-1, 3)
+        if mask is not None:
+            candidates = np.flatnonzero(np.asarray(mask).reshape(-1))
+        else:
+            candidates = np.arange(len(pixels))
+        if candidates.size == 0:
+            raise ValueError("No pixels to build a palette from (empty mask)")
+        if candidates.size > self.pixel_budget:
+            candidates = rng.choice(candidates, self.pixel_budget, replace=False)
+        sample = np.ascontiguousarray(pixels[candidates].reshape(-1, 1, 3), dtype=np.uint8)
+        lab = cv2.cvtColor(sample, cv2.COLOR_RGB2LAB).reshape(-1, 3)
+        return ColorDifference.opencv_lab_to_cielab(lab)
+
+    def extract(
+        self,
+        image: Union[Image.Image, np.ndarray],
+        mask: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (colors (n_colors, 3) CIELAB, weights (n_colors,)) sorted by
+        weight, heaviest first. Weights sum to 1. `image` is RGB; `mask`, if
+        given, selects the pixels to use (non-zero = use).
+        """
+        image = np.asarray(image.convert("RGB") if isinstance(image, Image.Image) else image)
+        rng = np.random.default_rng(self.seed)
+        x = self._sample_lab(image, mask, rng)
+
+        k = min(self.n_colors, len(x))
+        centers = x[rng.choice(len(x), k, replace=False)].copy()
+        counts = np.zeros(k)
+        for _ in range(self.iters):
+            batch = x[rng.integers(0, len(x), min(self.batch_size, len(x)))]
+            assign = np.argmin(((batch[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2), axis=1)
+            # Per-centre learning rate 1 / (points seen so far), applied in one step per batch
+            batch_counts = np.bincount(assign, minlength=k)
+            sums = np.zeros_like(centers)
+            np.add.at(sums, assign, batch)
+            seen = batch_counts > 0
+            counts[seen] += batch_counts[seen]
+            centers[seen] += (sums[seen] - batch_counts[seen, None] * centers[seen]) / counts[seen, None]
+
+        assign = np.argmin(((x[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2), axis=1)
+        weights = np.bincount(assign, minlength=k) / len(x)
+
+        # Pad to n_colors (tiny inputs) with zero-weight copies of the heaviest colour
+        order = np.argsort(-weights, kind="stable")
+        colors, weights = centers[order], weights[order]
+        if k < self.n_colors:
+            colors = np.concatenate([colors, np.repeat(colors[:1], self.n_colors - k, axis=0)])
+            weights = np.concatenate([weights, np.zeros(self.n_colors - k)])
+        return colors.astype(np.float32), weights.astype(np.float32)
+
+    @staticmethod
+    def distance(
+        colors: np.ndarray,
+        weights: np.ndarray,
+        palette_colors: np.ndarray,
+        palette_weights: np.ndarray
+    ) -> np.ndarray:
+        """
+        Weighted symmetric chamfer distance, in CIEDE2000 units, between one
+        palette (K, 3) / (K,) and N palettes (N, K', 3) / (N, K'): every colour
+        is matched to the closest colour of the other palette, weighted by its
+        own weight, averaged over both directions. Returns (N,) distances.
+        """
+        # (N, K, K') pairwise Delta E 2000 in one broadcast
+        d = ColorDifference.ciede2000(colors[None, :, None, :], palette_colors[:, None, :, :])
+        forward = (d.min(axis=2) * weights[None, :]).sum(axis=1)
+        backward = (d.min(axis=1) * palette_weights).sum(axis=1)
+        return 0.5 * (forward + backward)
@@ -1,6 +1,8 @@
 from common import BaseComponent
+from src.helpers.VectorIndex import VectorIndex
 from typing import List, Dict, Any, Tuple, Optional
 from PIL import Image
+import numpy as np
 import torch
 
 class PatchMatcher(BaseComponent):
@@ -8,17 +10,438 @@ class PatchMatcher(BaseComponent):
         self,
         embedder: Any,
         swatches: List[Dict[str, Any]],
-        threshold: float = 0.93
+        threshold: float = 0.93,
+        batch_size: int = 32,
+        min_coverage: float = 0.0,
+        max_patches: Optional[int] = None,
+        patch_source: str = "crops",
+        vector_index: Optional[VectorIndex] = None,
+        search_k: int = 10,
+        patch_preprocessing: str = "processor",
+        swatch_store: Optional[np.ndarray] = None
     ):
         """
         embedder: instance providing encode_image(Image) -> Tensor
-        swatches: list of {"name": str, "embedding": Tensor}
+                  (and optionally encode_images(List[Image], batch_size) -> Tensor
+                  or encode_array(uint8 batch, batch_size, channels_last) -> Tensor)
+        swatches: list of {"name": str, "embedding": Tensor}; with `swatch_store`
+                  only the names are used
         threshold: minimum cosine similarity to count as a match
+        batch_size: number of patches embedded per forward pass
+        min_coverage: minimum fraction of hair (non-background) pixels a patch
+                      needs to be embedded at all
+        max_patches: optional cap on embedded patches; the highest-coverage
+                     patches are kept first
+        patch_source: "crops" embeds each grid crop separately; "dense" takes one
+                      embedding per ViT grid cell from a single forward pass
+                      (embedder must provide encode_dense(Image))
+        vector_index: optional unbuilt VectorIndex over the swatch embeddings.
+                      None or an exact index keeps a unit-norm (S, D) matrix and
+                      scores every swatch with one matmul. An approximate index
+                      (e.g. IVFVectorIndex, with or without PQ) replaces that
+                      matrix: it shortlists `search_k` candidates per patch, only
+                      those are re-scored and scores stay sparse (patches x
+                      search_k). Re-scoring reads the shortlisted rows from
+                      `swatch_store` when given (exact), otherwise from the
+                      index's reconstruct() (approximate for PQ). Only the "max"
+                      and "vote" aggregates are valid with an approximate index.
+        search_k: candidates retrieved per patch from an approximate index
+        patch_preprocessing: "processor" crops PIL patches and embeds them like the
+                      swatches (default); "tensor" cuts them as strided array views
+                      and uses the embedder's encode_array (no per-patch PIL images)
+        swatch_store: optional (S, D) swatch embeddings aligned with `swatches`,
+                      e.g. the memory-mapped matrix of SwatchEmbeddingIndex.load_matrix();
+                      lets an approximate index re-score exactly without any
+                      float32 swatch matrix held in memory
         """
+        if patch_source not in ("crops", "dense"):
+            raise ValueError(f"Invalid patch_source: {patch_source}. Must be 'crops' or 'dense'.")
+        if patch_source == "dense" and not hasattr(embedder, "encode_dense"):
+            raise ValueError(f"{embedder.__class__.__name__} does not support dense patch embeddings")
+        if patch_preprocessing not in ("processor", "tensor"):
+            raise ValueError(f"Invalid patch_preprocessing: {patch_preprocessing}. Must be 'processor' or 'tensor'.")
+        if patch_preprocessing == "tensor" and not hasattr(embedder, "encode_array"):
+            raise ValueError(f"{embedder.__class__.__name__} does not support array patch embeddings")
         super().__init__()
         self.embedder = embedder
         self.swatches = swatches
         self.threshold = threshold
+        self.batch_size = batch_size
+        self.min_coverage = min_coverage
+        self.max_patches = max_patches
+        self.patch_source = patch_source
+        self.patch_preprocessing = patch_preprocessing
+
+        # An empty catalog scores nothing and every match is NO_MATCH.
+        self.swatch_names = [sw["name"] for sw in swatches]
+        self.swatch_matrix = None
+        self.swatch_store = swatch_store
+        self.search_k = search_k
+        self.vector_index = None
+        if not swatches:
+            self.logger.warning("No swatches given; every match will be NO_MATCH")
+        elif vector_index is not None and not vector_index.exact:
+            # The index replaces the dense matrix; the unit-norm copy it is
+            # built from is released once build() returns.
+            if swatch_store is not None:
+                vectors = np.asarray(swatch_store, dtype=np.float32)
+            else:
+                vectors = torch.cat([sw["embedding"].reshape(1, -1) for sw in swatches], dim=0).float().cpu().numpy()
+            vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            self.vector_index = vector_index.build(vectors)
+            del vectors
+            if swatch_store is None and vector_index.compressed:
+                self.logger.warning(
+                    "No swatch_store given: shortlisted swatches are re-scored from compressed "
+                    "(PQ) vectors, so scores are approximate"
+                )
+        else:
+            # Stack swatch embeddings once into a unit-norm (S, D) matrix so that
+            # scoring all patches against all swatches is a single matmul.
+            if swatch_store is not None:
+                embeddings = torch.from_numpy(np.asarray(swatch_store, dtype=np.float32))
+            else:
+                embeddings = torch.cat([sw["embedding"].reshape(1, -1) for sw in swatches], dim=0)
+            self.swatch_matrix = torch.nn.functional.normalize(embeddings, dim=-1)
+
+    @staticmethod
+    def _hair_mask(image: Image.Image) -> np.ndarray:
+        """
+        Boolean (H, W) mask of hair pixels. Uses the alpha channel when the
+        segmenter provides one, otherwise treats pure black as background.
+        """
+        if image.mode in ("RGBA", "LA"):
+            return np.asarray(image.getchannel("A")) > 0
+        return np.asarray(image.convert("L")) > 0
+
+    def _select_patches(
+        self,
+        image: Image.Image,
+        patch_size: Tuple[int, int],
+        stride: Optional[Tuple[int, int]]
+    ) -> Tuple[List[Tuple[int, int]], int]:
+        """
+        Lays a grid of patches over `image` and keeps those whose hair coverage
+        reaches `min_coverage`, capped at `max_patches` (highest coverage first).
+        Returns the kept (left, top) corners in row-major order and the total
+        number of grid patches.
+        """
+        w, h = image.size
+        pw, ph = patch_size
+        sx, sy = stride if stride is not None else (pw, ph)
+
+        tops = np.arange(0, h - ph + 1, sy)
+        lefts = np.arange(0, w - pw + 1, sx)
+        if tops.size == 0 or lefts.size == 0:
+            return [], 0
+
+        # Summed-area table: coverage of every patch in O(1) each.
+        mask = self._hair_mask(image).astype(np.int32)
+        integral = np.pad(mask.cumsum(axis=0).cumsum(axis=1), ((1, 0), (1, 0)))
+        t, l = np.meshgrid(tops, lefts, indexing="ij")
+        hair_pixels = (
+            integral[t + ph, l + pw] - integral[t, l + pw]
+            - integral[t + ph, l] + integral[t, l]
+        )
+        coverage = (hair_pixels / float(pw * ph)).reshape(-1)
+
+        keep = self._keep_indices(coverage)
+        corners = [(int(l.flat[i]), int(t.flat[i])) for i in keep]
+        return corners, int(coverage.size)
+
+    def _keep_indices(self, coverage: np.ndarray) -> np.ndarray:
+        """
+        Indices (ascending) of patches with coverage >= `min_coverage`, capped at
+        `max_patches` by highest coverage.
+        """
+        keep = np.flatnonzero(coverage >= self.min_coverage)
+        if self.max_patches is not None and keep.size > self.max_patches:
+            # Stable sort so equal-coverage patches keep their grid order.
+            by_coverage = keep[np.argsort(-coverage[keep], kind="stable")]
+            keep = np.sort(by_coverage[:self.max_patches])
+        return keep
+
+    def _dense_patches(self, image: Image.Image) -> Tuple[Optional[torch.Tensor], Dict[str, int]]:
+        """
+        Embeds the whole image once and keeps the ViT grid cells that pass the
+        coverage filter. Returns unit-norm (N, D) embeddings (None if no cell is
+        kept) and the patch statistics.
+        """
+        embs, (rows, cols) = self.embedder.encode_dense(image.convert("RGB"))
+
+        # Box-downsampling the mask to the grid gives each cell's hair fraction
+        mask = Image.fromarray(self._hair_mask(image).astype(np.uint8) * 255)
+        coverage = np.asarray(mask.resize((cols, rows), Image.BOX), dtype=np.float32).reshape(-1) / 255.0
+
+        keep = self._keep_indices(coverage)
+        stats = {
+            "patches_total": int(coverage.size),
+            "patches_scored": int(keep.size),
+            "patches_skipped": int(coverage.size - keep.size),
+        }
+        if keep.size == 0:
+            return None, stats
+        embs = embs[torch.as_tensor(keep, device=embs.device)]
+        return torch.nn.functional.normalize(embs, dim=-1), stats
+
+    def _encode_patches(self, patches: List[Image.Image]) -> torch.Tensor:
+        """
+        Embeds all patches, batched when the embedder supports it.
+        Returns a unit-norm (N, D) tensor.
+        """
+        if hasattr(self.embedder, "encode_images"):
+            embs = self.embedder.encode_images(patches, batch_size=self.batch_size)
+        else:
+            embs = torch.cat([self.embedder.encode_image(p).reshape(1, -1) for p in patches], dim=0)
+        return torch.nn.functional.normalize(embs, dim=-1)
+
+    def _encode_patch_array(
+        self,
+        rgb: np.ndarray,
+        corners: List[Tuple[int, int]],
+        patch_size: Tuple[int, int]
+    ) -> torch.Tensor:
+        """
+        Gathers the patches at `corners` from a sliding-window view of the (H, W, 3)
+        uint8 image in one fancy-indexing copy and embeds the (N, 3, ph, pw) stack.
+        Returns a unit-norm (N, D) tensor.
+        """
+        pw, ph = patch_size
+        # (H - ph + 1, W - pw + 1, 3, ph, pw) view; no pixels are copied here
+        windows = np.lib.stride_tricks.sliding_window_view(rgb, (ph, pw), axis=(0, 1))
+        lefts, tops = np.array(corners).T
+        patches = windows[tops, lefts]
+        embs = self.embedder.encode_array(patches, batch_size=self.batch_size, channels_last=False)
+        return torch.nn.functional.normalize(embs, dim=-1)
+
+    def _candidate_vectors(self, ids: np.ndarray) -> np.ndarray:
+        """Unit-norm (n, D) embeddings of swatches `ids` (sorted, unique) for re-scoring."""
+        if self.swatch_store is not None:
+            vectors = np.asarray(self.swatch_store[ids], dtype=np.float32)
+        else:
+            vectors = self.vector_index.reconstruct(ids)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    def _score(self, patch_embs: torch.Tensor) -> Tuple[torch.Tensor, Optional[torch.Tensor]]:
+        """
+        Cosine similarities of unit-norm patch embeddings against the swatches.
+
+        Returns (scores, None) with dense (patches x swatches) scores, or with an
+        approximate index (scores, ids): (patches x search_k) candidate scores,
+        best first, and their swatch indices (-1 / -inf for empty slots).
+        """
+        if self.vector_index is None:
+            swatch_matrix = self.swatch_matrix.to(device=patch_embs.device, dtype=patch_embs.dtype)
+            return patch_embs @ swatch_matrix.T, None
+
+        # The index only shortlists; the distinct candidates are re-scored once
+        # from their stored vectors so approximate (e.g. PQ) inner products
+        # never reach the threshold test.
+        queries = patch_embs.float().cpu().numpy()
+        _, top_ids = self.vector_index.search(queries, self.search_k)
+        valid = top_ids >= 0
+        candidates = np.unique(top_ids[valid])
+        cand_scores = queries @ self._candidate_vectors(candidates).T  # (P, U)
+
+        scores = np.full(top_ids.shape, -np.inf, dtype=np.float32)
+        rows, cols = np.nonzero(valid)
+        scores[rows, cols] = cand_scores[rows, np.searchsorted(candidates, top_ids[rows, cols])]
+        order = np.argsort(-scores, axis=1, kind="stable")
+        scores = np.take_along_axis(scores, order, axis=1)
+        ids = np.take_along_axis(top_ids, order, axis=1)
+        return (
+            torch.from_numpy(scores).to(patch_embs.device),
+            torch.from_numpy(ids).to(patch_embs.device),
+        )
+
+    def score_patches(
+        self,
+        image: Image.Image,
+        patch_size: Tuple[int, int] = (64, 64),
+        stride: Optional[Tuple[int, int]] = None
+    ) -> Tuple[Optional[torch.Tensor], Optional[torch.Tensor], Dict[str, int]]:
+        """
+        Embeds the selected patches of `image` once and scores them against the swatches.
+        Returns (scores, ids, {"patches_total", "patches_scored", "patches_skipped"}):
+          - without an approximate index: the dense (patches x swatches)
+            cosine-similarity tensor, columns following `self.swatch_names`, and ids None
+          - with one: sparse (patches x search_k) candidate scores and their
+            swatch indices, see _score()
+        scores is None when no patch was selected or the swatch catalog is empty.
+        With patch_source="dense" the ViT grid replaces `patch_size` / `stride`.
+        """
+        if not self.swatch_names:
+            return None, None, {"patches_total": 0, "patches_scored": 0, "patches_skipped": 0}
+
+        if self.patch_source == "dense":
+            patch_embs, stats = self._dense_patches(image)
+            if patch_embs is None:
+                return None, None, stats
+            return (*self._score(patch_embs), stats)
+
+        corners, total = self._select_patches(image, patch_size, stride)
+        stats = {
+            "patches_total": total,
+            "patches_scored": len(corners),
+            "patches_skipped": total - len(corners),
+        }
+        if not corners:
+            return None, None, stats
+
+        pw, ph = patch_size
+        rgb = image.convert("RGB")
+        if self.patch_preprocessing == "tensor":
+            patch_embs = self._encode_patch_array(np.asarray(rgb), corners, patch_size)
+        else:
+            patches = [rgb.crop((left, top, left + pw, top + ph)) for left, top in corners]
+            patch_embs = self._encode_patches(patches)
+        return (*self._score(patch_embs), stats)
+
+    def _aggregate_sparse(
+        self,
+        scores: torch.Tensor,
+        ids: torch.Tensor,
+        aggregate: str
+    ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """
+        Per-swatch aggregates over (patches x search_k) candidate scores, computed
+        only for the swatches that were retrieved. Returns (swatch indices,
+        aggregates, support).
+        """
+        valid = ids >= 0
+        swatch_ids, inverse = torch.unique(ids[valid], return_inverse=True)
+        # Rows are sorted best first, so column 0 is each patch's best swatch
+        has_best = valid[:, 0]
+        best = torch.searchsorted(swatch_ids, ids[has_best, 0])
+        support = torch.bincount(best, minlength=len(swatch_ids))
+
+        if aggregate == "max":
+            agg = torch.full((len(swatch_ids),), float("-inf"), dtype=scores.dtype, device=scores.device)
+            agg.scatter_reduce_(0, inverse, scores[valid], reduce="amax")
+        else:  # vote
+            agg = support.to(scores.dtype) / len(ids)
+        return swatch_ids, agg, support
+
+    def aggregate_topk(
+        self,
+        scores: torch.Tensor,
+        k: int = 5,
+        aggregate: str = "max",
+        trim: float = 0.1,
+        ids: Optional[torch.Tensor] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Ranks swatches from a dense (patches x swatches) score tensor, or from
+        sparse (patches x search_k) candidate `scores` and their swatch `ids`
+        as returned by score_patches() with an approximate index.
+
+        aggregate:
+          - "max": best patch score per swatch
+          - "mean": mean patch score per swatch
+          - "vote": fraction of patches whose best swatch it is
+          - "trimmed_mean": mean after dropping the `trim` fraction of lowest
+                            and highest patch scores per swatch
+        "mean" and "trimmed_mean" need every (patch, swatch) score, so they
+        raise ValueError for sparse scores. Swatches that no patch retrieved
+        are not ranked.
+        Returns up to k dicts {"name", "score", "support"}, best first, where
+        `support` is the number of patches that voted for the swatch.
+        """
+        if aggregate not in ("max", "mean", "vote", "trimmed_mean"):
+            raise ValueError(
+                f"Unknown aggregate '{aggregate}'. Must be 'max', 'mean', 'vote' or 'trimmed_mean'."
+            )
+        if ids is not None:
+            if aggregate in ("mean", "trimmed_mean"):
+                raise ValueError(
+                    f"aggregate '{aggregate}' needs exact scores for every swatch; "
+                    f"with an approximate vector_index use 'max' or 'vote'."
+                )
+            swatch_ids, agg, support = self._aggregate_sparse(scores, ids, aggregate)
+            top_scores, top_idx = agg.topk(min(k, len(swatch_ids)))
+            return [
+                {
+                    "name": self.swatch_names[int(swatch_ids[i])],
+                    "score": score,
+                    "support": int(support[i]),
+                }
+                for score, i in zip(top_scores.tolist(), top_idx.tolist())
+            ]
+
+        n_patches, n_swatches = scores.shape
+        support = torch.bincount(scores.argmax(dim=1), minlength=n_swatches)
+
+        if aggregate == "max":
+            agg = scores.max(dim=0).values
+        elif aggregate == "mean":
+            agg = scores.mean(dim=0)
+        elif aggregate == "vote":
+            agg = support.to(scores.dtype) / n_patches
+        else:
+            cut = int(n_patches * trim)
+            if n_patches - 2 * cut <= 0:
+                cut = 0
+            ordered = scores.sort(dim=0).values
+            agg = ordered[cut:n_patches - cut].mean(dim=0)
+
+        top_scores, top_idx = agg.topk(min(k, n_swatches))
+        return [
+            {
+                "name": self.swatch_names[i],
+                "score": score,
+                "support": int(support[i]),
+            }
+            for score, i in zip(top_scores.tolist(), top_idx.tolist())
+        ]
+
+    def match_topk(
+        self,
+        image: Image.Image,
+        k: int = 5,
+        aggregate: str = "max",
+        patch_size: Tuple[int, int] = (64, 64),
+        stride: Optional[Tuple[int, int]] = None
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+        """
+        Ranked shortlist of the k best swatches for `image` (see aggregate_topk()),
+        computed from a single embedding pass. The threshold is not applied.
+        Returns the ranking and the patch statistics.
+        """
+        scores, ids, stats = self.score_patches(image, patch_size, stride)
+        if scores is None:
+            return [], stats
+        return self.aggregate_topk(scores, k=k, aggregate=aggregate, ids=ids), stats
+
+    def match_with_stats(
+        self,
+        image: Image.Image,
+        patch_size: Tuple[int, int] = (64, 64),
+        stride: Optional[Tuple[int, int]] = None
+    ) -> Tuple[str, float, Dict[str, int]]:
+        """
+        Same as match(), additionally returning
+        {"patches_total", "patches_scored", "patches_skipped"}.
+        """
+        scores, ids, stats = self.score_patches(image, patch_size, stride)
+        if scores is None:
+            return "NO_MATCH", -1.0, stats
+
+        # argmax returns the first maximum in row-major order, i.e. the same
+        # (patch, swatch) pair the previous nested loop with `>` would keep.
+        flat_idx = int(torch.argmax(scores))
+        best_score = scores.reshape(-1)[flat_idx].item()
+        if ids is None:
+            best_name = self.swatch_names[flat_idx % len(self.swatch_names)]
+        else:
+            best_id = int(ids.reshape(-1)[flat_idx])
+            if best_id < 0:
+                # No patch retrieved any candidate
+                return "NO_MATCH", -1.0, stats
+            best_name = self.swatch_names[best_id]
+
+        if best_score < self.threshold:
+            return "NO_MATCH", best_score, stats
+        return best_name, best_score, stats
 
     def match(
         self,
@@ -31,25 +454,5 @@ class PatchMatcher(BaseComponent):
         Returns the best‐matching swatch name and its score.
         If best score < threshold, returns ("NO_MATCH", best_score).
         """
-        w, h = image.size
-        pw, ph = patch_size
-        sx, sy = stride if stride is not None else (pw, ph)
-
-        best_name = "NO_MATCH"
-        best_score = -1.0
-
-        for top in range(0, h - ph + 1, sy):
-            for left in range(0, w - pw + 1, sx):
-                patch = image.crop((left, top, left + pw, top + ph))
-                emb = self.embedder.encode_image(patch)
-                for sw in self.swatches:
-                    score = torch.nn.functional.cosine_similarity(
-                        emb, sw["embedding"], dim=-1
-                    ).item()
-                    if score > best_score:
-                        best_score = score
-                        best_name = sw["name"]
-
-        if best_score < self.threshold:
-            return "NO_MATCH", best_score
-        return best_name, best_score
\ No newline at end of file
+        best_name, best_score, _ = self.match_with_stats(image, patch_size, stride)
+        return best_name, best_score
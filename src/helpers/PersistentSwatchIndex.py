@@ -0,0 +1,138 @@
+import os
+import json
+from abc import abstractmethod
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from common import BaseComponent, ContentHash
+
+
+class PersistentSwatchIndex(BaseComponent):
+    """
+    On-disk cache of swatch embeddings, shared by SwatchEmbeddingIndex and
+    MultiVectorSwatchIndex. An index lives in `index_dir` as the arrays named
+    in DATA_FILES plus manifest.json holding the embedder key, preprocessing
+    version and, per swatch, its file name, content hash and row.
+
+    sync() hashes the swatch files, reuses the stored embeddings of unchanged
+    files, encodes only new or changed ones and rewrites the index whenever it
+    is stale. Subclasses implement:
+      - _encode_files(files) -> one embedding array per file
+      - _read_rows(rows) -> the stored embeddings at those manifest rows
+      - _pack(embeddings) -> {file name in DATA_FILES: array}
+    """
+    # Bump whenever the way swatch files are turned into embedder input changes.
+    PREPROCESS_VERSION = 1
+    SWATCH_SUFFIXES = {".jpg", ".jpeg", ".png"}
+    MANIFEST_FILE = "manifest.json"
+    DATA_FILES: Tuple[str, ...] = ()
+
+    def __init__(self, index_dir: str, embedder: Any, batch_size: int):
+        """
+        index_dir: directory holding the manifest and the DATA_FILES arrays
+        embedder: model used to (re)encode swatches
+        batch_size: number of swatches embedded per forward pass on (re)build
+        """
+        super().__init__()
+        self.index_dir = Path(index_dir)
+        self.embedder = embedder
+        self.batch_size = batch_size
+        self.embedder_key = f"{embedder.__class__.__name__}:{getattr(embedder, 'model_name', '')}"
+
+    @abstractmethod
+    def _encode_files(self, files: List[Path]) -> List[np.ndarray]:
+        raise NotImplementedError("Subclasses must implement _encode_files()")
+
+    @abstractmethod
+    def _read_rows(self, rows: List[int]) -> List[np.ndarray]:
+        raise NotImplementedError("Subclasses must implement _read_rows()")
+
+    @abstractmethod
+    def _pack(self, embeddings: List[np.ndarray]) -> Dict[str, np.ndarray]:
+        raise NotImplementedError("Subclasses must implement _pack()")
+
+    def _list_swatches(self, swatch_path: str) -> List[Path]:
+        swatch_dir = Path(swatch_path)
+        if not swatch_dir.is_dir():
+            raise ValueError(f"swatch_path must be a directory, got: {swatch_path}")
+        files = [
+            f for f in sorted(swatch_dir.iterdir())
+            if f.suffix.lower() in self.SWATCH_SUFFIXES
+        ]
+        if not files:
+            raise ValueError(f"No valid swatch images found in {swatch_path}")
+        return files
+
+    def _read_manifest(self) -> Optional[Dict[str, Any]]:
+        """
+        Returns the stored manifest, or None if the index is missing or was
+        built with a different embedder / preprocessing version.
+        """
+        for name in (self.MANIFEST_FILE, *self.DATA_FILES):
+            if not (self.index_dir / name).is_file():
+                return None
+        with open(self.index_dir / self.MANIFEST_FILE, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("embedder") != self.embedder_key:
+            self.logger.info(f"Index built for {manifest.get('embedder')!r}, need {self.embedder_key!r}; rebuilding")
+            return None
+        if manifest.get("preprocess_version") != self.PREPROCESS_VERSION:
+            self.logger.info("Index preprocessing version changed; rebuilding")
+            return None
+        if any("row" not in entry for entry in manifest.get("entries", [])):
+            self.logger.info("Index manifest format changed; rebuilding")
+            return None
+        return manifest
+
+    def _save(self, names: List[str], hashes: Dict[str, str], arrays: Dict[str, np.ndarray], dim: int):
+        """Writes the arrays, then the manifest, atomically so readers never see a half-written index."""
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        for file_name, array in arrays.items():
+            tmp = self.index_dir / f"{file_name}.tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp, self.index_dir / file_name)
+
+        manifest = {
+            "embedder": self.embedder_key,
+            "preprocess_version": self.PREPROCESS_VERSION,
+            "dim": int(dim),
+            "entries": [
+                {"name": name, "sha256": hashes[name], "row": row}
+                for row, name in enumerate(names)
+            ],
+        }
+        manifest_tmp = self.index_dir / f"{self.MANIFEST_FILE}.tmp"
+        with open(manifest_tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(manifest_tmp, self.index_dir / self.MANIFEST_FILE)
+
+    def sync(self, swatch_path: str) -> Tuple[List[str], List[np.ndarray]]:
+        """
+        Brings the index in line with the swatch files in `swatch_path`.
+        Returns (names, embeddings) in sorted file order.
+        """
+        files = self._list_swatches(swatch_path)
+        hashes = {f.name: ContentHash.file_sha256(f) for f in files}
+
+        # Reuse rows whose content hash is unchanged
+        cached: Dict[str, np.ndarray] = {}
+        manifest = self._read_manifest()
+        if manifest is not None:
+            reusable = [e for e in manifest["entries"] if hashes.get(e["name"]) == e["sha256"]]
+            rows = self._read_rows([e["row"] for e in reusable])
+            cached = {e["name"]: row for e, row in zip(reusable, rows)}
+
+        missing = [f for f in files if f.name not in cached]
+        if missing:
+            self.logger.info(f"Encoding {len(missing)} new or changed swatches")
+            for f, emb in zip(missing, self._encode_files(missing)):
+                cached[f.name] = emb
+
+        names = [f.name for f in files]
+        embeddings = [cached[name] for name in names]
+        stale = manifest is None or [e["name"] for e in manifest["entries"]] != names
+        if missing or stale:
+            self._save(names, hashes, self._pack(embeddings), dim=embeddings[0].shape[-1])
+        self.logger.info(f"Swatch index: {len(files) - len(missing)} cached, {len(missing)} encoded")
+        return names, embeddings
@@ -0,0 +1,59 @@
+import numpy as np
+from common import BaseComponent
+from src.helpers.VectorIndex import VectorIndex
+
+
+class ProductQuantizer(BaseComponent):
+    """
+    Product quantiser: splits D-dim vectors into `m` sub-vectors and replaces
+    each by the index of its nearest centroid in a per-subspace codebook of
+    2**nbits entries. A float32 vector of D dims shrinks to m bytes.
+    Inner products with a query are estimated from per-query lookup tables
+    (asymmetric distance computation).
+    """
+
+    def __init__(self, m: int = 16, nbits: int = 8, kmeans_iters: int = 10, seed: int = 0):
+        if not 1 <= nbits <= 8:
+            raise ValueError(f"Invalid nbits: {nbits}. Must be between 1 and 8.")
+        super().__init__()
+        self.m = m
+        self.ksub = 2 ** nbits
+        self.kmeans_iters = kmeans_iters
+        self.seed = seed
+        self.codebooks = None  # (m, ksub, dsub)
+
+    def train(self, x: np.ndarray) -> "ProductQuantizer":
+        n, dim = x.shape
+        if dim % self.m:
+            raise ValueError(f"Dimension {dim} is not divisible by pq_m={self.m}")
+        dsub = dim // self.m
+        self.codebooks = np.zeros((self.m, min(self.ksub, n), dsub), dtype=np.float32)
+        for j in range(self.m):
+            self.codebooks[j], _ = VectorIndex.kmeans(
+                x[:, j * dsub:(j + 1) * dsub], self.ksub, iters=self.kmeans_iters, seed=self.seed + j
+            )
+        return self
+
+    def _split(self, x: np.ndarray) -> np.ndarray:
+        return np.asarray(x, dtype=np.float32).reshape(len(x), self.m, -1)
+
+    def encode(self, x: np.ndarray) -> np.ndarray:
+        """(N, D) float vectors -> (N, m) uint8 codes."""
+        sub = self._split(x)
+        codes = np.empty((len(x), self.m), dtype=np.uint8)
+        c_norms = (self.codebooks ** 2).sum(axis=2)
+        for j in range(self.m):
+            codes[:, j] = np.argmin(c_norms[j] - 2.0 * sub[:, j] @ self.codebooks[j].T, axis=1)
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        """(N, m) codes -> (N, D) reconstructed vectors."""
+        return self.codebooks[np.arange(self.m), codes.astype(np.int64)].reshape(len(codes), -1)
+
+    def lookup_tables(self, queries: np.ndarray) -> np.ndarray:
+        """(Q, m, ksub) inner products of each query sub-vector with each centroid."""
+        return np.einsum("qmd,mkd->qmk", self._split(queries), self.codebooks)
+
+    def inner_products(self, table: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """Estimated inner products of one query (its (m, ksub) table) with coded vectors."""
+        return table[np.arange(self.m), codes.astype(np.int64)].sum(axis=1)
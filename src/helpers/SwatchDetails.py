@@ -5,9 +5,12 @@ from PIL import Image
 from collections import defaultdict
 from common.BaseComponent import BaseComponent
 from config.loader import settings
+from common.ContentHash import ContentHash
 
 class SwatchDetails(BaseComponent, dict):
     _instance = None
+    # Bump whenever the labelling prompts change so stored labels are redone
+    PROMPT_VERSION = 1
 
     def __new__(cls, *args, **kwargs):
         if cls._instance is None:
@@ -18,7 +21,15 @@ class SwatchDetails(BaseComponent, dict):
         if not hasattr(self, '_initialized'):
             super().__init__()
             super(dict, self).__init__()
-            self.save_path = settings['swatch_details']['args']['save_path']
+            details_args = settings['swatch_details']['args']
+            self.save_path = details_args['save_path']
+            self.label_batch_size = details_args.get('label_batch_size', 8)
+            # Swatches are flat colour patches: small thumbnails keep labelling cheap
+            self.vision_kwargs = {
+                key: details_args[key]
+                for key in ("image_size", "resample")
+                if details_args.get(key) is not None
+            }
             self.swatches_path = swatches_path
             self.vlm_model = vlm_model
             self._process_swatches()
@@ -40,65 +51,139 @@ class SwatchDetails(BaseComponent, dict):
             return "light "
         return ""
 
-    def _process_swatches(self):
-        if os.path.exists(self.save_path):
-            self.load_color_mappings(self.save_path)
-            return
+    def _label_prompt(self, image: Image.Image) -> str:
+        prefix = self._brightness_prefix(image)
+        return (
+            f"{prefix}"
+            "Analyze this hair-color swatch image and reply with exactly one concise hair color name "
+            "in lowercase (e.g. \"medium ash brown\"). Do not include numbers, punctuation, adjectives "
+            "beyond pure color descriptors, or any additional commentary—only the color name."
+        )
+
+    def _manifest_path(self) -> str:
+        return f"{os.path.splitext(self.save_path)[0]}.manifest.json"
+
+    def _manifest_key(self) -> dict:
+        """Everything besides the swatch files that determines the labels."""
+        return {
+            "model": f"{self.vlm_model.__class__.__name__}:{getattr(self.vlm_model, 'model_name', '')}",
+            "prompt_version": self.PROMPT_VERSION,
+            "vision": self.vision_kwargs,
+        }
+
+    def _load_reusable_labels(self, hashes: dict) -> dict:
+        """
+        Labels from a previous run whose swatch file is unchanged and that were
+        produced with the same model, prompts and vision settings.
+        """
+        manifest_path = self._manifest_path()
+        if not (os.path.exists(self.save_path) and os.path.exists(manifest_path)):
+            return {}
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get("key") != self._manifest_key():
+            self.logger.info("Swatch labelling model or prompts changed; relabelling all swatches")
+            return {}
+        self.load_color_mappings(self.save_path)
+        stored_hashes = manifest.get("files", {})
+        return {
+            name: desc for name, desc in self.items()
+            if name in hashes and stored_hashes.get(name) == hashes[name]
+        }
 
-    # 1) Gather all swatch file‐paths
-        paths = [
-            os.path.join(self.swatches_path, f)
-            for f in os.listdir(self.swatches_path)
+    def _label_images(self, names: list) -> dict:
+        """Coarse single-image labels for `names`, `label_batch_size` images per VLM call."""
+        labels = {}
+        for start in range(0, len(names), self.label_batch_size):
+            chunk = names[start:start + self.label_batch_size]
+            images = [
+                self._resize_image(Image.open(os.path.join(self.swatches_path, n)).convert("RGB"))
+                for n in chunk
+            ]
+            prompts = [self._label_prompt(img) for img in images]
+            if hasattr(self.vlm_model, "infer_batch"):
+                descs = self.vlm_model.infer_batch(images, prompts, **self.vision_kwargs)
+            else:
+                descs = [
+                    self.vlm_model.infer(image_data=img, prompt=prompt, **self.vision_kwargs)
+                    for img, prompt in zip(images, prompts)
+                ]
+            for name, desc in zip(chunk, descs):
+                labels[name] = desc.strip()
+            self.logger.info(f"Labelled {len(labels)}/{len(names)} swatches")
+        return labels
+
+    def _process_swatches(self):
+        # 1) Gather all swatch files and their content hashes
+        names = sorted(
+            f for f in os.listdir(self.swatches_path)
             if f.lower().endswith(('.png', '.jpg', '.jpeg'))
-        ]
+        )
+        hashes = {
+            n: ContentHash.file_sha256(os.path.join(self.swatches_path, n))
+            for n in names
+        }
 
-        # 2) First pass: single‐image inference to get a coarse label
+        # 2) Reuse labels of unchanged swatches; only new/changed ones hit the VLM
+        reusable = self._load_reusable_labels(hashes)
+        to_label = [n for n in names if n not in reusable]
+        removed = len(self) - len(reusable)
         self.clear()
-        initial_map = {}
-        for path in paths:
-            img = Image.open(path).convert("RGB")
-            img = self._resize_image(img)
-            prefix = self._brightness_prefix(img)
-            prompt = (
-                f"{prefix}"
-                "Analyze this hair-color swatch image and reply with exactly one concise hair color name "
-                "in lowercase (e.g. \"medium ash brown\"). Do not include numbers, punctuation, adjectives "
-                "beyond pure color descriptors, or any additional commentary—only the color name."
-            )
-            desc = self.vlm_model.infer(image_data=img, prompt=prompt).strip()
-            name = os.path.basename(path)
-            initial_map[name] = desc
+        self.update(reusable)
+        if not to_label:
+            if removed:
+                self._save(hashes)
+            return
 
+        self.logger.info(f"{len(reusable)} swatch labels reused, {len(to_label)} to label")
+
+        # 3) First pass: single‐image inference to get a coarse label
+        initial_map = self._label_images(to_label)
         self.update(initial_map)
 
-        # 3) Group by initial description and refine duplicates
+        # 4) Group by description and refine duplicates that involve a new swatch.
+        #    Reused swatches are shown for context but keep their labels, so adding
+        #    a swatch never renames existing catalog entries.
         
         groups = defaultdict(list)
-        for name, desc in initial_map.items():
-            groups[desc].append(name)
+        for name in names:
+            groups[self[name]].append(name)
 
-        for desc, names in groups.items():
-            if len(names) > 1:
+        for desc, group in groups.items():
+            if len(group) > 1 and any(n in initial_map for n in group):
                 
-                swatch_paths = [self._resize_image(Image.open(os.path.join(self.swatches_path, n))).convert("RGB") for n in names]
+                swatch_paths = [self._resize_image(Image.open(os.path.join(self.swatches_path, n))).convert("RGB") for n in group]
                 prompt = (
-                    f"You have {len(names)} hair-color swatch images all initially labeled “{desc}.” "
+                    f"You have {len(group)} hair-color swatch images all initially labeled “{desc}.” "
                     "Return a valid JSON array of exactly "
-                    f"{len(names)} refined hair color names in lowercase, in the same order. "
+                    f"{len(group)} refined hair color names in lowercase, in the same order. "
                     "Each entry must be a single, pure color name (e.g. \"light auburn\"), "
                     "with no punctuation, numbers, or commentary."
                 )
                 try:
-                    raw = self.vlm_model.infer_multi_image(swatch_paths, prompt)
+                    raw = self.vlm_model.infer_multi_image(swatch_paths, prompt, **self.vision_kwargs)
                     refined = json.loads(raw)
-                    if isinstance(refined, list) and len(refined) == len(names):
-                        for n, new_desc in zip(names, refined):
-                            self[n] = new_desc.strip()
-                except Exception:
-                    pass
+                except Exception as e:
+                    self.logger.warning(f"Could not refine swatches labelled {desc!r} {group}: {e}")
+                    continue
+                if not (isinstance(refined, list) and len(refined) == len(group)):
+                    self.logger.warning(f"Ignoring refinement of swatches labelled {desc!r}: expected {len(group)} names, got {raw!r}")
+                    continue
+                for n, new_desc in zip(group, refined):
+                    if n in initial_map:
+                        self[n] = str(new_desc).strip()
+
+        self._save(hashes)
 
+    def _save(self, hashes: dict):
+        """Persist the labels together with the manifest they were produced under."""
         self.save_color_mappings(self.save_path)
+        with open(self._manifest_path(), 'w', encoding='utf-8') as f:
+            json.dump({"key": self._manifest_key(), "files": hashes}, f, indent=2)
 
+    def get_image_name(self, color_name: str):
+        """Return the first swatch file name labelled `color_name`, or None."""
+        return next((k for k, v in self.items() if v == color_name), None)
 
     def save_color_mappings(self, output_path: str):
             """Save the color mappings to a JSON file."""
@@ -0,0 +1,65 @@
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+import numpy as np
+import torch
+from PIL import Image
+from src.helpers.PersistentSwatchIndex import PersistentSwatchIndex
+
+
+class SwatchEmbeddingIndex(PersistentSwatchIndex):
+    """
+    Persistent swatch embedding index stored in `index_dir` as:
+      - embeddings.npy: (N, D) float32 matrix, one row per swatch
+      - manifest.json: embedder key, preprocessing version and, per swatch,
+                       its file name, content hash and row in the matrix
+
+    load() memory-maps the matrix and only re-encodes swatches that were added
+    or whose content changed; the index is rewritten whenever it is stale.
+    """
+    EMBEDDINGS_FILE = "embeddings.npy"
+    DATA_FILES = (EMBEDDINGS_FILE,)
+
+    def __init__(self, index_dir: str, embedder: Any, batch_size: int = 32):
+        """
+        index_dir: directory holding the manifest and embedding matrix
+        embedder: instance providing encode_image(Image) -> Tensor
+                  (and optionally encode_images(List[Image], batch_size) -> Tensor)
+        batch_size: number of swatches embedded per forward pass on (re)build
+        """
+        super().__init__(index_dir, embedder, batch_size)
+
+    def _encode_files(self, files: List[Path]) -> List[np.ndarray]:
+        images = [Image.open(f).convert("RGB") for f in files]
+        if hasattr(self.embedder, "encode_images"):
+            embs = self.embedder.encode_images(images, batch_size=self.batch_size)
+        else:
+            embs = torch.cat([self.embedder.encode_image(img).reshape(1, -1) for img in images], dim=0)
+        return list(embs.float().cpu().numpy())
+
+    def _read_rows(self, rows: List[int]) -> List[np.ndarray]:
+        # Copy-on-write mmap keeps the matrix off the heap while still yielding writable tensors
+        stored = np.load(self.index_dir / self.EMBEDDINGS_FILE, mmap_mode="c")
+        return [stored[row] for row in rows]
+
+    def _pack(self, embeddings: List[np.ndarray]) -> Dict[str, np.ndarray]:
+        return {self.EMBEDDINGS_FILE: np.stack(embeddings).astype(np.float32)}
+
+    def load(self, swatch_path: str) -> List[Dict[str, Any]]:
+        """
+        Syncs the index with the swatch files in `swatch_path` and returns
+        [{"name": str, "embedding": Tensor (1, D)}, ...] in sorted file order.
+        """
+        names, embeddings = self.sync(swatch_path)
+        device = getattr(self.embedder, "device", "cpu")
+        return [
+            {"name": name, "embedding": torch.from_numpy(emb).reshape(1, -1).to(device)}
+            for name, emb in zip(names, embeddings)
+        ]
+
+    def load_matrix(self, swatch_path: str) -> Tuple[List[str], np.ndarray]:
+        """
+        Syncs the index like load(), but returns (names, read-only memory-mapped
+        (N, D) matrix) so that the embeddings stay on disk until rows are read.
+        """
+        names, _ = self.sync(swatch_path)
+        return names, np.load(self.index_dir / self.EMBEDDINGS_FILE, mmap_mode="r")
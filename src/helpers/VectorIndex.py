@@ -0,0 +1,85 @@
+from abc import abstractmethod
+from typing import Tuple
+import numpy as np
+from common import BaseComponent
+
+
+class VectorIndex(BaseComponent):
+    """
+    Inner-product search over a fixed set of (unit-norm) reference vectors,
+    implemented with NumPy only.
+
+    Subclasses implement:
+      - build(vectors (N, D)) -> self
+      - search(queries (Q, D), k) -> (scores (Q, k), ids (Q, k)), best first;
+        slots without a candidate hold score -inf and id -1
+      - reconstruct(ids (n,)) -> (n, D) stored vectors of those ids
+    """
+    # Exact indexes return every reference's score, so callers may take the dense path
+    exact = False
+    # Compressed indexes store (and reconstruct) lossy approximations of the references
+    compressed = False
+
+    def __init__(self):
+        super().__init__()
+        self.ntotal = 0
+        self.dim = 0
+
+    @abstractmethod
+    def build(self, vectors: np.ndarray) -> "VectorIndex":
+        raise NotImplementedError("Subclasses must implement build()")
+
+    @abstractmethod
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        raise NotImplementedError("Subclasses must implement search()")
+
+    @abstractmethod
+    def reconstruct(self, ids: np.ndarray) -> np.ndarray:
+        raise NotImplementedError("Subclasses must implement reconstruct()")
+
+    @abstractmethod
+    def memory_bytes(self) -> int:
+        """Bytes held by the stored (possibly compressed) reference data."""
+        raise NotImplementedError("Subclasses must implement memory_bytes()")
+
+    @staticmethod
+    def _topk(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Row-wise top-k of a (Q, C) score matrix: (scores, column indices), best first."""
+        k = min(k, scores.shape[1])
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        part_scores = np.take_along_axis(scores, part, axis=1)
+        order = np.argsort(-part_scores, axis=1, kind="stable")
+        return np.take_along_axis(part_scores, order, axis=1), np.take_along_axis(part, order, axis=1)
+
+    @staticmethod
+    def kmeans(
+        x: np.ndarray,
+        k: int,
+        iters: int = 10,
+        seed: int = 0,
+        chunk: int = 8192
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Lloyd's k-means with squared L2 distance. Returns (centroids (k, D),
+        assignment (N,)). Empty clusters are re-seeded from random points.
+        """
+        rng = np.random.default_rng(seed)
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        k = min(k, len(x))
+        centroids = x[rng.choice(len(x), k, replace=False)].copy()
+        assign = np.zeros(len(x), dtype=np.int64)
+        for _ in range(iters):
+            # ||x - c||^2 = ||x||^2 - 2 x.c + ||c||^2; ||x||^2 does not change the argmin
+            c_norms = (centroids ** 2).sum(axis=1)
+            for start in range(0, len(x), chunk):
+                block = x[start:start + chunk]
+                assign[start:start + chunk] = np.argmin(c_norms - 2.0 * block @ centroids.T, axis=1)
+            # Per-cluster sums as one segmented reduction over points sorted by cluster
+            counts = np.bincount(assign, minlength=k)
+            empty = counts == 0
+            starts = (np.cumsum(counts) - counts)[~empty]
+            sums = np.add.reduceat(x[np.argsort(assign, kind="stable")], starts, axis=0)
+            centroids[~empty] = sums / counts[~empty, None]
+            if empty.any():
+                centroids[empty] = x[rng.choice(len(x), int(empty.sum()), replace=False)]
+        return centroids, assign
@@ -1,2 +1,17 @@
-from src.helpers.SwatchDetails import SwatchDetails
-from src.helpers.HairSwatchMatcherCV import HairSwatchMatcherCV
+from common.LazyModule import lazy_exports
+
+lazy_exports(__name__, {
+    "SwatchDetails": "src.helpers.SwatchDetails",
+    "HairSwatchMatcherCV": "src.helpers.HairSwatchMatcherCV",
+    "PersistentSwatchIndex": "src.helpers.PersistentSwatchIndex",
+    "SwatchEmbeddingIndex": "src.helpers.SwatchEmbeddingIndex",
+    "MicroBatchEmbedder": "src.helpers.MicroBatchEmbedder",
+    "MultiVectorSwatchIndex": "src.helpers.MultiVectorSwatchIndex",
+    "VectorIndex": "src.helpers.VectorIndex",
+    "ExactVectorIndex": "src.helpers.ExactVectorIndex",
+    "IVFVectorIndex": "src.helpers.IVFVectorIndex",
+    "ProductQuantizer": "src.helpers.ProductQuantizer",
+    "ColorDifference": "src.helpers.ColorDifference",
+    "LabSwatchIndex": "src.helpers.LabSwatchIndex",
+    "PaletteExtractor": "src.helpers.PaletteExtractor",
+})